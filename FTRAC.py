@@ -3,6 +3,9 @@ import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from disturbance import Disturbance
+from laws import make_law, make_controller
+from profiling import PROFILER
 
 def darken_color(color, amount=0.6):
     """
@@ -58,13 +61,9 @@ for node, props in NODES.items():
     for neighbor in props['neighbors']:
         G.add_edge(node, neighbor)
 
-print("Graph nodes:", G.nodes)
-print("Graph edges:", G.edges)
-
 ## Laplacian matrix: 
 L = nx.linalg.directed_laplacian_matrix(G)
 L = np.array(L)
-print("Laplacian Matrix:\n", L) 
 use_laplacian = False
 
 #% >>> System parameters: 
@@ -82,6 +81,13 @@ freeze_threshold_off  = 0.010   # error-threshold to freeze gain evolution ("ε"
 freeze_threshold_on   = 0.050   # error-threshold to re-activate gain evolution ("ε̄" in paper)
 active                = np.zeros(n_agents)  # Initially, all agents are inactive
 
+## Disturbance: bounded known input
+alpha   = 1.5
+beta    = 0.5
+kappa   = 1.0
+# nu = U(-alpha, alpha) + beta + kappa * sin(2*pi*10*(t - phi)), phi ~ U(0, 1), generated on demand
+nu = Disturbance(n_agents, dt, seed=42, amplitude=2*alpha, offset=0.5, beta=beta, A=kappa, frequency=10)
+
 params = {
     "dt":            dt,
     "omega":         omega,
@@ -93,15 +99,10 @@ params = {
     "epsilon_on":    freeze_threshold_on,
     "active":        active,
     "nodes":         NODES,
+    "laplacian":     L,
+    "disturbance":   nu,
 }
 
-## Disturbance: bounded known input
-alpha   = 1.5
-beta    = 0.5
-kappa   = 1.0
-phi     = np.random.uniform(0, 1, (n_agents, n_points)) 
-nu = np.random.uniform(-alpha, alpha, (n_agents, n_points)) + beta + kappa * np.sin(2*np.pi*10*(time - phi))  
-
 ## Initial conditions:
 init_conditions = {
     "x": np.array([NODES[i+1]['x0'] for i in range(n_agents)]),
@@ -292,60 +293,83 @@ def vi(i, z, neighbors):
     diffs = z[i] - z[neighbors]
     return -np.sum(np.sign(diffs) * np.sqrt(np.abs(diffs)))
 
-def dynamics(t, y, n_agents, nu, mv, dvth, params): 
-    dydt = np.zeros_like(y)
-
-    x = y[:n_agents]
-    z = y[n_agents:2*n_agents]
-    vtheta = y[2*n_agents:3*n_agents]
-
-    v = np.zeros(n_agents)
-    if params["use_laplacian"]:
-        v = -L @ z
-    else:
-        for i in range(n_agents):
-            neighbors = params["nodes"][i+1]['neighbors']
-            neighbors_index = [n-1 for n in neighbors]  # Convert to 0-based index
-            v[i] = vi(i, z, neighbors_index)
-    g = v + params["omega"]
-    dzdt = g
-
-    sigma = x - z
-    grad = np.sign(sigma)
-
-    dvtheta = np.zeros(n_agents)
-    for i in range(n_agents):
-        if params["active"][i] == 0: 
-            if np.abs(sigma[i]) > params["epsilon_on"]:
-                params["active"][i] = 1
-                dvtheta[i] = params["eta"] * 1.0
-            else: 
-                dvtheta[i] = 0.0
-
-        else:
-            if np.abs(sigma[i]) <= params["epsilon_off"]:
-                params["active"][i] = 0
-                dvtheta[i] = 0.0
-            else:
-                dvtheta[i] = params["eta"] * 1.0
-    
-    dvthdt = dvtheta
-    u = g - vtheta * grad
-
-    k = int(t / params["dt"])
-    if k < params["n_points"]:
-        dvth[:,k] = dvthdt
-        mv[:,k] = u
-
-    dxdt = params["omega"] + u + nu
-
-    dydt[:n_agents] = dxdt
-    dydt[n_agents:2*n_agents] = dzdt
-    dydt[2*n_agents:3*n_agents] = dvthdt
-
-    return dydt
-
+class DynamicsRHS:
+    """
+    Right-hand side of the FTRAC dynamics writing dy/dt into a caller-provided array, with
+    preallocated work buffers (no array allocation per evaluation). Same equations as dynamics
+    (consensus input from z at every evaluation, plus omega) or, with sampled=True, as dyn2sample
+    (consensus input held between samples, set with hold_input()).
+    Hysteresis flags live in params["active"]; u and dvtheta are recorded at column int(t/dt)
+    of mv / dvth (if given) while it is below `record_points`.
+    """
+    def __init__(self, params, law, sampled=False, mv=None, dvth=None, record_points=None):
+        n_agents = params["n_agents"]
+        self.n_agents = n_agents
+        self.params = params
+        self.law = law
+        self.omega = 0.0 if sampled else params["omega"]
+        self.sampled = sampled
+        self.mv = mv
+        self.dvth = dvth
+        self.record_points = params["n_points"] if record_points is None else record_points
+        self.v = np.zeros(n_agents)
+        self.sigma = np.empty(n_agents)
+        self.grad = np.empty(n_agents)
+        self.u = np.empty(n_agents)
+        self.abs_sigma = np.empty(n_agents)
+        self.above_on = np.empty(n_agents, dtype=bool)
+        self.above_off = np.empty(n_agents, dtype=bool)
+        self.active = np.empty(n_agents, dtype=bool)
+
+    def hold_input(self, z):
+        with PROFILER.phase("consensus"):
+            self.law.into(z, self.v)
+        return self.v
+
+    @PROFILER.timed("rhs")
+    def __call__(self, t, y, out, nu):
+        PROFILER.count("rhs_evaluations")
+        n = self.n_agents
+        params = self.params
+        x, z, vtheta = y[:n], y[n:2*n], y[2*n:3*n]
+        dxdt, dzdt, dvthdt = out[:n], out[n:2*n], out[2*n:3*n]
+
+        if not self.sampled:
+            with PROFILER.phase("consensus"):
+                self.law.into(z, self.v)
+        np.add(self.v, self.omega, out=dzdt)                  # g: consensus law
+
+        np.subtract(x, z, out=self.sigma)
+        np.sign(self.sigma, out=self.grad)
+
+        with PROFILER.phase("hysteresis"):
+            np.abs(self.sigma, out=self.abs_sigma)
+            np.greater(self.abs_sigma, params["epsilon_on"], out=self.above_on)
+            np.greater(self.abs_sigma, params["epsilon_off"], out=self.above_off)
+            np.not_equal(params["active"], 0, out=self.active)
+            np.copyto(self.above_on, self.above_off, where=self.active)
+            if PROFILER.enabled:
+                PROFILER.count("switching_events", int(np.count_nonzero(self.above_on != self.active)))
+            np.copyto(params["active"], self.above_on)
+            np.multiply(params["active"], params["eta"] * 1.0, out=dvthdt)
+
+        np.multiply(vtheta, self.grad, out=self.u)
+        np.subtract(dzdt, self.u, out=self.u)                 # u = g - vtheta * grad
+
+        k = int(t / params["dt"])
+        if k < self.record_points:
+            if self.dvth is not None:
+                self.dvth[:, k] = dvthdt
+            if self.mv is not None:
+                self.mv[:, k] = self.u
+
+        np.add(self.u, self.omega, out=dxdt)
+        np.add(dxdt, nu, out=dxdt)
+        return out
+
+@PROFILER.timed("rhs")
 def dyn2sample(t, y, g, nu, n_agents, dvth, params, sample_points): 
+    PROFILER.count("rhs_evaluations")
     dydt = np.zeros_like(y)
 
     x = y[:n_agents]
@@ -356,20 +380,23 @@ def dyn2sample(t, y, g, nu, n_agents, dvth, params, sample_points):
     grad = np.sign(sigma)
 
     dvtheta = np.zeros(n_agents)
-    for i in range(n_agents):
-        if params["active"][i] == 0: 
-            if np.abs(sigma[i]) > params["epsilon_on"]:
-                params["active"][i] = 1
-                dvtheta[i] = params["eta"] * 1.0
-            else: 
-                dvtheta[i] = 0.0
+    with PROFILER.phase("hysteresis"):
+        for i in range(n_agents):
+            if params["active"][i] == 0: 
+                if np.abs(sigma[i]) > params["epsilon_on"]:
+                    params["active"][i] = 1
+                    dvtheta[i] = params["eta"] * 1.0
+                    PROFILER.count("switching_events")
+                else: 
+                    dvtheta[i] = 0.0
 
-        else:
-            if np.abs(sigma[i]) <= params["epsilon_off"]:
-                params["active"][i] = 0
-                dvtheta[i] = 0.0
             else:
-                dvtheta[i] = params["eta"] * 1.0
+                if np.abs(sigma[i]) <= params["epsilon_off"]:
+                    params["active"][i] = 0
+                    dvtheta[i] = 0.0
+                    PROFILER.count("switching_events")
+                else:
+                    dvtheta[i] = params["eta"] * 1.0
 
     u = g - vtheta * grad
     dxdt = u + nu
@@ -385,9 +412,10 @@ def dyn2sample(t, y, g, nu, n_agents, dvth, params, sample_points):
     dydt[2*n_agents:3*n_agents] = dvthdt
     return dydt
 
+@PROFILER.timed("rk4_step")
 def rk4_step(f, t, y, dt, *args):
     """
-    One step of fixed-step RK4 integration.
+    One step of fixed-step RK4 integration (profiled: its self time is the stage arithmetic).
 
     f : function(t, y, *args) -> dydt
     t : current time
@@ -401,12 +429,155 @@ def rk4_step(f, t, y, dt, *args):
     k4 = f(t + dt,   y + dt   * k3, *args)
     return y + (dt/6) * (k1 + 2*k2 + 2*k3 + k4)
 
+class RK4Stepper:
+    """
+    Fixed-step RK4 that owns its stage buffers and updates the state in place: same arithmetic
+    (and results) as rk4_step without temporaries. rhs(t, y, out, *args) must write dy/dt into out.
+    """
+    def __init__(self, rhs, size):
+        self.rhs = rhs
+        self.k1 = np.empty(size)
+        self.k2 = np.empty(size)
+        self.k3 = np.empty(size)
+        self.k4 = np.empty(size)
+        self.stage = np.empty(size)
+
+    @PROFILER.timed("rk4_step")
+    def step(self, t, y, dt, *args):
+        k1, k2, k3, k4, stage = self.k1, self.k2, self.k3, self.k4, self.stage
+        self.rhs(t, y, k1, *args)
+        np.multiply(k1, dt/2, out=stage)
+        np.add(y, stage, out=stage)
+        self.rhs(t + dt/2, stage, k2, *args)
+        np.multiply(k2, dt/2, out=stage)
+        np.add(y, stage, out=stage)
+        self.rhs(t + dt/2, stage, k3, *args)
+        np.multiply(k3, dt, out=stage)
+        np.add(y, stage, out=stage)
+        self.rhs(t + dt, stage, k4, *args)
+
+        # y + (dt/6) * (k1 + 2*k2 + 2*k3 + k4), in the same order
+        np.multiply(k2, 2, out=stage)
+        np.add(k1, stage, out=stage)
+        np.multiply(k3, 2, out=k1)
+        np.add(stage, k1, out=stage)
+        np.add(stage, k4, out=stage)
+        np.multiply(stage, dt/6, out=stage)
+        np.add(y, stage, out=y)
+        return y
+
+## Convergence monitor:
+class ConvergenceMonitor:
+    """
+    Cheap convergence test evaluated every `every` steps on the current states.
+
+    Criteria (all must hold, continuously for `dwell` seconds):
+    - sigma band: max_i |x_i - z_i| <= sigma_band
+    - z-spread:   max_i z_i - min_i z_i <= z_spread (if not None)
+    - frozen gains: |vartheta_i| changed by at most vartheta_tol since the previous check
+    States may carry leading batch dimensions (realizations); reductions are over the last axis.
+    """
+    def __init__(self, sigma_band, z_spread=None, dwell=0.0, every=100, vartheta_tol=0.0):
+        self.sigma_band = sigma_band
+        self.z_spread = z_spread
+        self.dwell = dwell
+        self.every = every
+        self.vartheta_tol = vartheta_tol
+        self.reset()
+
+    @classmethod
+    def from_params(cls, params, **kwargs):
+        return cls(sigma_band=params["epsilon_off"], **kwargs)
+
+    def reset(self):
+        self.since = None               # time at which the criteria started to hold
+        self.last_vtheta = None
+        self.convergence_time = None    # set once converged (per realization in batch mode)
+        self.converged = None
+
+    def criteria(self, x, z, vtheta):
+        ok = np.max(np.abs(x - z), axis=-1) <= self.sigma_band
+        if self.z_spread is not None:
+            ok &= np.ptp(z, axis=-1) <= self.z_spread
+        if self.last_vtheta is not None:
+            ok &= np.max(np.abs(vtheta - self.last_vtheta), axis=-1) <= self.vartheta_tol
+        else:
+            ok &= False
+        self.last_vtheta = np.array(vtheta, copy=True)
+        return ok
+
+    def check(self, t, x, z, vtheta):
+        """
+        Returns:
+            bool or ndarray: converged flag (per realization for batched states).
+        """
+        ok = self.criteria(x, z, vtheta)
+        if self.since is None:
+            self.since = np.full(np.shape(ok), np.nan)
+            self.convergence_time = np.full(np.shape(ok), np.nan)
+        self.since = np.where(ok, np.where(np.isnan(self.since), t, self.since), np.nan)
+        self.converged = ok & (t - np.nan_to_num(self.since, nan=t) >= self.dwell)
+        self.convergence_time = np.where(self.converged & np.isnan(self.convergence_time),
+                                         self.since, self.convergence_time)
+        return self.converged
+
+    def retire(self, keep):
+        """
+        Drops retired realizations from the monitor state (batch mode).
+        """
+        self.since = self.since[keep]
+        self.last_vtheta = self.last_vtheta[keep]
+        self.convergence_time = self.convergence_time[keep]
+        self.converged = self.converged[keep]
+
+## Vectorized consensus law over an edge list (batched over leading dimensions):
+def edge_list(nodes):
+    """
+    (src, dst) 0-based index arrays: agent src[e] reads the virtual state of agent dst[e].
+    """
+    src, dst = [], []
+    for i in range(len(nodes)):
+        for n in nodes[i+1]['neighbors']:
+            src.append(i)
+            dst.append(n-1)
+    return np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+
+class MatrixLaw:
+    """
+    Linear consensus term v = -L z for a given (dense) Laplacian matrix.
+    """
+    def __init__(self, L):
+        self.L = np.asarray(L, dtype=np.float64)
+
+    def __call__(self, z):
+        return -(z @ self.L.T)
+
+    def into(self, z, out):
+        np.matmul(self.L, z, out=out)
+        return np.negative(out, out=out)
+
+def consensus_law(params):
+    """
+    Consensus term v(z) of a simulation: -L z with the graph Laplacian when params["use_laplacian"],
+    else the params["law"] entry of the laws.py registry (a name or a ConsensusLaw; default
+    "sqrt_sign", the law of vi) over the params["nodes"] graph. z may be batched (..., n_agents).
+    """
+    if params.get("use_laplacian", False):
+        return MatrixLaw(params["laplacian"])
+    law = params.get("law", "sqrt_sign")
+    if isinstance(law, str):
+        src, dst = edge_list(params["nodes"])
+        law = make_law(law, src, dst, params["n_agents"])
+    return law
+
 #%% Simulation: RK4 integration
-def simulate_dynamics(params, init_conditions):
+@PROFILER.timed("simulate_dynamics")
+def simulate_dynamics(params, init_conditions, monitor=None):
     # Preallocate variables: states, manipulated variables and derivatives
     n_points = params["n_points"]
     n_agents = params["n_agents"]
     dt = params["dt"]
+    nu = params["disturbance"]
 
     x = np.zeros(shape=(n_agents, n_points))
     z = np.zeros(shape=(n_agents, n_points))
@@ -416,43 +587,58 @@ def simulate_dynamics(params, init_conditions):
     y = np.concatenate(
         [init_conditions["x"], init_conditions["z"], init_conditions["vtheta"]]
     )
+    rhs = DynamicsRHS(params, consensus_law(params), mv=mv, dvth=dvth)
+    stepper = RK4Stepper(rhs, y.size)
 
     t = 0.0
     for k in range(n_points):
 
-        x[:, k] = y[:n_agents]
-        z[:, k] = y[n_agents:2*n_agents]
-        vtheta[:, k] = y[2*n_agents:3*n_agents]
-        y = rk4_step(dynamics, t, y, dt, n_agents, nu[:, k], mv, dvth, params)
+        with PROFILER.phase("record"):
+            x[:, k] = y[:n_agents]
+            z[:, k] = y[n_agents:2*n_agents]
+            vtheta[:, k] = y[2*n_agents:3*n_agents]
 
-        t += dt
-    return x, z, vtheta, mv, dvth
+        # Early termination: stop at the first check where the monitor reports convergence
+        if monitor is not None and k % monitor.every == 0:
+            with PROFILER.phase("monitor"):
+                converged = monitor.check(t, x[:, k], z[:, k], vtheta[:, k])
+            if converged:
+                n_points = k + 1
+                break
 
-x, z, vtheta, mv, dvth = simulate_dynamics(params, init_conditions)
-t = np.linspace(0, T, n_points)
-plot_simulation(t, x, z, vtheta, params)
-plot_states(t, x, z, n_agents, ref_state_num=2)
-plot_lyapunov(t, x, z, params)
-plot_hysteresis_and_sign_function(x, z, dvth, params, agent=1)
+        with PROFILER.phase("disturbance"):
+            nu_k = nu(k)
+        stepper.step(t, y, dt, nu_k)
+
+        t += dt
+        PROFILER.step()
+    return x[:, :n_points], z[:, :n_points], vtheta[:, :n_points], mv[:, :n_points], dvth[:, :n_points]
+
+if __name__ == "__main__":
+    print("Graph nodes:", G.nodes)
+    print("Graph edges:", G.edges)
+    print("Laplacian Matrix:\n", L)
+    print(np.sign(0.0))  # Just to avoid linting error
+    x, z, vtheta, mv, dvth = simulate_dynamics(params, init_conditions)
+    t = np.linspace(0, T, n_points)
+    plot_simulation(t, x, z, vtheta, params)
+    plot_states(t, x, z, n_agents, ref_state_num=2)
+    plot_lyapunov(t, x, z, params)
+    plot_hysteresis_and_sign_function(x, z, dvth, params, agent=1)
 
 #%% Simulation: sampled dynamics (to mimic microcontroller and network behavior)
-def simulate_sampled_dynamics(params, init_conditions, sample_time=0.2):
+@PROFILER.timed("simulate_sampled_dynamics")
+def simulate_sampled_dynamics(params, init_conditions, sample_time=0.2, monitor=None, checkpoint=None):
     n_points = params["n_points"]
     n_agents = params["n_agents"]
     dt = params["dt"]
-
-    # Full trajectories
-    x = np.zeros((n_agents, n_points))
-    z = np.zeros((n_agents, n_points))
-    vtheta = np.zeros((n_agents, n_points))
+    nu = params["disturbance"]
 
     # Initial condition vector
     y = np.concatenate(
         [init_conditions["x"], init_conditions["z"], init_conditions["vtheta"]]
     )
 
-    v = np.zeros(n_agents)
-
     # Sampling setup
     sample_interval = int(sample_time / dt)   # how many steps between samples
     sample_points = n_points // sample_interval
@@ -461,55 +647,71 @@ def simulate_sampled_dynamics(params, init_conditions, sample_time=0.2):
     vthetas = np.zeros((n_agents, sample_points))
     dvthetas = np.zeros((n_agents, sample_points))
 
-    t = 0.0
-    for k in range(n_points):
+    rhs = DynamicsRHS(params, consensus_law(params), sampled=True, dvth=dvthetas, record_points=sample_points)
+    stepper = RK4Stepper(rhs, y.size)
+    v = rhs.v
 
-        # Store full trajectory
-        x[:, k] = y[:n_agents]
-        z[:, k] = y[n_agents:2*n_agents]
-        vtheta[:, k] = y[2*n_agents:3*n_agents]
+    t = 0.0
+    k0 = 0
+    records = {"xs": xs, "zs": zs, "vthetas": vthetas, "dvthetas": dvthetas}
+    if checkpoint is not None:
+        k0, state = checkpoint.restore(records, monitor, nu)
+        if state is not None:
+            y[:], v[:], t = state["y"], state["v"], float(state["t"])
+            params["active"][:] = state["active"]
+
+    # Current states (views of y, which is updated in place)
+    x_k = y[:n_agents]
+    z_k = y[n_agents:2*n_agents]
+    vtheta_k = y[2*n_agents:3*n_agents]
+
+    for k in range(k0, n_points):
+
+        # Periodic checkpoint of the state at the start of step k
+        if checkpoint is not None and k > k0 and checkpoint.due(k):
+            filled = {"xs": min(sample_points, -(-k // sample_interval)), "dvthetas": min(k, sample_points)}
+            checkpoint.save(k, {"y": y, "v": v, "t": t, "active": params["active"]},
+                            {name: (array, filled.get(name, filled["xs"])) for name, array in records.items()},
+                            monitor, nu)
 
         # Compute consensus input
         if k % sample_interval == 0:
-            if params["use_laplacian"]:
-                v = -L @ z[:, k]
-            else:
-                for i in range(n_agents):
-                    neighbors = params["nodes"][i+1]['neighbors']
-                    neighbors_index = [n-1 for n in neighbors]
-                    v[i] = vi(i, z[:, k], neighbors_index)
+            rhs.hold_input(z_k)
 
             # Store sampled trajectories
             sample_idx = k // sample_interval
             if sample_idx < sample_points:
-                xs[:, sample_idx] = x[:, k]
-                zs[:, sample_idx] = z[:, k]
-                vthetas[:, sample_idx] = vtheta[:, k]
+                xs[:, sample_idx] = x_k
+                zs[:, sample_idx] = z_k
+                vthetas[:, sample_idx] = vtheta_k
+
+        # Early termination: stop at the first check where the monitor reports convergence
+        if monitor is not None and k % monitor.every == 0 and monitor.check(t, x_k, z_k, vtheta_k):
+            sample_points = min(sample_points, k // sample_interval + 1)
+            break
 
         # RK4 integration
-        g = v
-        y = rk4_step(dyn2sample, t, y, dt, g, nu[:, k], n_agents, dvthetas, params, sample_points)
+        stepper.step(t, y, dt, nu(k))
         t += dt
+        PROFILER.step()
 
-    return xs, zs, vthetas, dvthetas, sample_points
+    return xs[:, :sample_points], zs[:, :sample_points], vthetas[:, :sample_points], dvthetas[:, :sample_points], sample_points
 
-x, z, vtheta, dvtheta, sample_points = simulate_sampled_dynamics(params, init_conditions)
-t = np.linspace(0, T, sample_points)
-plot_simulation(t, x, z, vtheta, params)
-plot_states(t, x, z, n_agents, ref_state_num=2)
-plot_lyapunov(t, x, z, params)
-plot_hysteresis_and_sign_function(x, z, dvtheta, params, agent=1)
+if __name__ == "__main__":
+    x, z, vtheta, dvtheta, sample_points = simulate_sampled_dynamics(params, init_conditions)
+    t = np.linspace(0, T, sample_points)
+    plot_simulation(t, x, z, vtheta, params)
+    plot_states(t, x, z, n_agents, ref_state_num=2)
+    plot_lyapunov(t, x, z, params)
+    plot_hysteresis_and_sign_function(x, z, dvtheta, params, agent=1)
 
 #%% Simulation: Euler integration (for comparison)
-def simulate_sampled_dynamics_euler(params, init_conditions, sample_time=1.0):
+@PROFILER.timed("simulate_sampled_dynamics_euler")
+def simulate_sampled_dynamics_euler(params, init_conditions, sample_time=1.0, monitor=None, checkpoint=None):
     n_points = params["n_points"]
     n_agents = params["n_agents"]
     dt = params["dt"]
-
-    # Full trajectories
-    x = np.zeros((n_agents, n_points))
-    z = np.zeros((n_agents, n_points))
-    vtheta = np.zeros((n_agents, n_points))
+    nu = params["disturbance"]
 
     # Initial condition vector
     y = np.concatenate(
@@ -517,6 +719,7 @@ def simulate_sampled_dynamics_euler(params, init_conditions, sample_time=1.0):
     )
 
     v = np.zeros(n_agents)
+    law = consensus_law(params)
 
     # Sampling setup
     sample_interval = int(sample_time / dt)   # how many steps between samples
@@ -527,43 +730,151 @@ def simulate_sampled_dynamics_euler(params, init_conditions, sample_time=1.0):
     dvthetas = np.zeros((n_agents, sample_points))
 
     t = 0.0
-    for k in range(n_points):
-
-        # Store full trajectory
-        x[:, k] = y[:n_agents]
-        z[:, k] = y[n_agents:2*n_agents]
-        vtheta[:, k] = y[2*n_agents:3*n_agents]
+    k0 = 0
+    records = {"xs": xs, "zs": zs, "vthetas": vthetas, "dvthetas": dvthetas}
+    if checkpoint is not None:
+        k0, state = checkpoint.restore(records, monitor, nu)
+        if state is not None:
+            y, v, t = state["y"], state["v"], float(state["t"])
+            params["active"][:] = state["active"]
+
+    for k in range(k0, n_points):
+
+        # Periodic checkpoint of the state at the start of step k
+        if checkpoint is not None and k > k0 and checkpoint.due(k):
+            filled = {"xs": min(sample_points, -(-k // sample_interval)), "dvthetas": min(k, sample_points)}
+            checkpoint.save(k, {"y": y, "v": v, "t": t, "active": params["active"]},
+                            {name: (array, filled.get(name, filled["xs"])) for name, array in records.items()},
+                            monitor, nu)
+
+        # Current states
+        x_k = y[:n_agents]
+        z_k = y[n_agents:2*n_agents]
+        vtheta_k = y[2*n_agents:3*n_agents]
 
         # Always compute consensus input
-        if params["use_laplacian"]:
-            v = -L @ z[:, k]
-        else:
-            for i in range(n_agents):
-                neighbors = params["nodes"][i+1]['neighbors']
-                neighbors_index = [n-1 for n in neighbors]
-                v[i] = vi(i, z[:, k], neighbors_index)
+        with PROFILER.phase("consensus"):
+            v = law(z_k)
 
         # Store sampled trajectories only at sample points
         if k % sample_interval == 0:
             sample_idx = k // sample_interval
             if sample_idx < sample_points:
-                xs[:, sample_idx] = x[:, k]
-                zs[:, sample_idx] = z[:, k]
-                vthetas[:, sample_idx] = vtheta[:, k]
+                xs[:, sample_idx] = x_k
+                zs[:, sample_idx] = z_k
+                vthetas[:, sample_idx] = vtheta_k
+
+        # Early termination: stop at the first check where the monitor reports convergence
+        if monitor is not None and k % monitor.every == 0 and monitor.check(t, x_k, z_k, vtheta_k):
+            sample_points = min(sample_points, k // sample_interval + 1)
+            break
 
         # Euler integration step
-        dydt = dyn2sample(t, y, v, nu[:, k], n_agents, dvthetas, params, sample_points)
+        dydt = dyn2sample(t, y, v, nu(k), n_agents, dvthetas, params, sample_points)
         y = y + dt * dydt
         t += dt
+        PROFILER.step()
+
+    return xs[:, :sample_points], zs[:, :sample_points], vthetas[:, :sample_points], dvthetas[:, :sample_points], sample_points
+
+if __name__ == "__main__":
+    x, z, vtheta, dvtheta, sample_points = simulate_sampled_dynamics_euler(params, init_conditions)
+    t = np.linspace(0, T, sample_points)
+    plot_simulation(t, x, z, vtheta, params)
+    plot_states(t, x, z, n_agents, ref_state_num=2)
+    plot_lyapunov(t, x, z, params)
+    plot_hysteresis_and_sign_function(x, z, dvtheta, params, agent=1)
+
+#%% Simulation: batched ensemble with early termination
+def simulate_ensemble(params, init_conditions, sample_time=0.2, monitor=None):
+    """
+    Euler-integrated sampled dynamics (as simulate_sampled_dynamics_euler, with the consensus
+    input held between samples) for R independent realizations at once.
+
+    init_conditions: {"x", "z", "vtheta"} arrays of shape (R, n_agents).
+    params["eta"], params["epsilon_on"], params["epsilon_off"] may be scalars or (R,) arrays.
+    params["law"] and params["controller"] select the consensus law and the local controller
+    (laws.py registry: names or instances; defaults "sqrt_sign" and "adaptive_integral").
+    params["disturbance"] is a Disturbance over R * n_agents agents (realization r, agent i
+    --> r * n_agents + i), or over n_agents (same disturbance for all realizations).
+
+    Realizations are retired from the active set as soon as the monitor reports convergence,
+    so the remaining steps only integrate the unconverged ones.
+    Returns:
+        dict: final 'x', 'z', 'vtheta' (R, n_agents), 'vtheta_max' (R, n_agents),
+              'convergence_time' (R,) (NaN if not converged), 'steps' (R,)
+    """
+    n_points = params["n_points"]
+    n_agents = params["n_agents"]
+    dt = params["dt"]
+    nu = params["disturbance"]
+    law = consensus_law(dict(params, use_laplacian=False))
+    controller = params.get("controller", "adaptive_integral")
+    controller = make_controller(controller) if isinstance(controller, str) else controller
+
+    x = np.array(init_conditions["x"], dtype=np.float64)
+    z = np.array(init_conditions["z"], dtype=np.float64)
+    vtheta = np.array(init_conditions["vtheta"], dtype=np.float64)
+    R = x.shape[0]
+
+    def per_realization(value):
+        return np.broadcast_to(np.asarray(value, dtype=np.float64), (R,))[:, None]
+
+    eta = per_realization(params["eta"])
+    epsilon_on = per_realization(params["epsilon_on"])
+    epsilon_off = per_realization(params["epsilon_off"])
+
+    results = {
+        "x": x.copy(), "z": z.copy(), "vtheta": vtheta.copy(), "vtheta_max": vtheta.copy(),
+        "convergence_time": np.full(R, np.nan), "steps": np.full(R, n_points),
+    }
+
+    alive = np.arange(R)
+    state = controller.init_state((R, n_agents))
+    vtheta_max = vtheta.copy()
+    v = np.zeros((R, n_agents))
+    sample_interval = max(1, int(sample_time / dt))
+
+    t = 0.0
+    for k in range(n_points):
+
+        if monitor is not None and k % monitor.every == 0:
+            done = monitor.check(t, x, z, vtheta)
+            if np.any(done):
+                retired = alive[done]
+                for key, value in (("x", x), ("z", z), ("vtheta", vtheta), ("vtheta_max", vtheta_max)):
+                    results[key][retired] = value[done]
+                results["convergence_time"][retired] = monitor.convergence_time[done]
+                results["steps"][retired] = k
+
+                keep = ~done
+                alive = alive[keep]
+                x, z, vtheta, vtheta_max, v = x[keep], z[keep], vtheta[keep], vtheta_max[keep], v[keep]
+                state = {key: value[keep] for key, value in state.items()}
+                eta, epsilon_on, epsilon_off = eta[keep], epsilon_on[keep], epsilon_off[keep]
+                monitor.retire(keep)
+                if alive.size == 0:
+                    break
 
-    return xs, zs, vthetas, dvthetas, sample_points
+        if k % sample_interval == 0:
+            v = law(z)
+
+        nu_k = nu(k)
+        nu_k = nu_k.reshape(R, n_agents)[alive] if nu_k.size == R * n_agents else nu_k
+
+        u, dvtheta, dstate = controller(x, z, vtheta, v, state, eta, epsilon_on, epsilon_off)
 
-x, z, vtheta, dvtheta, sample_points = simulate_sampled_dynamics_euler(params, init_conditions)
-t = np.linspace(0, T, sample_points)
-plot_simulation(t, x, z, vtheta, params)
-plot_states(t, x, z, n_agents, ref_state_num=2)
-plot_lyapunov(t, x, z, params)
-plot_hysteresis_and_sign_function(x, z, dvtheta, params, agent=1)
+        x = x + dt * (u + nu_k)
+        z = z + dt * v
+        vtheta = vtheta + dt * dvtheta
+        for key, value in dstate.items():
+            state[key] = state[key] + dt * value
+        np.maximum(vtheta_max, vtheta, out=vtheta_max)
+        t += dt
+
+    for key, value in (("x", x), ("z", z), ("vtheta", vtheta), ("vtheta_max", vtheta_max)):
+        results[key][alive] = value
+    return results
 
 #%% END OF FILE
 ## Hysteresis loop: 
@@ -599,5 +910,3 @@ def hysteresis_loop():
     plt.grid(True, linestyle='--', alpha=0.7)
     plt.tight_layout()
     plt.show()
-
-print(np.sign(0.0))  # Just to avoid linting error
\ No newline at end of file
@@ -0,0 +1,342 @@
+#%% Consensus simulation scaling benchmark suite
+import io
+import os
+import sys
+import ast
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing as mp
+import numpy as np
+import networkx as nx
+
+from disturbance import Disturbance
+from profiling import PROFILER
+
+import FTRAC
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PYTHON_TOOLS = os.path.join(ROOT, "raspberry", "python")
+DATA_DIR = os.path.join(ROOT, "raspberry", "data")
+HISTORY_FILE = os.path.join(ROOT, ".results", "benchmark_history.json")
+
+SIMULATORS = {
+    "simulate_dynamics": lambda params, init: FTRAC.simulate_dynamics(params, init),
+    "simulate_sampled_dynamics": lambda params, init: FTRAC.simulate_sampled_dynamics(
+        params, init, sample_time=10 * params["dt"]),
+    "simulate_sampled_dynamics_euler": lambda params, init: FTRAC.simulate_sampled_dynamics_euler(
+        params, init, sample_time=10 * params["dt"]),
+}
+
+## Topologies: NODES-style dicts {id: {'neighbors': [ids]}} with 1-based ids
+def ring_topology(n_agents):
+    """
+    Directed ring with the structure of FTRAC.NODES (node i listens to node i-1).
+    """
+    return {i: {'neighbors': [(i - 2) % n_agents + 1]} for i in range(1, n_agents + 1)}
+
+def clusters_topology(n_agents=30):
+    """
+    The 30-node clusters graph of `neighbors` in raspberry/python/interpolate.py. The dict
+    is read from the source (interpolate.py runs a simulation at import).
+    """
+    with open(os.path.join(PYTHON_TOOLS, "interpolate.py"), 'r') as f:
+        tree = ast.parse(f.read())
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Assign) and getattr(stmt.targets[0], 'id', None) == 'neighbors':
+            neighbors = ast.literal_eval(stmt.value)
+            return {i + 1: {'neighbors': list(neighbors[i])} for i in range(len(neighbors))}
+    raise ValueError("no `neighbors` dict in interpolate.py")
+
+def _from_undirected(graph):
+    return {i + 1: {'neighbors': [j + 1 for j in graph.neighbors(i)]} for i in range(graph.number_of_nodes())}
+
+def geometric_topology(n_agents, seed=42):
+    radius = min(1.0, 1.5 * np.sqrt(np.log(max(n_agents, 2)) / (np.pi * n_agents)))
+    return _from_undirected(nx.random_geometric_graph(n_agents, radius, seed=seed))
+
+def scalefree_topology(n_agents, seed=42):
+    return _from_undirected(nx.barabasi_albert_graph(n_agents, min(2, n_agents - 1), seed=seed))
+
+TOPOLOGIES = {
+    "ring": ring_topology,
+    "clusters": clusters_topology,
+    "geometric": geometric_topology,
+    "scalefree": scalefree_topology,
+}
+
+def make_problem(nodes, n_points, dt=1e-3, seed=42):
+    """
+    FTRAC params and initial conditions for an arbitrary topology and horizon.
+    """
+    rng = np.random.default_rng(seed)
+    n_agents = len(nodes)
+    nu = Disturbance(n_agents, dt, seed=seed, amplitude=2*FTRAC.alpha, offset=0.5, beta=FTRAC.beta,
+                     A=FTRAC.kappa, frequency=10)
+
+    params = dict(
+        FTRAC.params,
+        dt=dt,
+        n_points=n_points,
+        n_agents=n_agents,
+        use_laplacian=False,
+        active=np.zeros(n_agents),
+        nodes=nodes,
+        laplacian=None,
+        disturbance=nu,
+    )
+    init_conditions = {
+        "x": rng.uniform(0, 10, n_agents),
+        "z": rng.uniform(0, 10, n_agents),
+        "vtheta": np.zeros(n_agents),
+    }
+    return params, init_conditions
+
+## Cases
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def _simulation_case(case):
+    nodes = TOPOLOGIES[case["topology"]](case["n_agents"])
+    params, init_conditions = make_problem(nodes, case["steps"])
+    baseline = _rss_mb()
+    if case.get("profile"):
+        PROFILER.reset()
+        PROFILER.enable(track_allocations=True)
+    t0 = time.perf_counter()
+    SIMULATORS[case["function"]](params, init_conditions)
+    wall = time.perf_counter() - t0
+    result = {
+        "wall_time": wall,
+        "steps_per_second": case["steps"] / wall,
+        "agent_steps_per_second": case["steps"] * len(nodes) / wall,
+        "baseline_rss_mb": baseline,
+    }
+    if case.get("profile"):
+        PROFILER.disable()
+        name = case_key(case).replace("/", "_")
+        PROFILER.save_json(os.path.join(case["profile"], f"{name}.json"))
+        PROFILER.save_collapsed(os.path.join(case["profile"], f"{name}.folded"))
+        result["profile"] = PROFILER.summary()
+        result["profile_report"] = PROFILER.report(top=6)
+    return result
+
+def _loader_case(case):
+    sys.path.insert(0, PYTHON_TOOLS)
+    from PostSimulation import PostSimulation
+    from TimingAnalysis import TimingAnalysis
+
+    # numerical_results() writes next to the data: work on a copy
+    with tempfile.TemporaryDirectory() as tmp:
+        sim_dir = shutil.copytree(os.path.join(DATA_DIR, case["experiment"]), os.path.join(tmp, case["experiment"]))
+        baseline = _rss_mb()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if case["function"] == "PostSimulation":
+                post_sim = PostSimulation(simulation_dir=sim_dir, num_agents=case["n_agents"])
+                post_sim.load_data()
+                post_sim.numerical_results()
+                samples = sum(d.shape[0] for d in post_sim.data.values())
+            else:
+                timing = TimingAnalysis(simulation_dir=sim_dir, num_agents=case["n_agents"])
+                timing.load_data()
+                timing.timing_results(save=False)
+                samples = sum(ts.size for ts in timing.timestamps.values())
+        wall = time.perf_counter() - t0
+    return {
+        "wall_time": wall,
+        "samples": samples,
+        "samples_per_second": samples / wall,
+        "baseline_rss_mb": baseline,
+    }
+
+def _run_in_child(case, queue):
+    try:
+        result = (_simulation_case if case["kind"] == "simulation" else _loader_case)(case)
+        result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        queue.put(result)
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+def run_case(case):
+    """
+    Runs one case in a forked process so that its peak RSS is measured in isolation.
+    """
+    ctx = mp.get_context("fork")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_in_child, args=(case, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return {**case, **result}
+
+def case_key(case):
+    return "/".join(str(case[k]) for k in ("kind", "function", "topology", "n_agents", "steps", "experiment") if k in case)
+
+def build_cases(functions, topologies, sizes, horizons, max_work, experiments):
+    cases = []
+    for function in functions:
+        for topology in topologies:
+            for n_agents in ([30] if topology == "clusters" else sizes):
+                for steps in horizons:
+                    if n_agents * steps > max_work:
+                        continue
+                    cases.append({"kind": "simulation", "function": function, "topology": topology,
+                                  "n_agents": n_agents, "steps": steps})
+    for experiment in experiments:
+        for function in ("PostSimulation", "TimingAnalysis"):
+            cases.append({"kind": "loader", "function": function, "experiment": experiment, "n_agents": 30})
+    return cases
+
+## Allocations
+def check_allocations(sizes=(1000, 10000), steps=50, warmup=5, limit=4096, slack=1024):
+    """
+    tracemalloc check of the preallocated RK4 stepper: the memory allocated and released within
+    one step (traced peak minus current) must stay below `limit` bytes and must not grow with
+    the number of agents (worst case at the largest size at most `slack` bytes above the one
+    at the smallest size), i.e. no array is allocated per step (one state-sized temporary
+    would already be 8 * n_agents bytes).
+    Returns:
+        tuple: (passed, {n_agents: max transient bytes per step})
+    """
+    import tracemalloc
+    worst = {}
+    for n_agents in sizes:
+        params, init_conditions = make_problem(ring_topology(n_agents), steps)
+        y = np.concatenate([init_conditions["x"], init_conditions["z"], init_conditions["vtheta"]])
+        rhs = FTRAC.DynamicsRHS(params, FTRAC.consensus_law(params))
+        stepper = FTRAC.RK4Stepper(rhs, y.size)
+        nu_k = params["disturbance"](0)
+
+        for k in range(warmup):
+            stepper.step(k * params["dt"], y, params["dt"], nu_k)
+        tracemalloc.start()
+        transient = []
+        for k in range(warmup, steps):
+            tracemalloc.reset_peak()
+            current0 = tracemalloc.get_traced_memory()[0]
+            stepper.step(k * params["dt"], y, params["dt"], nu_k)
+            current, peak = tracemalloc.get_traced_memory()
+            transient.append(max(peak - current0, current - current0))
+        tracemalloc.stop()
+        worst[n_agents] = max(transient)
+    smallest, largest = worst[min(worst)], worst[max(worst)]
+    passed = all(transient < limit for transient in worst.values()) and largest <= smallest + slack
+    return passed, worst
+
+## History
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_run(results, path=HISTORY_FILE, label=None, profiled=False):
+    """
+    Appends a run to the history. Profiled runs are tagged: their timings include the
+    profiler overhead and compare() leaves them out.
+    """
+    history = load_history(path)
+    history.append({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "label": label,
+        "profiled": profiled,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    })
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2)
+    return history
+
+def compare(history):
+    """
+    Speedup of the last run against the previous run containing the same case, profiled runs
+    (and profiled cases of older histories) left out.
+    Returns:
+        dict: {case_key: speedup}
+    """
+    def timed(run):
+        return [r for r in run["results"] if "wall_time" in r and "profile" not in r]
+
+    history = [run for run in history if not run.get("profiled")]
+    if len(history) < 2:
+        return {}
+    last = {case_key(r): r for r in timed(history[-1])}
+    speedups = {}
+    for run in reversed(history[:-1]):
+        for r in timed(run):
+            key = case_key(r)
+            if key in last and key not in speedups:
+                speedups[key] = r["wall_time"] / last[key]["wall_time"]
+    return speedups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consensus simulation scaling benchmarks")
+    parser.add_argument("--functions", nargs="+", default=list(SIMULATORS), choices=list(SIMULATORS))
+    parser.add_argument("--topologies", nargs="+", default=list(TOPOLOGIES), choices=list(TOPOLOGIES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[9, 100, 1000, 10000])
+    parser.add_argument("--horizons", nargs="+", type=int, default=[100, 1000])
+    parser.add_argument("--max-work", type=float, default=1e6, help="skip cases with n_agents * steps above this")
+    parser.add_argument("--experiments", nargs="*", default=["30node-clusters"])
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--quick", action="store_true", help="sizes 9 and 30, 100 steps")
+    parser.add_argument("--check-allocations", action="store_true",
+                        help="only verify that the preallocated RK4 stepper allocates no arrays per step")
+    parser.add_argument("--profile", metavar="DIR", default=None,
+                        help="profile the simulation cases (timings are then not comparable): "
+                             "per-phase JSON and folded stacks for flamegraph.pl/speedscope in DIR")
+    args = parser.parse_args()
+
+    if args.check_allocations:
+        ok, worst = check_allocations()
+        for n_agents, transient in worst.items():
+            print(f"RK4Stepper, {n_agents:6d} agents: {transient:6d} B allocated per step (max)")
+        print("OK: no per-step array allocations" if ok else "FAILED: per-step allocations")
+        sys.exit(0 if ok else 1)
+
+    if args.quick:
+        args.sizes, args.horizons = [9, 30], [100]
+
+    cases = build_cases(args.functions, args.topologies, args.sizes, args.horizons, args.max_work, args.experiments)
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+        for case in cases:
+            if case["kind"] == "simulation":
+                case["profile"] = args.profile
+    results = []
+    for case in cases:
+        result = run_case(case)
+        results.append(result)
+        if "error" in result:
+            print(f"{case_key(case):<70s} ERROR {result['error']}")
+            continue
+        rate = result.get("steps_per_second", result.get("samples_per_second"))
+        print(f"{case_key(case):<70s} {result['wall_time']:9.3f} s {rate:12.1f} /s "
+              f"{result['peak_rss_mb']:8.1f} MB")
+        if "profile_report" in result:
+            print("    " + result.pop("profile_report").replace("\n", "\n    "))
+
+    history = save_run(results, args.history, args.label or ("profile" if args.profile else None),
+                       profiled=bool(args.profile))
+    # Profiled timings include the profiler overhead: not compared
+    for key, speedup in ({} if args.profile else compare(history)).items():
+        print(f"{key:<70s} x{speedup:.2f} vs previous")
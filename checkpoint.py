@@ -0,0 +1,125 @@
+#%% Checkpoint/restart of long simulations
+import os
+import glob
+import time
+import numpy as np
+
+MONITOR_FIELDS = ("since", "last_vtheta", "convergence_time", "converged")
+
+class Checkpoint:
+    """
+    Periodic checkpoint of a simulator state to a compact .npz file, with a resume path that
+    continues bit-identically.
+
+    The state file only holds O(n_agents) data: the state vector, the hysteresis flags, the step
+    index and time, the held consensus input, the convergence monitor state and the recorder
+    offsets. The disturbance is counter-based (disturbance.py), so its "RNG state" is the seed
+    and the step index. Recorded samples are written incrementally: every checkpoint appends
+    the columns filled since the previous one to a numbered chunk file, so checkpoints do not
+    grow with the horizon.
+
+    Files are written to a temporary name and renamed, so a run killed while saving leaves the
+    previous checkpoint intact.
+    """
+
+    def __init__(self, path, every=10000, every_seconds=None):
+        """
+        Args:
+            path (str): checkpoint file (.npz); record chunks are stored as <path>.rec<j>.npz.
+            every (int): checkpoint every `every` steps.
+            every_seconds (float): also checkpoint when this much wall time has passed.
+        """
+        self.path = path if path.endswith('.npz') else path + '.npz'
+        self.every = every
+        self.every_seconds = every_seconds
+        self.offsets = {}
+        self.n_chunks = 0
+        self._last_save = time.monotonic()
+
+    def _chunk_path(self, j):
+        return f"{self.path[:-4]}.rec{j}.npz"
+
+    @staticmethod
+    def _write(path, arrays):
+        tmp = path[:-4] + '.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    def due(self, k):
+        if self.every and k % self.every == 0:
+            return True
+        return self.every_seconds is not None and time.monotonic() - self._last_save >= self.every_seconds
+
+    def save(self, k, state, records, monitor=None, disturbance=None):
+        """
+        Args:
+            k (int): step index at which the simulation resumes.
+            state (dict): arrays/scalars of the simulator state.
+            records (dict): {name: (array, filled)} recorded arrays (n_agents, n_samples) and
+                            the number of columns filled so far.
+        """
+        chunk = {}
+        for name, (array, filled) in records.items():
+            lo = self.offsets.get(name, 0)
+            if filled > lo:
+                chunk[f"{name}_lo"] = lo
+                chunk[name] = array[:, lo:filled]
+        if chunk:
+            self._write(self._chunk_path(self.n_chunks), chunk)
+            self.n_chunks += 1
+            for name, (array, filled) in records.items():
+                self.offsets[name] = max(self.offsets.get(name, 0), filled)
+
+        arrays = {f"state_{key}": value for key, value in state.items()}
+        arrays["k"] = k
+        arrays["n_chunks"] = self.n_chunks
+        arrays.update({f"offset_{name}": offset for name, offset in self.offsets.items()})
+        if disturbance is not None:
+            arrays["seed"] = disturbance.seed
+        if monitor is not None:
+            arrays.update({f"monitor_{field}": getattr(monitor, field) for field in MONITOR_FIELDS
+                           if getattr(monitor, field) is not None})
+        self._write(self.path, arrays)
+        self._last_save = time.monotonic()
+
+    def restore(self, records, monitor=None, disturbance=None):
+        """
+        Loads the checkpoint, if any, refilling the recorded arrays in place.
+        Returns:
+            tuple: (k, state) or (0, None) if there is no checkpoint.
+        """
+        if not os.path.exists(self.path):
+            return 0, None
+        with np.load(self.path) as f:
+            content = {key: f[key] for key in f.files}
+
+        if disturbance is not None and "seed" in content and int(content["seed"]) != disturbance.seed:
+            raise ValueError(f"checkpoint {self.path} was written with disturbance seed {int(content['seed'])}, "
+                             f"not {disturbance.seed}")
+
+        self.n_chunks = int(content["n_chunks"])
+        self.offsets = {key[len("offset_"):]: int(value) for key, value in content.items() if key.startswith("offset_")}
+        for j in range(self.n_chunks):
+            with np.load(self._chunk_path(j)) as f:
+                for name in records:
+                    if name in f.files:
+                        lo = int(f[f"{name}_lo"])
+                        block = f[name]
+                        records[name][:, lo:lo + block.shape[1]] = block
+
+        if monitor is not None:
+            for field in MONITOR_FIELDS:
+                value = content.get(f"monitor_{field}")
+                setattr(monitor, field, None if value is None else (value.item() if value.ndim == 0 else value))
+
+        state = {key[len("state_"):]: value for key, value in content.items() if key.startswith("state_")}
+        return int(content["k"]), state
+
+    def clear(self):
+        """
+        Removes the checkpoint and its record chunks.
+        """
+        for path in [self.path] + glob.glob(f"{glob.escape(self.path[:-4])}.rec*.npz"):
+            os.remove(path)
+        self.offsets = {}
+        self.n_chunks = 0
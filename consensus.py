@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from laws import aggregate
 
 class Node:
     def __init__(self, idx, x_init, z_init, vartheta_init, eta, gamma=1.0, add_disturbance=False):
@@ -45,77 +46,202 @@ class Node:
         return self.x, self.z, self.vartheta, self.sigma
 
 
-# === Simulation ===
-N = 9           # Number of agents
-steps = 100     # Number of time steps
-eta = 1.0       # Learning rate for vartheta 
-nodes = []      # List to hold agents (nodes)
-
-NODES = {
-    1: {'x0': 1000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [4], 'disturbance': False},
-    2: {'x0': 2000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [5], 'disturbance': False},
-    3: {'x0': 3000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [8], 'disturbance': False},
-    4: {'x0': 4000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [7], 'disturbance': False},
-    5: {'x0': 5000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [9], 'disturbance': False},
-    6: {'x0': 6000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [2], 'disturbance': False},
-    7: {'x0': 7000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [3], 'disturbance': False},
-    8: {'x0': 8000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [6], 'disturbance': False},
-    9: {'x0': 9000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [1], 'disturbance': False},
-}
-
-# Initialize agents with different initial states
-for i in range(N):
-    x_init = NODES[i+1]['x0']
-    z_init = NODES[i+1]['z0']
-    vartheta_init = NODES[i+1]['vartheta0']
-    add_disturbance = NODES[i+1]['disturbance']
-    node = Node(i, x_init, z_init, eta, add_disturbance)
-    nodes.append(node)
-
-# Define neighbors (full mesh or ring)
-for idx, node in enumerate(nodes):
-    neighbors_indices = NODES[i+1]['neighbors']
-    node.neighbors = [nodes[n_idx - 1] for n_idx in neighbors_indices if n_idx - 1 < N]
-
-x_states = np.zeros((N, steps))
-z_states = np.zeros((N, steps))
-vartheta = np.zeros((N, steps))
-
-for k in range(steps):
-    for i, node in enumerate(nodes):
-        x, z, theta, _ = node.update()
-        x_states[i, k] = x
-        z_states[i, k] = z
-        vartheta[i, k] = theta
-
-# === Plot ===
-
-plt.figure(figsize=(12, 5))
-for i in range(N):
-    plt.plot(x_states[i], label=f'Node {i+1} x')
-plt.title('Node states $x_i$ (solid) and references $z_i$ (dashed)')
-plt.xlabel('Time step')
-plt.ylabel('State')
-plt.legend()
-plt.grid()
-
-plt.figure(figsize=(12, 5))
-for i in range(N):
-    plt.plot(z_states[i], '--', label=f'Node {i+1} z')
-plt.title('Node references $z_i$ over time')
-plt.xlabel('Time step')
-plt.ylabel('Reference')
-plt.legend()
-plt.grid()
-
-plt.figure(figsize=(12, 5))
-for i in range(N):
-    plt.plot(vartheta[i], label=f'Node {i+1}')
-plt.title('Adaptive gain $\\vartheta_i$ over time')
-plt.xlabel('Time step')
-plt.ylabel('$\\vartheta$')
-plt.legend()
-plt.grid()
-
-plt.show()
+class ArrayConsensus:
+    """
+    Structure-of-arrays engine with the update rule of Node.update (averaging law of Node.g,
+    u = g - gamma vartheta sign(sigma), unit time step), for all nodes at once and optionally
+    for a batch of R realizations (states of shape (R, N)).
+
+    Modes:
+    - "sync": every node reads the states of the previous step (Jacobi).
+    - "async": nodes update sequentially in index order and read the already updated z of
+      the nodes before them, as the Node loop does (Gauss-Seidel). Since g is linear in z, the
+      sweep is solved level by level: a node only waits for its lower-index neighbors, so all
+      nodes of a level update together.
+    """
+
+    def __init__(self, x0, z0, vartheta0, neighbors, eta=1.0, gamma=1.0, add_disturbance=False,
+                 noise_std=0.1, mode="sync", rng=None):
+        """
+        Args:
+            x0, z0, vartheta0: initial states, shape (N,) or (R, N).
+            neighbors (list): 0-based neighbor indices of every node.
+            eta, gamma, add_disturbance: scalars or per-node arrays.
+            rng: np.random.Generator for the disturbance (default: the global np.random
+                 stream, drawn in the same order as the Node loop).
+        """
+        if mode not in ("sync", "async"):
+            raise ValueError(f"unknown mode '{mode}', expected 'sync' or 'async'")
+        self.mode = mode
+        self.x = np.array(x0, dtype=np.float64)
+        self.z = np.array(z0, dtype=np.float64)
+        self.vartheta = np.broadcast_to(np.asarray(vartheta0, dtype=np.float64), self.x.shape).copy()
+        self.N = self.x.shape[-1]
+        self.eta = np.broadcast_to(np.asarray(eta, dtype=np.float64), (self.N,))
+        self.gamma = np.broadcast_to(np.asarray(gamma, dtype=np.float64), (self.N,))
+        self.add_disturbance = np.broadcast_to(np.asarray(add_disturbance, dtype=bool), (self.N,))
+        self.noise_std = noise_std
+        self.rng = np.random if rng is None else rng
+        self.sigma = np.zeros_like(self.x)
+        self.u = np.zeros_like(self.x)
+
+        self.src = np.array([i for i in range(self.N) for _ in neighbors[i]], dtype=np.int64)
+        self.dst = np.array([j for i in range(self.N) for j in neighbors[i]], dtype=np.int64)
+        degree = np.bincount(self.src, minlength=self.N)
+        self.inv_degree = np.where(degree > 0, 1.0 / np.maximum(degree, 1), 0.0)
+
+        # Sequential sweep levels: level(i) = 1 + max level of the neighbors j < i
+        level = np.zeros(self.N, dtype=np.int64)
+        for i in range(self.N):
+            lower = [level[j] + 1 for j in neighbors[i] if j < i]
+            level[i] = max(lower, default=0)
+        self.levels = [np.flatnonzero(level == l) for l in range(level.max() + 1 if self.N else 0)]
+        self._level_edges = [np.flatnonzero(np.isin(self.src, nodes)) for nodes in self.levels]
+
+    @classmethod
+    def from_nodes(cls, nodes, eta=1.0, gamma=1.0, **kwargs):
+        """
+        Engine from a NODES-style config {id: {'x0', 'z0', 'vartheta0', 'neighbors', 'disturbance'}}
+        with 1-based ids, as in the script below.
+        """
+        ids = sorted(nodes)
+        index = {node_id: i for i, node_id in enumerate(ids)}
+        return cls(
+            x0=[nodes[i]['x0'] for i in ids],
+            z0=[nodes[i]['z0'] for i in ids],
+            vartheta0=[nodes[i].get('vartheta0', 0.0) for i in ids],
+            neighbors=[[index[j] for j in nodes[i]['neighbors'] if j in index] for i in ids],
+            eta=eta, gamma=gamma,
+            add_disturbance=[nodes[i].get('disturbance', False) for i in ids],
+            **kwargs,
+        )
+
+    @classmethod
+    def from_node_objects(cls, node_list, **kwargs):
+        """
+        Engine with the states, gains and neighbor lists of existing Node objects.
+        """
+        index = {id(node): i for i, node in enumerate(node_list)}
+        return cls(
+            x0=[node.x for node in node_list],
+            z0=[node.z for node in node_list],
+            vartheta0=[node.vartheta for node in node_list],
+            neighbors=[[index[id(n)] for n in node.neighbors] for node in node_list],
+            eta=[node.eta for node in node_list],
+            gamma=[node.gamma for node in node_list],
+            add_disturbance=[node.add_disturbance for node in node_list],
+            **kwargs,
+        )
+
+    def g(self, z, z_new=None, edges=None):
+        """
+        Averaging law mean_j (z_j - z_i), over all edges or the given subset. With z_new, the
+        neighbors j < i are read from z_new (sequential sweep).
+        """
+        src = self.src if edges is None else self.src[edges]
+        dst = self.dst if edges is None else self.dst[edges]
+        z_j = z[..., dst] if z_new is None else np.where(dst < src, z_new[..., dst], z[..., dst])
+        return aggregate(z_j - z[..., src], src, self.N) * self.inv_degree
+
+    def _noise(self):
+        noise = np.zeros_like(self.x)
+        if np.any(self.add_disturbance):
+            shape = self.x.shape[:-1] + (int(self.add_disturbance.sum()),)
+            noise[..., self.add_disturbance] = self.rng.normal(0, self.noise_std, size=shape)
+        return noise
+
+    def step(self):
+        self.sigma = self.x - self.z
+        grad = np.sign(self.sigma)
+
+        if self.mode == "sync":
+            gi = self.g(self.z)
+        else:
+            z_new = self.z.copy()
+            gi = np.zeros_like(self.z)
+            for nodes, edges in zip(self.levels, self._level_edges):
+                gi[..., nodes] = self.g(self.z, z_new, edges)[..., nodes]
+                z_new[..., nodes] = self.z[..., nodes] + gi[..., nodes]
+
+        self.u = gi - self.gamma * self.vartheta * grad
+        self.x = self.x + self.u + self._noise()
+        self.z = self.z + gi
+        self.vartheta = self.vartheta + self.eta * grad**2
+        return self.x, self.z, self.vartheta, self.sigma
+
+    def run(self, steps):
+        """
+        Returns:
+            tuple: x, z, vartheta trajectories of shape (..., N, steps), after each step.
+        """
+        x_states = np.zeros(self.x.shape + (steps,))
+        z_states = np.zeros_like(x_states)
+        vartheta = np.zeros_like(x_states)
+        for k in range(steps):
+            self.step()
+            x_states[..., k] = self.x
+            z_states[..., k] = self.z
+            vartheta[..., k] = self.vartheta
+        return x_states, z_states, vartheta
+
+    def write_back(self, node_list):
+        """
+        Copies the current states into Node objects (unbatched engine).
+        """
+        for i, node in enumerate(node_list):
+            node.x, node.z, node.vartheta = self.x[i], self.z[i], self.vartheta[i]
+            node.sigma, node.u = self.sigma[i], self.u[i]
 
+
+# === Simulation ===
+if __name__ == "__main__":
+    N = 9           # Number of agents
+    steps = 100     # Number of time steps
+    eta = 1.0       # Learning rate for vartheta 
+
+    NODES = {
+        1: {'x0': 1000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [4], 'disturbance': False},
+        2: {'x0': 2000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [5], 'disturbance': False},
+        3: {'x0': 3000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [8], 'disturbance': False},
+        4: {'x0': 4000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [7], 'disturbance': False},
+        5: {'x0': 5000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [9], 'disturbance': False},
+        6: {'x0': 6000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [2], 'disturbance': False},
+        7: {'x0': 7000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [3], 'disturbance': False},
+        8: {'x0': 8000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [6], 'disturbance': False},
+        9: {'x0': 9000, 'z0': 5000, 'vartheta0': 0, 'neighbors': [1], 'disturbance': False},
+    }
+
+    # Sequential (in-place) updates, as the Node loop
+    engine = ArrayConsensus.from_nodes(NODES, eta=eta, mode="async")
+    x_states, z_states, vartheta = engine.run(steps)
+
+    # === Plot ===
+
+    plt.figure(figsize=(12, 5))
+    for i in range(N):
+        plt.plot(x_states[i], label=f'Node {i+1} x')
+    plt.title('Node states $x_i$ (solid) and references $z_i$ (dashed)')
+    plt.xlabel('Time step')
+    plt.ylabel('State')
+    plt.legend()
+    plt.grid()
+
+    plt.figure(figsize=(12, 5))
+    for i in range(N):
+        plt.plot(z_states[i], '--', label=f'Node {i+1} z')
+    plt.title('Node references $z_i$ over time')
+    plt.xlabel('Time step')
+    plt.ylabel('Reference')
+    plt.legend()
+    plt.grid()
+
+    plt.figure(figsize=(12, 5))
+    for i in range(N):
+        plt.plot(vartheta[i], label=f'Node {i+1}')
+    plt.title('Adaptive gain $\\vartheta_i$ over time')
+    plt.xlabel('Time step')
+    plt.ylabel('$\\vartheta$')
+    plt.legend()
+    plt.grid()
+
+    plt.show()
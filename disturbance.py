@@ -0,0 +1,155 @@
+#%% Counter-based disturbance generation
+import numpy as np
+
+## Philox4x32-10 (Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC'11)
+PHILOX_M0 = np.uint64(0xD2511F53)
+PHILOX_M1 = np.uint64(0xCD9E8D57)
+PHILOX_W0 = np.uint64(0x9E3779B9)
+PHILOX_W1 = np.uint64(0xBB67AE85)
+MASK32 = np.uint64(0xFFFFFFFF)
+SHIFT32 = np.uint64(32)
+
+def philox4x32(c0, c1, c2, c3, k0, k1, rounds=10):
+    """
+    Philox4x32 block function, vectorized over broadcastable counter words.
+    Words are carried in uint64 arrays holding 32-bit values.
+    Returns:
+        tuple: the four 32-bit output words.
+    """
+    c0, c1, c2, c3 = (np.asarray(c, dtype=np.uint64) & MASK32 for c in (c0, c1, c2, c3))
+    k0, k1 = np.uint64(k0) & MASK32, np.uint64(k1) & MASK32
+    for _ in range(rounds):
+        p0 = PHILOX_M0 * c0
+        p1 = PHILOX_M1 * c2
+        c0, c1, c2, c3 = (
+            (p1 >> SHIFT32) ^ c1 ^ k0,
+            p1 & MASK32,
+            (p0 >> SHIFT32) ^ c3 ^ k1,
+            p0 & MASK32,
+        )
+        k0 = (k0 + PHILOX_W0) & MASK32
+        k1 = (k1 + PHILOX_W1) & MASK32
+    return c0, c1, c2, c3
+
+def _to_unit(hi, lo):
+    """
+    Two 32-bit words --> double in [0, 1) with 53 random bits.
+    """
+    return ((hi >> np.uint64(5)).astype(np.float64) * 67108864.0
+            + (lo >> np.uint64(6)).astype(np.float64)) / 9007199254740992.0
+
+
+class Disturbance:
+    """
+    Bounded disturbance nu_i(t) = amplitude * (U - offset) + beta + A * sin(2*pi*f*(t - phase)),
+    as computed by computeDisturbance() in raspberry/algo.js (and disturbance() in the nRF52 firmware).
+
+    U is drawn from a Philox counter-based generator keyed by the seed, with counter (step, agent),
+    so the value of any (agent, step) does not depend on how the horizon is chunked or how agents
+    are partitioned. With phase=None, the phase is also random for every (agent, step), which is
+    the model used in FTRAC.py. Only one block of `chunk` steps is kept in memory: O(N) instead of
+    the O(N*T) precomputed `nu` matrices.
+    All parameters can be scalars or per-agent arrays.
+    """
+
+    def __init__(self, n_agents, dt, seed=0, amplitude=0.0, offset=0.5, beta=0.0, A=0.0, frequency=10.0,
+                 phase=None, samples=None, enabled=True, chunk=256):
+        self.n_agents = n_agents
+        self.dt = dt
+        self.seed = int(seed)
+        self.agents = np.arange(n_agents, dtype=np.uint64)
+
+        def column(value):
+            return np.broadcast_to(np.asarray(value, dtype=np.float64), (n_agents,))[:, None]
+
+        self.amplitude = column(amplitude)
+        self.offset = column(offset)
+        self.beta = column(beta)
+        self.A = column(A)
+        self.frequency = column(frequency)
+        self.phase = None if phase is None else column(phase)
+        self.samples = samples
+        self.enabled = column(enabled).astype(bool)
+
+        self.chunk = chunk
+        self._k0 = None
+        self._cache = None
+
+    @classmethod
+    def from_params(cls, node_params, seed=0, chunk=256):
+        """
+        Disturbance of a set of devices from their params JSON (as posted by the hub), with
+        the scaled-integer conventions of algo.js setParams().
+        """
+        inv_scale_factor = 1e-6
+
+        def column(key):
+            return np.array([float(p['disturbance'][key]) for p in node_params])
+
+        return cls(
+            n_agents=len(node_params),
+            dt=float(node_params[0]['dt']) * 1e-3,
+            seed=seed,
+            amplitude=column('amplitude') * inv_scale_factor,
+            offset=column('offset') * inv_scale_factor,
+            beta=column('beta') * inv_scale_factor,
+            A=column('Amp') * inv_scale_factor,
+            frequency=column('frequency'),
+            phase=column('phase') * inv_scale_factor,
+            samples=int(node_params[0]['disturbance']['samples']),
+            enabled=[bool(p['disturbance']['disturbance_on']) for p in node_params],
+            chunk=chunk,
+        )
+
+    def uniforms(self, k0, k1, agents=None):
+        """
+        Counter-based uniforms for steps [k0, k1) and the given agents (default: all).
+        Returns:
+            tuple: (u, v) arrays of shape (n_agents, k1 - k0), for the noise and the phase.
+        """
+        agents = self.agents if agents is None else np.asarray(agents, dtype=np.uint64)
+        steps = np.arange(k0, k1, dtype=np.uint64)
+        w0, w1, w2, w3 = philox4x32(steps[None, :], agents[:, None], 0, 0,
+                                    self.seed & 0xFFFFFFFF, (self.seed >> 32) & 0xFFFFFFFF)
+        return _to_unit(w0, w1), _to_unit(w2, w3)
+
+    def block(self, k0, k1, agents=None):
+        """
+        nu for steps [k0, k1).
+        Returns:
+            ndarray: (n_agents, k1 - k0)
+        """
+        rows = slice(None) if agents is None else np.asarray(agents)
+        u, v = self.uniforms(k0, k1, agents)
+        steps = np.arange(k0, k1)
+        if self.samples is not None:
+            steps = steps % self.samples
+        t = steps * self.dt
+        phase = v if self.phase is None else self.phase[rows]
+        nu = self.amplitude[rows] * (u - self.offset[rows]) + self.beta[rows] \
+            + self.A[rows] * np.sin(2.0 * np.pi * self.frequency[rows] * (t - phase))
+        return np.where(self.enabled[rows], nu, 0.0)
+
+    def __call__(self, k):
+        """
+        nu at step k, for all agents. Blocks of `chunk` steps are generated on demand.
+        """
+        if self._k0 is None or not (self._k0 <= k < self._k0 + self.chunk):
+            self._k0 = k
+            self._cache = self.block(k, k + self.chunk)
+        return self._cache[:, k - self._k0]
+
+
+if __name__ == "__main__":
+    # Known-answer tests of Philox4x32-10 (Random123 kat_vectors)
+    out = philox4x32(0, 0, 0, 0, 0, 0)
+    assert [int(w) for w in out] == [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8]
+    out = philox4x32(0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff)
+    assert [int(w) for w in out] == [0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd]
+
+    # Chunking does not change the result
+    nu = Disturbance(n_agents=30, dt=1e-3, seed=42, amplitude=3.0, beta=0.5, A=1.0, chunk=7)
+    full = nu.block(0, 1000)
+    stepped = np.stack([nu(k) for k in range(1000)], axis=1)
+    assert np.array_equal(full, stepped)
+    print(f"nu: mean = {full.mean():.4f}, min = {full.min():.4f}, max = {full.max():.4f}")
@@ -0,0 +1,323 @@
+#%% Graph-partitioned multi-process FTRAC simulation
+import time
+import threading
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+from disturbance import Disturbance
+from laws import make_law, make_controller
+
+## Partitioning
+def csr_from_edges(src, dst, n_agents):
+    """
+    Undirected CSR adjacency (indptr, indices) of the consensus graph.
+    """
+    u = np.concatenate([src, dst])
+    v = np.concatenate([dst, src])
+    order = np.lexsort((v, u))
+    u, v = u[order], v[order]
+    indptr = np.zeros(n_agents + 1, dtype=np.int64)
+    np.add.at(indptr, u + 1, 1)
+    return np.cumsum(indptr), v
+
+def bfs_partition(src, dst, n_agents, n_parts):
+    """
+    Greedy BFS partitioner: grows each part from an unassigned seed in breadth-first
+    order until it holds ceil(n_agents / n_parts) agents, so that parts are connected
+    regions of the graph with a small boundary.
+    Returns:
+        ndarray: part index of every agent.
+    """
+    indptr, indices = csr_from_edges(src, dst, n_agents)
+    part = np.full(n_agents, -1, dtype=np.int64)
+    target = -(-n_agents // n_parts)
+    queue = np.empty(n_agents, dtype=np.int64)
+    next_seed = 0
+
+    for p in range(n_parts):
+        size = 0
+        head = tail = 0
+        while size < target:
+            if head == tail:
+                # Frontier exhausted (disconnected graph or first seed): start from the next free agent
+                while next_seed < n_agents and part[next_seed] >= 0:
+                    next_seed += 1
+                if next_seed == n_agents:
+                    break
+                part[next_seed] = p
+                size += 1
+                queue[tail] = next_seed
+                tail += 1
+                continue
+            i = queue[head]
+            head += 1
+            for j in indices[indptr[i]:indptr[i+1]]:
+                if part[j] < 0 and size < target:
+                    part[j] = p
+                    size += 1
+                    queue[tail] = j
+                    tail += 1
+    return part
+
+## Workers
+def _attach(name, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+def _worker(rank, block, problem, shm_names, barrier, timings):
+    lo, hi = block["lo"], block["hi"]
+    n = hi - lo
+    N = problem["n_agents"]
+    dt = problem["dt"]
+    n_points = problem["n_points"]
+    sample_interval = problem["sample_interval"]
+    record_interval = problem["record_interval"]
+    S = problem["record_points"]
+
+    shm_z, z_shared = _attach(shm_names["exchange"], (2, N))
+    shm_rec, record = _attach(shm_names["record"], (3, N, S))
+    shm_fin, final = _attach(shm_names["final"], (3, N))
+
+    x = problem["x0"][lo:hi].copy()
+    z = problem["z0"][lo:hi].copy()
+    vtheta = problem["vtheta0"][lo:hi].copy()
+    v = np.zeros(n)
+
+    # src local, dst index into [z_local, z_ext]
+    law = make_law(problem["law"], block["src"], block["dst"], n)
+    controller = problem["controller"]
+    controller = make_controller(controller) if isinstance(controller, str) else controller
+    state = controller.init_state(n)
+    boundary = block["boundary"]                   # local indices read by other workers
+    external = block["external"]                   # global indices read from other workers
+    agents = problem["perm"][lo:hi]                # original agent ids (disturbance counter)
+    nu = problem["disturbance"]
+    chunk = max(1, min(nu.chunk, (1 << 22) // max(n, 1)))   # bound the block to ~32 MB
+    nu_block, nu_k0 = None, None
+
+    eta, epsilon_on, epsilon_off = problem["eta"], problem["epsilon_on"], problem["epsilon_off"]
+
+    t_compute = t_wait = 0.0
+    t = 0.0
+    try:
+        for k in range(n_points):
+            t0 = time.perf_counter()
+            if k % record_interval == 0 and k // record_interval < S:
+                s = k // record_interval
+                record[0, lo:hi, s] = x
+                record[1, lo:hi, s] = z
+                record[2, lo:hi, s] = vtheta
+
+            if k % sample_interval == 0:
+                # Boundary exchange: publish own boundary z, then read the neighbors' after the barrier
+                buf = (k // sample_interval) % 2
+                z_shared[buf, lo + boundary] = z[boundary]
+                t1 = time.perf_counter()
+                barrier.wait()
+                t_wait += time.perf_counter() - t1
+                v = law(z, z_shared[buf, external])
+
+            if nu_k0 is None or k >= nu_k0 + chunk:
+                nu_k0 = k
+                nu_block = nu.block(k, k + chunk, agents=agents)
+
+            u, dvtheta, dstate = controller(x, z, vtheta, v, state, eta, epsilon_on, epsilon_off)
+
+            x = x + dt * (u + nu_block[:, k - nu_k0])
+            z = z + dt * v
+            vtheta = vtheta + dt * dvtheta
+            for key, value in dstate.items():
+                state[key] = state[key] + dt * value
+            t += dt
+            t_compute += time.perf_counter() - t0
+
+        final[0, lo:hi] = x
+        final[1, lo:hi] = z
+        final[2, lo:hi] = vtheta
+        timings[rank] = t_compute - t_wait
+    except threading.BrokenBarrierError:
+        # Another worker failed: stop without a traceback of our own
+        raise SystemExit(1)
+    except BaseException:
+        # Release the workers waiting at the barrier, which would otherwise block forever
+        barrier.abort()
+        raise
+    finally:
+        for shm in (shm_z, shm_rec, shm_fin):
+            shm.close()
+
+def _join(workers, barrier, grace=5.0):
+    """
+    Waits for the workers. On the first one exiting with a non-zero code (exception, or killed
+    by a signal before it could abort the barrier), breaks the barrier so that the others stop,
+    terminates those still running after `grace` seconds and raises.
+    """
+    pending = {w.sentinel: rank for rank, w in enumerate(workers)}
+    while pending:
+        for sentinel in wait(list(pending)):
+            rank = pending.pop(sentinel)
+            workers[rank].join()
+            if workers[rank].exitcode == 0:
+                continue
+            barrier.abort()
+            deadline = time.monotonic() + grace
+            for w in workers:
+                w.join(max(deadline - time.monotonic(), 0.0))
+                if w.is_alive():
+                    w.terminate()
+                    w.join()
+            raise RuntimeError(f"worker {rank} failed with exit code {workers[rank].exitcode}")
+
+## Driver
+def simulate_partitioned(src, dst, init_conditions, params, n_workers=4, sample_time=0.2,
+                         record_interval=None, part=None):
+    """
+    Domain-decomposed version of the sampled Euler dynamics (simulate_sampled_dynamics_euler /
+    simulate_ensemble in FTRAC.py) for very large graphs.
+
+    Agents are partitioned over n_workers processes (bfs_partition by default). Each worker
+    integrates its block locally and, at every consensus sample, publishes only its boundary z
+    values to a double-buffered multiprocessing.shared_memory array and reads the external ones
+    it needs after a barrier. The disturbance is counter-based and indexed by the original agent
+    id, so the result does not depend on the number of workers.
+
+    Args:
+        src, dst (ndarray): edge list, agent src[e] reads agent dst[e] (0-based, see FTRAC.edge_list).
+        init_conditions (dict): {"x", "z", "vtheta"} arrays of shape (n_agents,).
+        params (dict): "dt", "n_points", "eta", "epsilon_on", "epsilon_off", "disturbance", and
+                       optionally "law" (name) and "controller" (laws.py registry, as simulate_ensemble).
+    Returns:
+        dict: 'x', 'z', 'vtheta' final states, 'record' (3, n_agents, S) sampled trajectories,
+              'part', 'boundary_fraction', 'wall_time', 'compute_time' (per worker).
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    N = len(init_conditions["x"])
+    dt = params["dt"]
+    n_points = params["n_points"]
+    sample_interval = max(1, int(sample_time / dt))
+    record_interval = record_interval or sample_interval
+    S = -(-n_points // record_interval)
+
+    if part is None:
+        part = bfs_partition(src, dst, N, n_workers) if n_workers > 1 else np.zeros(N, dtype=np.int64)
+
+    # Renumber agents so that every part is a contiguous block
+    perm = np.argsort(part, kind="stable")
+    rank_of = np.empty(N, dtype=np.int64)
+    rank_of[perm] = np.arange(N)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(part, minlength=n_workers))])
+    src_r, dst_r = rank_of[src], rank_of[dst]
+    # Stable: every agent sums its neighbors in the original edge order, for any partition
+    order = np.argsort(src_r, kind="stable")
+    src_r, dst_r = src_r[order], dst_r[order]
+
+    blocks = []
+    n_boundary = 0
+    for p in range(n_workers):
+        lo, hi = offsets[p], offsets[p+1]
+        mine = (src_r >= lo) & (src_r < hi)
+        e_src, e_dst = src_r[mine] - lo, dst_r[mine]
+        remote = (e_dst < lo) | (e_dst >= hi)
+        external = np.unique(e_dst[remote])
+        dst_local = np.where(remote, hi - lo + np.searchsorted(external, e_dst), e_dst - lo)
+        # Local agents read by other parts
+        reads = (src_r < lo) | (src_r >= hi)
+        boundary = np.unique(dst_r[reads & (dst_r >= lo) & (dst_r < hi)]) - lo
+        n_boundary += boundary.size
+        blocks.append({"lo": lo, "hi": hi, "src": e_src, "dst": dst_local,
+                       "boundary": boundary, "external": external})
+
+    problem = {
+        "n_agents": N, "dt": dt, "n_points": n_points, "sample_interval": sample_interval,
+        "record_interval": record_interval, "record_points": S, "perm": perm,
+        "x0": np.asarray(init_conditions["x"], dtype=np.float64)[perm],
+        "z0": np.asarray(init_conditions["z"], dtype=np.float64)[perm],
+        "vtheta0": np.asarray(init_conditions["vtheta"], dtype=np.float64)[perm],
+        "eta": params["eta"], "epsilon_on": params["epsilon_on"], "epsilon_off": params["epsilon_off"],
+        "disturbance": params["disturbance"],
+        "law": params.get("law", "sqrt_sign"),
+        "controller": params.get("controller", "adaptive_integral"),
+    }
+
+    shms = {
+        "exchange": shared_memory.SharedMemory(create=True, size=2 * N * 8),
+        "record": shared_memory.SharedMemory(create=True, size=3 * N * S * 8),
+        "final": shared_memory.SharedMemory(create=True, size=3 * N * 8),
+    }
+    try:
+        ctx = mp.get_context("fork")
+        barrier = ctx.Barrier(n_workers)
+        timings = ctx.Array('d', n_workers)
+        names = {key: shm.name for key, shm in shms.items()}
+        workers = [ctx.Process(target=_worker, args=(p, blocks[p], problem, names, barrier, timings))
+                   for p in range(n_workers)]
+        t0 = time.perf_counter()
+        for w in workers:
+            w.start()
+        _join(workers, barrier)
+        wall = time.perf_counter() - t0
+
+        record = np.ndarray((3, N, S), dtype=np.float64, buffer=shms["record"].buf)[:, rank_of, :].copy()
+        final = np.ndarray((3, N), dtype=np.float64, buffer=shms["final"].buf)[:, rank_of].copy()
+    finally:
+        for shm in shms.values():
+            shm.close()
+            shm.unlink()
+
+    return {
+        "x": final[0], "z": final[1], "vtheta": final[2], "record": record, "part": part,
+        "boundary_fraction": n_boundary / N, "wall_time": wall, "compute_time": list(timings),
+    }
+
+def scaling_report(src, dst, init_conditions, params, workers=(1, 2, 4, 8), sample_time=0.2):
+    """
+    Strong-scaling report: wall time, speedup and parallel efficiency per number of workers,
+    and the maximum deviation of the final states from the single-worker run.
+    """
+    report = []
+    reference = None
+    for n_workers in workers:
+        result = simulate_partitioned(src, dst, init_conditions, params, n_workers=n_workers,
+                                      sample_time=sample_time, record_interval=params["n_points"])
+        if reference is None:
+            reference = result
+        speedup = reference["wall_time"] / result["wall_time"]
+        report.append({
+            "workers": n_workers,
+            "wall_time": result["wall_time"],
+            "speedup": speedup,
+            "efficiency": speedup * workers[0] / n_workers,
+            "agent_steps_per_second": len(result["x"]) * params["n_points"] / result["wall_time"],
+            "boundary_fraction": result["boundary_fraction"],
+            "max_deviation": float(np.max(np.abs(result["z"] - reference["z"]))),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    import os
+
+    # 2D lattice with 4-neighborhood: N = side^2 agents
+    side = 500
+    N = side * side
+    idx = np.arange(N).reshape(side, side)
+    pairs = [(idx[:, :-1], idx[:, 1:]), (idx[:-1, :], idx[1:, :])]
+    src = np.concatenate([np.concatenate([a.ravel(), b.ravel()]) for a, b in pairs])
+    dst = np.concatenate([np.concatenate([b.ravel(), a.ravel()]) for a, b in pairs])
+
+    dt = 1e-3
+    rng = np.random.default_rng(42)
+    init_conditions = {"x": rng.uniform(0, 10, N), "z": rng.uniform(0, 10, N), "vtheta": np.zeros(N)}
+    params = {
+        "dt": dt, "n_points": 200, "eta": 0.5, "epsilon_on": 0.050, "epsilon_off": 0.010,
+        "disturbance": Disturbance(N, dt, seed=42, amplitude=3.0, offset=0.5, beta=0.5, A=1.0, frequency=10),
+    }
+
+    workers = [w for w in (1, 2, 4, 8, 16) if w <= os.cpu_count()]
+    print(f"{'workers':>8s} {'wall [s]':>10s} {'speedup':>8s} {'eff.':>6s} {'agent-steps/s':>14s} {'boundary':>9s} {'max dev':>9s}")
+    for r in scaling_report(src, dst, init_conditions, params, workers=workers, sample_time=10 * dt):
+        print(f"{r['workers']:8d} {r['wall_time']:10.3f} {r['speedup']:8.2f} {r['efficiency']:6.2f} "
+              f"{r['agent_steps_per_second']:14.3e} {r['boundary_fraction']:9.4f} {r['max_deviation']:9.2e}")
@@ -0,0 +1,176 @@
+#%% Lightweight instrumentation of the simulators
+import json
+import time
+import functools
+import tracemalloc
+from collections import defaultdict
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+class _Phase:
+    __slots__ = ("profiler", "name", "t0")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        profiler = self.profiler
+        path = ";".join(profiler.stack)
+        profiler.inclusive[path] += elapsed
+        profiler.calls[path] += 1
+        profiler.stack.pop()
+        return False
+
+
+class Profiler:
+    """
+    Per-phase timers and counters for the simulator hot paths.
+
+    Phases nest (`with PROFILER.phase("consensus"): ...`) and are accumulated per call stack,
+    so the totals can be exported as JSON or as folded stacks ("a;b;c <microseconds>", the
+    input of flamegraph.pl and speedscope). When disabled, phase() returns a shared no-op
+    context and count() returns immediately, so the hooks can stay in the hot loops.
+    With track_allocations, step() also records the bytes allocated (tracemalloc peak) per step.
+    """
+
+    def __init__(self, enabled=False, track_allocations=False):
+        self.enabled = enabled
+        self.track_allocations = track_allocations
+        self.reset()
+
+    def reset(self):
+        self.stack = []
+        self.inclusive = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.step_alloc_bytes = []
+        self._wall0 = time.perf_counter()
+
+    def enable(self, track_allocations=None):
+        self.enabled = True
+        if track_allocations is not None:
+            self.track_allocations = track_allocations
+        if self.track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def timed(self, name):
+        """
+        Decorator timing every call of a function as a phase.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Phase(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def step(self):
+        """
+        Marks the end of a simulation step (step counter and per-step allocations).
+        """
+        if not self.enabled:
+            return
+        self.counters["steps"] += 1
+        if self.track_allocations and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.step_alloc_bytes.append(peak - current)
+            tracemalloc.reset_peak()
+
+    def self_times(self):
+        """
+        Exclusive time per call stack (inclusive time minus that of the direct children).
+        """
+        exclusive = dict(self.inclusive)
+        for path, elapsed in self.inclusive.items():
+            parent = path.rpartition(";")[0]
+            if parent in exclusive:
+                exclusive[parent] -= elapsed
+        return exclusive
+
+    def summary(self):
+        """
+        Returns:
+            dict: 'phases' {stack: {'calls', 'total', 'self'}} (seconds), 'counters',
+                  'alloc_bytes_per_step' (mean and max, if tracked) and 'wall_time'.
+        """
+        exclusive = self.self_times()
+        result = {
+            "wall_time": time.perf_counter() - self._wall0,
+            "phases": {path: {"calls": self.calls[path], "total": self.inclusive[path], "self": exclusive[path]}
+                       for path in sorted(self.inclusive)},
+            "counters": dict(self.counters),
+        }
+        if self.step_alloc_bytes:
+            result["alloc_bytes_per_step"] = {
+                "mean": sum(self.step_alloc_bytes) / len(self.step_alloc_bytes),
+                "max": max(self.step_alloc_bytes),
+            }
+        return result
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def collapsed(self):
+        """
+        Folded stacks with exclusive times in microseconds.
+        """
+        return "\n".join(f"{path} {max(int(round(elapsed * 1e6)), 0)}"
+                         for path, elapsed in sorted(self.self_times().items())) + "\n"
+
+    def save_collapsed(self, path):
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+    def report(self, top=10):
+        """
+        Text table of the phases with the largest exclusive time.
+        """
+        summary = self.summary()
+        total = sum(p["self"] for p in summary["phases"].values()) or 1.0
+        lines = [f"{'phase':<60s} {'calls':>9s} {'self [s]':>10s} {'%':>6s}"]
+        for path, p in sorted(summary["phases"].items(), key=lambda kv: -kv[1]["self"])[:top]:
+            lines.append(f"{path:<60s} {p['calls']:9d} {p['self']:10.4f} {100 * p['self'] / total:6.1f}")
+        lines.append("  ".join(f"{name}={value}" for name, value in sorted(summary["counters"].items())))
+        if "alloc_bytes_per_step" in summary:
+            lines.append(f"allocated per step: mean {summary['alloc_bytes_per_step']['mean']:.0f} B, "
+                         f"max {summary['alloc_bytes_per_step']['max']} B")
+        return "\n".join(lines)
+
+# Shared instance used by the hooks in FTRAC.py (disabled by default)
+PROFILER = Profiler()
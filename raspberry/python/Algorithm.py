@@ -0,0 +1,231 @@
+import numpy as np
+
+class Algorithm:
+    """
+    Python reference of the edge-device consensus update (raspberry/algo.js),
+    vectorized over a batch of virtual nodes.
+
+    Node i of the batch is configured with the same params JSON the hub posts to
+    `/updateParams` of its backend: {node, neighbors, enabled, clock, dt, state,
+    vstate, vartheta, eta, disturbance: {...}}. Neighbor virtual states are passed
+    as a padded (n_nodes, max_neighbors) matrix of scaled integers, in the order
+    of each node's `neighbors` list, together with a boolean enabled mask.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def nodes_from_hub_params(hub_params):
+        """
+        Expands the hub-level params ({trigger, filename, nodes: {id: {...}}}) into the
+        per-node params list the hub posts to every backend.
+        """
+        nodes = hub_params['nodes']
+        return [
+            {'trigger': hub_params.get('trigger', False),
+             'filename': hub_params.get('filename'),
+             'node': int(node_id),
+             **nodes[node_id]}
+            for node_id in sorted(nodes, key=int)
+        ]
+
+    def set_params(self, params):
+        """
+        algo.js setParams(), for a list of per-node params (or a single dict).
+        """
+        if isinstance(params, dict):
+            params = [params]
+        self.params = params
+        self.n_nodes = len(params)
+
+        # Controller parameters:
+        self.scale_factor = 1e6
+        self.inv_scale_factor = 1e-6
+        self.active = np.zeros(self.n_nodes, dtype=bool)
+        self.epsilonON = 0.050
+        self.epsilonOFF = 0.010
+
+        def column(key, dtype=np.float64):
+            return np.array([p[key] for p in params], dtype=dtype)
+
+        def dist_column(key, dtype=np.float64):
+            return np.array([p['disturbance'][key] for p in params], dtype=dtype)
+
+        self.dt = column('dt') * 1e-3                    # Convert ms to seconds
+        self.clock = column('clock')                     # Network period [ms]
+        self.enabled = column('enabled', bool)
+        self.state0 = column('state') * self.inv_scale_factor
+        self.vstate0 = column('vstate') * self.inv_scale_factor
+        self.vartheta0 = column('vartheta') * self.inv_scale_factor
+        self.eta = column('eta') * self.inv_scale_factor
+
+        # --- DISTURBANCE PARAMETERS (Matching the Nordic structure) ---
+        self.dist_on = dist_column('disturbance_on', bool)
+        self.dist_offset = dist_column('offset') * self.inv_scale_factor
+        self.dist_amplitude = dist_column('amplitude') * self.inv_scale_factor
+        self.dist_beta = dist_column('beta') * self.inv_scale_factor
+        self.dist_A = dist_column('Amp') * self.inv_scale_factor
+        self.dist_frequency = dist_column('frequency')
+        self.dist_phase_shift = dist_column('phase') * self.inv_scale_factor
+        self.samples = dist_column('samples', np.int64)
+
+        # Neighbor structure: padded index matrix into the batch (-1 = not in batch)
+        index = {int(p['node']): i for i, p in enumerate(params)}
+        max_deg = max((len(p['neighbors']) for p in params), default=0)
+        self.neighbor_index = np.full((self.n_nodes, max_deg), -1, dtype=np.int64)
+        for i, p in enumerate(params):
+            for j, neighbor in enumerate(p['neighbors']):
+                self.neighbor_index[i, j] = index.get(int(neighbor), -1)
+        self.neighbor_mask = self.neighbor_index >= 0
+
+    def reset_initial_conditions(self):
+        self.state = self.state0.copy()
+        self.vstate = self.vstate0.copy()
+        self.vartheta = self.vartheta0.copy()
+        self.cnt = np.zeros(self.n_nodes, dtype=np.int64)
+        self.sigma = np.zeros(self.n_nodes)
+        self.grad = np.zeros(self.n_nodes)
+        self.gi = np.zeros(self.n_nodes)
+
+        # Latest neighbor snapshot, as read by the fast loop in edge.js
+        self.neighbor_vstates = np.zeros(self.neighbor_index.shape, dtype=np.int64)
+        self.neighbor_enabled = np.zeros(self.neighbor_index.shape, dtype=bool)
+
+    def v_i(self, neighbor_vstates, neighbor_enabled):
+        diff = self.vstate[:, None] - neighbor_vstates * self.inv_scale_factor
+        terms = -np.sign(diff) * np.sqrt(np.abs(diff))
+        return np.sum(np.where(neighbor_enabled, terms, 0.0), axis=1)
+
+    def compute_disturbance(self):
+        t = self.cnt * self.dt
+        m = self.dist_amplitude * (self.rng.random(self.n_nodes) - self.dist_offset)
+        sinusoidal = self.dist_A * np.sin(
+            2.0 * np.pi * self.dist_frequency * (t - self.dist_phase_shift)
+        )
+        return np.where(self.dist_on, m + self.dist_beta + sinusoidal, 0.0)
+
+    def update(self, neighbor_vstates, neighbor_enabled, mask=None):
+        """
+        algo.js update() for every node of the batch (or only where `mask` is True).
+        Args:
+            neighbor_vstates (ndarray): (n_nodes, max_neighbors) scaled integer vstates.
+            neighbor_enabled (ndarray): (n_nodes, max_neighbors) bool.
+            mask (ndarray): optional (n_nodes,) bool, nodes to update.
+        Returns:
+            dict: scaled integer 'state', 'vstate', 'vartheta' arrays, as logged by the devices.
+        """
+        if mask is None:
+            mask = np.ones(self.n_nodes, dtype=bool)
+
+        disturbance = self.compute_disturbance()
+        gi = self.v_i(neighbor_vstates, neighbor_enabled)
+        sigma = self.state - self.vstate
+        grad = np.sign(sigma)
+        u = gi - self.vartheta * grad
+
+        # Hysteresis on |sigma| (epsilonON to switch on, epsilonOFF to switch off)
+        abs_sigma = np.abs(sigma)
+        active = np.where(self.active, abs_sigma > self.epsilonOFF, abs_sigma > self.epsilonON)
+        dvtheta = np.where(active, self.eta, 0.0)
+
+        self.active = np.where(mask, active, self.active)
+        self.gi = np.where(mask, gi, self.gi)
+        self.sigma = np.where(mask, sigma, self.sigma)
+        self.grad = np.where(mask, grad, self.grad)
+        self.state = np.where(mask, np.maximum(0.0, self.state + self.dt * (u + disturbance)), self.state)
+        self.vstate = np.where(mask, np.maximum(0.0, self.vstate + self.dt * gi), self.vstate)
+        self.vartheta = np.where(mask, np.maximum(0.0, self.vartheta + self.dt * dvtheta), self.vartheta)
+        self.cnt = np.where(mask, (self.cnt + 1) % self.samples, self.cnt)
+
+        return self.scaled()
+
+    def scaled(self):
+        return {
+            'state': np.floor(self.state * self.scale_factor).astype(np.int64),
+            'vstate': np.floor(self.vstate * self.scale_factor).astype(np.int64),
+            'vartheta': np.floor(self.vartheta * self.scale_factor).astype(np.int64),
+        }
+
+    def refresh_neighbors(self, mask=None):
+        """
+        Network fetch (slow loop in edge.js): nodes in `mask` read the current scaled
+        vstate and enabled flag of their neighbors in the batch.
+        """
+        if mask is None:
+            mask = np.ones(self.n_nodes, dtype=bool)
+        idx = np.where(self.neighbor_mask, self.neighbor_index, 0)
+        vstates = self.scaled()['vstate'][idx]
+        enabled = self.enabled[idx] & self.neighbor_mask
+        self.neighbor_vstates = np.where(mask[:, None], vstates, self.neighbor_vstates)
+        self.neighbor_enabled = np.where(mask[:, None], enabled, self.neighbor_enabled)
+
+    def run(self, duration_ms):
+        """
+        Offline replay of a whole network: dynamics every dt, neighbor snapshot
+        refreshed and one log line recorded every `clock` ms per node.
+        Args:
+            duration_ms (float): experiment duration [ms].
+        Returns:
+            dict: per-node logs {'timestamp', 'state', 'vstate', 'vartheta'}, each
+                  an (n_nodes, n_samples) int64 array; rows of nodes with a longer
+                  clock are padded with their last value.
+        """
+        dt_ms = self.dt * 1e3
+        tick_ms = np.min(dt_ms)
+        n_steps = int(duration_ms // tick_ms)
+        steps_per_dt = np.maximum(1, np.rint(dt_ms / tick_ms)).astype(np.int64)
+        steps_per_clock = np.maximum(1, np.rint(self.clock / tick_ms)).astype(np.int64)
+        n_samples = int(n_steps // np.min(steps_per_clock))
+
+        logs = {key: np.zeros((self.n_nodes, n_samples), dtype=np.int64)
+                for key in ('timestamp', 'state', 'vstate', 'vartheta')}
+        sample_idx = np.zeros(self.n_nodes, dtype=np.int64)
+        rows = np.arange(self.n_nodes)
+
+        for k in range(1, n_steps + 1):
+            self.update(self.neighbor_vstates, self.neighbor_enabled,
+                        mask=self.enabled & (k % steps_per_dt == 0))
+
+            network = (k % steps_per_clock == 0)
+            if np.any(network):
+                self.refresh_neighbors(network)
+                scaled = self.scaled()
+                record = network & (sample_idx < n_samples)
+                cols = sample_idx[record]
+                logs['timestamp'][rows[record], cols] = int(k * tick_ms)
+                for key in ('state', 'vstate', 'vartheta'):
+                    logs[key][rows[record], cols] = scaled[key][record]
+                sample_idx += record
+
+        # Pad nodes with fewer samples with their last value
+        for i in range(self.n_nodes):
+            if 0 < sample_idx[i] < n_samples:
+                for key in logs:
+                    logs[key][i, sample_idx[i]:] = logs[key][i, sample_idx[i] - 1]
+        return logs
+
+
+if __name__ == "__main__":
+    import json
+
+    # Replay the configuration of a logged experiment offline
+    sim_name = "30node-clusters"
+    num_agents = 30
+    node_params = []
+    for i in range(1, num_agents + 1):
+        with open(f"../data/{sim_name}/{i}.json", 'r') as f:
+            content = json.load(f)
+        content = json.loads(content) if isinstance(content, str) else content
+        if 'params' in content:
+            node_params.append(content['params'])
+
+    algo = Algorithm(seed=42)
+    algo.set_params(node_params)
+    algo.reset_initial_conditions()
+    algo.refresh_neighbors()
+    logs = algo.run(duration_ms=10_000)
+    sigma = (logs['state'] - logs['vstate']) / algo.scale_factor
+    print(f"Replayed {algo.n_nodes} nodes, {logs['state'].shape[1]} samples each")
+    print(f"Final |sigma| max = {np.max(np.abs(sigma[:, -1])):.4f}, "
+          f"z-spread = {np.ptp(logs['vstate'][:, -1]) / algo.scale_factor:.4f}")
@@ -0,0 +1,286 @@
+import os
+import csv
+import json
+import numpy as np
+
+class ChatteringAnalysis:
+    """
+    Sliding-mode chattering analytics over the device logs of a whole network.
+
+    The logs of all nodes are stacked into (nodes x samples) arrays, padded with NaN past the
+    end of the shorter logs, and every metric comes from vectorized diffs and run-length
+    encodings of these arrays:
+    - sign switches of sigma = x - z (all switches, and switches inside the epsilon_on band),
+    - dwell times inside the inner band |sigma| <= epsilon_off and inside the hysteresis band
+      epsilon_off < |sigma| <= epsilon_on,
+    - duty cycle and activations of the adaptive gain, both reconstructed from the hysteresis
+      on the logged sigma and measured from the increments of the logged vartheta.
+    Thresholds default to the device values of algo.js.
+    """
+    QUANTILES = (0.5, 0.95)
+
+    def __init__(self, simulation_dir, num_agents, epsilon_on=0.050, epsilon_off=0.010, conversion_factor=1e6):
+        self.simulation_dir = simulation_dir
+        self.num_agents = num_agents
+        self.epsilon_on = epsilon_on
+        self.epsilon_off = epsilon_off
+        self.conversion_factor = conversion_factor
+
+        self.node_ids = []
+        self.lengths = None     # (nodes,) number of valid samples
+        self.t = None           # (nodes, samples) timestamps [s]
+        self.sigma = None       # (nodes, samples) tracking error x - z
+        self.vartheta = None    # (nodes, samples) adaptive gain
+
+    def load_data(self):
+        columns = {}
+        for i in range(1, self.num_agents + 1):
+            filename = f"{self.simulation_dir}/{i}.json"
+
+            if not os.path.exists(filename):
+                print(f"[Warning] File not found: {filename}")
+                continue
+
+            with open(filename, 'r') as f:
+                raw_content = json.load(f)
+
+            # Handle string-wrapped JSON (double encoded)
+            if isinstance(raw_content, str):
+                try:
+                    content = json.loads(raw_content)
+                except json.JSONDecodeError:
+                    print(f"[Error] Failed to decode JSON string in {filename}")
+                    continue
+            else:
+                content = raw_content
+            data_dict = content.get('data', {})
+
+            node = [np.asarray(data_dict.get(key, []), dtype=np.int64)
+                    for key in ('timestamp', 'state', 'vstate', 'vartheta')]
+            min_len = min(len(column) for column in node)
+            if min_len < 2:
+                print(f"[Warning] Not enough samples in file: {filename}")
+                continue
+            columns[i] = [column[:min_len] for column in node]
+
+        self.node_ids = sorted(columns)
+        n_nodes = len(self.node_ids)
+        self.lengths = np.array([len(columns[i][0]) for i in self.node_ids], dtype=np.int64)
+        n_samples = int(self.lengths.max()) if n_nodes else 0
+
+        self.t = np.full((n_nodes, n_samples), np.nan)
+        self.sigma = np.full((n_nodes, n_samples), np.nan)
+        self.vartheta = np.full((n_nodes, n_samples), np.nan)
+        for row, i in enumerate(self.node_ids):
+            timestamp, state, vstate, vartheta = columns[i]
+            n = len(timestamp)
+            self.t[row, :n] = timestamp / 1000.0
+            self.sigma[row, :n] = (state - vstate) / self.conversion_factor
+            self.vartheta[row, :n] = vartheta / self.conversion_factor
+
+    @staticmethod
+    def run_lengths(mask):
+        """
+        Run-length encoding of the True runs of every row of a 2D boolean array.
+        Returns:
+            tuple: (rows, starts, lengths) of all runs, sorted by row then start.
+        """
+        n_rows = mask.shape[0]
+        padded = np.zeros((n_rows, mask.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        rows, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        return rows, starts, ends - starts
+
+    def hysteresis(self):
+        """
+        Gain activation of the device hysteresis (algo.js) replayed on the logged sigma:
+        switched on when |sigma| > epsilon_on, off when |sigma| <= epsilon_off, held in between.
+        The state at every sample is the outcome of the last on/off event, found with a running
+        maximum of the event indices instead of a loop over samples.
+        Returns:
+            np.ndarray: (nodes, samples) boolean activation.
+        """
+        abs_sigma = np.abs(self.sigma)
+        on = abs_sigma > self.epsilon_on
+        event = on | (abs_sigma <= self.epsilon_off)
+        index = np.where(event, np.arange(self.sigma.shape[1]), -1)
+        last = np.maximum.accumulate(index, axis=1)
+        rows = np.arange(self.sigma.shape[0])[:, None]
+        return (last >= 0) & on[rows, np.maximum(last, 0)]
+
+    def _dwell_statistics(self, mask, periods):
+        """
+        Per-node count, mean, quantiles and maximum of the durations [s] of the True runs of
+        mask. Quantiles are read from the runs sorted by (node, length), without grouping loops.
+        """
+        n_nodes = mask.shape[0]
+        rows, _, lengths = self.run_lengths(mask)
+        durations = lengths * periods[rows]
+        count = np.bincount(rows, minlength=n_nodes)
+        total = np.bincount(rows, weights=durations, minlength=n_nodes)
+
+        # Runs sorted by (node, duration); a trailing NaN is read by the nodes without runs
+        order = np.lexsort((durations, rows))
+        sorted_durations = np.append(durations[order], np.nan)
+        offsets = np.cumsum(count) - count
+        empty = len(durations)
+        stats = {
+            'runs': count,
+            'mean': np.where(count > 0, total / np.maximum(count, 1), np.nan),
+        }
+        for q in self.QUANTILES:
+            idx = offsets + np.floor(q * (count - 1)).astype(np.int64)
+            stats[f"p{int(q * 100)}"] = sorted_durations[np.where(count > 0, idx, empty)]
+        stats['max'] = sorted_durations[np.where(count > 0, offsets + count - 1, empty)]
+        return stats
+
+    def node_metrics(self):
+        """
+        Chattering metrics of every node, as (nodes,) arrays.
+        Returns:
+            dict: {metric: np.ndarray}, rates in switches (activations) per second,
+                  durations in seconds, fractions in [0, 1].
+        """
+        n_nodes, n_samples = self.sigma.shape
+        valid = np.arange(n_samples) < self.lengths[:, None]
+        last = self.lengths - 1
+        rows = np.arange(n_nodes)
+        duration = self.t[rows, last] - self.t[:, 0]
+        periods = np.nanmedian(np.diff(self.t, axis=1), axis=1)
+
+        abs_sigma = np.abs(self.sigma)
+        inner = valid & (abs_sigma <= self.epsilon_off)
+        band = valid & (abs_sigma > self.epsilon_off) & (abs_sigma <= self.epsilon_on)
+
+        # Sign switches (NaN padding compares False)
+        sign = np.sign(self.sigma)
+        switch = sign[:, 1:] * sign[:, :-1] < 0
+        switches = np.count_nonzero(switch, axis=1)
+        in_band = (abs_sigma[:, 1:] <= self.epsilon_on) & (abs_sigma[:, :-1] <= self.epsilon_on)
+        band_switches = np.count_nonzero(switch & in_band, axis=1)
+        band_time = np.count_nonzero(valid & (abs_sigma <= self.epsilon_on), axis=1) * periods
+
+        # Adaptive gain: replayed hysteresis and measured vartheta increments
+        active = self.hysteresis() & valid
+        activations = np.count_nonzero(active[:, 1:] & ~active[:, :-1], axis=1) + active[:, 0]
+        increasing = np.diff(self.vartheta, axis=1) > 0
+
+        inner_dwell = self._dwell_statistics(inner, periods)
+        band_dwell = self._dwell_statistics(band, periods)
+        safe_duration = np.where(duration > 0, duration, np.nan)
+        metrics = {
+            'samples': self.lengths,
+            'duration': duration,
+            'period': periods,
+            'switches': switches,
+            'switch_rate': switches / safe_duration,
+            'band_switch_rate': np.where(band_time > 0, band_switches / np.where(band_time > 0, band_time, 1.0), 0.0),
+            'inner_fraction': np.count_nonzero(inner, axis=1) / self.lengths,
+            'band_fraction': np.count_nonzero(band, axis=1) / self.lengths,
+            'duty_cycle': np.count_nonzero(active, axis=1) / self.lengths,
+            'activations': activations,
+            'activation_rate': activations / safe_duration,
+            'measured_duty_cycle': np.count_nonzero(increasing, axis=1) / np.maximum(self.lengths - 1, 1),
+        }
+        metrics.update({f"inner_dwell_{key}": value for key, value in inner_dwell.items()})
+        metrics.update({f"band_dwell_{key}": value for key, value in band_dwell.items()})
+        return metrics
+
+    def network_summary(self, metrics=None):
+        """
+        One-row summary of the network: node means (and worst node for the switching rate).
+        """
+        metrics = self.node_metrics() if metrics is None else metrics
+        summary = {
+            'experiment': os.path.basename(os.path.normpath(self.simulation_dir)),
+            'nodes': len(self.node_ids),
+            'samples': int(np.sum(metrics['samples'])),
+            'max_switch_rate': float(np.nanmax(metrics['switch_rate'])),
+            'worst_node': int(self.node_ids[int(np.nanargmax(metrics['switch_rate']))]),
+        }
+        for key in ('switch_rate', 'band_switch_rate', 'inner_fraction', 'band_fraction', 'duty_cycle',
+                    'measured_duty_cycle', 'activation_rate', 'inner_dwell_mean', 'inner_dwell_p95',
+                    'band_dwell_mean'):
+            values = metrics[key]
+            summary[key] = float(np.nanmean(values)) if np.any(np.isfinite(values)) else None
+        return summary
+
+    def chattering_results(self, save=True):
+        """
+        Computes the per-node metrics and the network summary.
+        Returns:
+            dict: {'nodes': {node_id: {...}}, 'network': {...}}
+        """
+        metrics = self.node_metrics()
+        nodes = {
+            node_id: {key: (None if not np.isfinite(values[row]) else
+                            int(values[row]) if np.issubdtype(values.dtype, np.integer) else float(values[row]))
+                      for key, values in metrics.items()}
+            for row, node_id in enumerate(self.node_ids)
+        }
+        results = {'nodes': nodes, 'network': self.network_summary(metrics)}
+
+        if save:
+            with open(f"{self.simulation_dir}/chattering_results.json", 'w') as f:
+                json.dump(results, f, indent=4)
+            print(f"Chattering results saved to {self.simulation_dir}/chattering_results.json")
+        return results
+
+
+def summarize_archive(data_root, output_csv=None, **kwargs):
+    """
+    Network summary of every experiment directory under data_root (directories holding
+    <node>.json logs), as a compact table.
+    Args:
+        output_csv (str): optional path of a CSV copy of the table.
+        kwargs: thresholds passed to ChatteringAnalysis.
+    Returns:
+        list: one summary dict per experiment.
+    """
+    rows = []
+    for name in sorted(os.listdir(data_root)):
+        directory = os.path.join(data_root, name)
+        if not os.path.isdir(directory):
+            continue
+        node_files = [int(f[:-5]) for f in os.listdir(directory) if f.endswith('.json') and f[:-5].isdigit()]
+        if not node_files:
+            continue
+        analysis = ChatteringAnalysis(directory, max(node_files), **kwargs)
+        analysis.load_data()
+        if not analysis.node_ids:
+            continue
+        rows.append(analysis.network_summary())
+
+    if output_csv is not None and rows:
+        with open(output_csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Chattering summary saved to {output_csv}")
+    return rows
+
+
+if __name__ == "__main__":
+    import time
+
+    sim_name = "30node-clusters"
+    num_agents = 30
+    chattering = ChatteringAnalysis(simulation_dir=f"../data/{sim_name}", num_agents=num_agents)
+    chattering.load_data()
+    results = chattering.chattering_results(save=False)
+    ranking = sorted(results['nodes'], key=lambda n: results['nodes'][n]['switch_rate'] or 0.0, reverse=True)
+    for node_id in ranking[:5]:
+        node = results['nodes'][node_id]
+        print(f"Node {node_id}: {node['switch_rate']:.2f} switches/s, duty cycle = {node['duty_cycle']:.2f} "
+              f"(measured {node['measured_duty_cycle']:.2f}), {node['activations']} activations")
+
+    t0 = time.perf_counter()
+    table = summarize_archive("../data")
+    print(f"\nArchive summary ({len(table)} experiments, {time.perf_counter() - t0:.2f} s)")
+    columns = ('experiment', 'nodes', 'switch_rate', 'max_switch_rate', 'band_switch_rate',
+               'inner_fraction', 'duty_cycle', 'measured_duty_cycle', 'inner_dwell_mean')
+    print("  ".join(f"{c:>19s}" for c in columns))
+    for row in table:
+        print("  ".join(f"{row[c]:>19.3f}" if isinstance(row[c], float) else f"{row[c]:>19}" for c in columns))
@@ -0,0 +1,342 @@
+import os
+import json
+import numpy as np
+import networkx as nx
+from Experiment import Experiment
+
+def resample(t, values, grid):
+    """
+    Linear interpolation of every row of (nodes x samples) NaN-padded logs on a common time
+    grid, with a single searchsorted over the rows laid end to end (row r shifted by r * span).
+    NaN outside the logged range of each node.
+    """
+    n_nodes, n_samples = t.shape
+    rows = np.arange(n_nodes)[:, None]
+    lengths = (~np.isnan(t)).sum(axis=1)
+    last = np.maximum(lengths - 1, 0)
+    # Padding repeats the last timestamp, so that every shifted row stays sorted
+    filled = np.where(np.arange(n_samples)[None, :] < lengths[:, None], t, t[rows[:, 0], last][:, None])
+    span = max(np.nanmax(t), grid[-1]) - min(np.nanmin(t), grid[0]) + 1.0
+    idx = np.searchsorted((filled + rows * span).ravel(), (grid[None, :] + rows * span).ravel(), side='right')
+    idx = idx.reshape(n_nodes, grid.size) - rows * n_samples
+
+    hi = np.clip(idx, 1, np.maximum(last, 1)[:, None])
+    lo = hi - 1
+    t0, t1 = t[rows, lo], t[rows, hi]
+    v0, v1 = values[rows, lo], values[rows, hi]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = np.clip(np.where(t1 > t0, (grid[None, :] - t0) / (t1 - t0), 0.0), 0.0, 1.0)
+    inside = (grid[None, :] >= t[rows, 0]) & (grid[None, :] <= t[rows[:, 0], last][:, None]) & (lengths[:, None] >= 2)
+    return np.where(inside, v0 + w * (v1 - v0), np.nan)
+
+def grouped(values, labels, n_groups):
+    """
+    NaN-aware per-group reductions over the rows of a (nodes x samples) array.
+    Returns:
+        dict: (groups x samples) 'count', 'mean', 'min', 'max', 'std' (count 0 and NaN for
+              the groups without rows).
+    """
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    # Reductions over the non-empty groups only: reduceat gives an empty segment the next row
+    present = np.flatnonzero(np.bincount(sorted_labels, minlength=n_groups)[:n_groups])
+    starts = np.searchsorted(sorted_labels, present)
+    rows = values[order]
+    valid = ~np.isnan(rows)
+    filled = np.where(valid, rows, 0.0)
+
+    def reduce(ufunc, array, fill):
+        out = np.full((n_groups,) + array.shape[1:], fill)
+        if present.size:
+            out[present] = ufunc.reduceat(array, starts, axis=0)
+        return out
+
+    count = reduce(np.add, valid.astype(np.float64), 0.0)
+    total = reduce(np.add, filled, 0.0)
+    squares = reduce(np.add, filled**2, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        var = np.where(count > 0, squares / count - mean**2, np.nan)
+    return {
+        'count': count,
+        'mean': mean,
+        'min': reduce(np.fmin, rows, np.nan),
+        'max': reduce(np.fmax, rows, np.nan),
+        'std': np.sqrt(np.maximum(var, 0.0)),
+    }
+
+def settling_time(grid, signal, tol):
+    """
+    First grid time after which signal stays below tol (NaN samples ignored), None if never.
+    Vectorized over the rows of a 2D signal.
+    """
+    signal = np.atleast_2d(signal)
+    above = np.where(np.isnan(signal), False, signal > tol)
+    # Index of the last sample above tol, from the reversed cumulative any
+    any_after = np.flip(np.logical_or.accumulate(np.flip(above, axis=1), axis=1), axis=1)
+    first = any_after.sum(axis=1)
+    settled = (first < signal.shape[1]) & ~np.isnan(signal[:, -1])
+    return [float(grid[k]) if ok else None for k, ok in zip(first, settled)]
+
+
+class ClusterAnalysis:
+    """
+    Cluster- and subgraph-level consensus metrics of an experiment on a partitioned topology
+    (e.g. 30node-clusters: three 10-node clusters joined through bridge links).
+
+    The virtual states of all nodes are resampled on a common grid of period Ts into a
+    (nodes x samples) array, and every metric is a grouped reduction over the rows of one
+    cluster:
+    - intra-cluster spread (max - min) and standard deviation of the virtual states,
+    - inter-cluster disagreement: spread of the cluster means and pairwise mean gaps,
+    - bridge-node lag: for every node with a neighbor in another cluster, the delay that best
+      aligns it with its own cluster mean, and its deviation from and agreement time with its
+      own and the adjacent cluster means.
+    The partition is given ({label: [nodes]} or [[nodes], ...]), taken from the 'type' field
+    of the params headers (partition='type'), or detected by modularity on the neighbor graph
+    of the params headers (partition=None, n_clusters communities if given). Only the time
+    window logged by every node is analysed.
+    """
+
+    def __init__(self, simulation_dir, num_agents=None, partition=None, n_clusters=None, Ts=None, tol=0.01,
+                 max_lag=10.0, experiment=None):
+        self.simulation_dir = simulation_dir
+        self.experiment = experiment if experiment is not None else Experiment(simulation_dir, num_agents)
+        self.partition = partition
+        self.n_clusters = n_clusters
+        self.Ts = Ts
+        self.tol = tol
+        self.max_lag = max_lag
+
+        self.graph = None
+        self.node_ids = []
+        self.clusters = {}      # label -> [nodes]
+        self.labels = None      # (nodes,) cluster index of every row
+        self.bridges = {}       # bridge node -> adjacent cluster labels
+        self.grid = None        # (samples,) common time grid [s]
+        self.z = None           # (nodes, samples) resampled virtual states
+
+    def build_graph(self):
+        """
+        Undirected neighbor graph from the params headers (nodes without a header keep the
+        edges declared by their neighbors).
+        """
+        G = nx.Graph()
+        for node in self.experiment.node_ids:
+            G.add_node(node)
+            for neighbor in self.experiment.params(node).get('neighbors', []):
+                G.add_edge(node, int(neighbor))
+        return G
+
+    def _partition(self):
+        partition = self.partition
+        if partition is None:
+            communities = nx.community.greedy_modularity_communities(self.graph, best_n=self.n_clusters)
+            groups = sorted((sorted(c) for c in communities), key=lambda c: c[0])
+            return {str(k + 1): nodes for k, nodes in enumerate(groups)}
+        if partition == 'type':
+            groups = {}
+            for node in self.node_ids:
+                node_type = self.experiment.params(node).get('type')
+                if node_type is None:
+                    # No header: join the cluster of most neighbors
+                    types = [self.experiment.params(n).get('type') for n in self.graph.neighbors(node)]
+                    types = [t for t in types if t is not None]
+                    node_type = max(set(types), key=types.count) if types else 'unknown'
+                groups.setdefault(node_type, []).append(node)
+            return groups
+        if isinstance(partition, dict):
+            return {str(label): sorted(nodes) for label, nodes in partition.items()}
+        return {str(k + 1): sorted(nodes) for k, nodes in enumerate(partition)}
+
+    def load_data(self):
+        experiment = self.experiment
+        self.node_ids = [node for node in experiment.node_ids if experiment.length(node) >= 2]
+        self.graph = self.build_graph()
+        self.clusters = self._partition()
+
+        cluster_of = {node: label for label, nodes in self.clusters.items() for node in nodes}
+        missing = [node for node in self.node_ids if node not in cluster_of]
+        if missing:
+            print(f"[Warning] Nodes {missing} are not in the partition and are ignored")
+            self.node_ids = [node for node in self.node_ids if node in cluster_of]
+        empty = [label for label, nodes in self.clusters.items() if not set(nodes) & set(self.node_ids)]
+        if empty:
+            print(f"[Warning] Clusters {empty} have no logged nodes and are ignored")
+            self.clusters = {label: nodes for label, nodes in self.clusters.items() if label not in empty}
+            cluster_of = {node: label for label, nodes in self.clusters.items() for node in nodes}
+        labels = list(self.clusters)
+        self.labels = np.array([labels.index(cluster_of[node]) for node in self.node_ids], dtype=np.int64)
+
+        self.bridges = {}
+        for node in self.node_ids:
+            adjacent = sorted({cluster_of[n] for n in self.graph.neighbors(node)
+                               if n in cluster_of and cluster_of[n] != cluster_of[node]})
+            if adjacent:
+                self.bridges[node] = adjacent
+
+        if self.Ts is None:
+            self.Ts = experiment.settings()['Ts'] or 0.2
+        t = experiment.stack('timestamp', self.node_ids)
+        z = experiment.stack('vstate', self.node_ids)
+        # Window logged by every node
+        ends = t[np.arange(len(self.node_ids)), (~np.isnan(t)).sum(axis=1) - 1]
+        self.grid = np.round(np.arange(np.nanmax(t[:, 0]), ends.min(), self.Ts), 6)
+        self.z = resample(t, z, self.grid)
+
+    def cluster_series(self):
+        """
+        (clusters x samples) grouped statistics of the virtual states, plus the per-sample
+        intra-cluster spread and the inter-cluster disagreement.
+        """
+        stats = grouped(self.z, self.labels, len(self.clusters))
+        stats['spread'] = stats['max'] - stats['min']
+        with np.errstate(invalid='ignore'):
+            stats['disagreement'] = np.nanmax(stats['mean'], axis=0) - np.nanmin(stats['mean'], axis=0)
+        return stats
+
+    def bridge_lags(self, stats=None):
+        """
+        For every bridge node:
+        - 'lag' [s]: delay in [-max_lag, max_lag] minimizing the variance of
+          z_bridge(t) - mean_own(t - lag), where mean_own is the mean of its own cluster (a
+          constant offset does not count as lag; positive: the bridge trails its cluster),
+        - per reference cluster (its own and the adjacent ones): mean absolute deviation from
+          the cluster mean and agreement time, after which it stays within tol of that mean.
+        """
+        stats = self.cluster_series() if stats is None else stats
+        bridges = list(self.bridges)
+        if not bridges:
+            return {}
+        labels = list(self.clusters)
+        max_shift = int(round(self.max_lag / self.Ts))
+        shifts = np.arange(-max_shift, max_shift + 1)
+
+        rows = np.array([self.node_ids.index(node) for node in bridges])
+        z = self.z[rows]
+        own = stats['mean'][self.labels[rows]]
+        # (bridges x shifts) variances over the overlapping samples, via a strided window view
+        padded = np.pad(own, ((0, 0), (max_shift, max_shift)), constant_values=np.nan)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.grid.size, axis=1)[:, ::-1]
+        with np.errstate(invalid='ignore'):
+            variance = np.nanvar(z[:, None, :] - windows, axis=2)
+        best = shifts[np.argmin(np.where(np.isnan(variance), np.inf, variance), axis=1)]
+
+        lags = {}
+        for b, node in enumerate(bridges):
+            references = [labels[self.labels[rows[b]]]] + self.bridges[node]
+            gaps = np.abs(z[b][None, :] - stats['mean'][[labels.index(label) for label in references]])
+            agreement = settling_time(self.grid, gaps, self.tol)
+            lags[str(node)] = {
+                'cluster': references[0],
+                'lag': float(best[b] * self.Ts),
+                'references': {
+                    label: {'deviation': float(np.nanmean(gaps[k])), 'agreement_time': agreement[k]}
+                    for k, label in enumerate(references)
+                },
+            }
+        return lags
+
+    def cluster_results(self, save=True):
+        stats = self.cluster_series()
+        labels = list(self.clusters)
+        settle = settling_time(self.grid, stats['spread'], self.tol)
+        clusters = {}
+        for k, label in enumerate(labels):
+            spread = stats['spread'][k]
+            clusters[label] = {
+                'nodes': [node for node, l in zip(self.node_ids, self.labels) if l == k],
+                'consensus_time': settle[k],
+                'final_spread': float(spread[~np.isnan(spread)][-1]),
+                'mean_spread': float(np.nanmean(spread)),
+                'max_spread': float(np.nanmax(spread)),
+                'mean_std': float(np.nanmean(stats['std'][k])),
+                'final_mean': float(stats['mean'][k][~np.isnan(stats['mean'][k])][-1]),
+            }
+
+        gaps = np.abs(stats['mean'][:, None, :] - stats['mean'][None, :, :])
+        with np.errstate(invalid='ignore'):
+            mean_gaps = np.nanmean(gaps, axis=2)
+        disagreement = stats['disagreement']
+        results = {
+            'Ts': self.Ts,
+            'tol': self.tol,
+            'clusters': clusters,
+            'inter': {
+                'consensus_time': settling_time(self.grid, disagreement, self.tol)[0],
+                'final_disagreement': float(disagreement[~np.isnan(disagreement)][-1]),
+                'mean_disagreement': float(np.nanmean(disagreement)),
+                'max_disagreement': float(np.nanmax(disagreement)),
+                'mean_pairwise_gap': {f"{a}-{b}": float(mean_gaps[i, j])
+                                      for i, a in enumerate(labels) for j, b in enumerate(labels) if i < j},
+            },
+            'bridges': self.bridge_lags(stats),
+        }
+
+        if save:
+            output_file = f"{self.simulation_dir}/cluster_results.json"
+            with open(output_file, 'w') as f:
+                json.dump(results, f, indent=4)
+            print(f"Cluster results saved to {output_file}")
+        return results
+
+
+def compare_runs(directories, partition=None, **kwargs):
+    """
+    Cluster summary of several experiments (e.g. the same topology with different bridging
+    strategies), one row per run.
+    Args:
+        directories (list): experiment directories.
+        partition: partition passed to every ClusterAnalysis (detected per run if None).
+        kwargs: other ClusterAnalysis arguments.
+    Returns:
+        list: one dict per run.
+    """
+    rows = []
+    for directory in directories:
+        analysis = ClusterAnalysis(directory, partition=partition, **kwargs)
+        analysis.load_data()
+        if not analysis.node_ids:
+            continue
+        results = analysis.cluster_results(save=False)
+        clusters = results['clusters'].values()
+        lags = [bridge['lag'] for bridge in results['bridges'].values()]
+        agreement = [ref['agreement_time'] for bridge in results['bridges'].values()
+                     for label, ref in bridge['references'].items() if label != bridge['cluster']]
+        consensus = [c['consensus_time'] for c in clusters]
+        rows.append({
+            'experiment': os.path.basename(os.path.normpath(directory)),
+            'clusters': len(results['clusters']),
+            'bridges': len(results['bridges']),
+            'max_intra_consensus_time': None if None in consensus else max(consensus),
+            'inter_consensus_time': results['inter']['consensus_time'],
+            'mean_intra_spread': float(np.mean([c['mean_spread'] for c in clusters])),
+            'mean_disagreement': results['inter']['mean_disagreement'],
+            'final_disagreement': results['inter']['final_disagreement'],
+            'mean_bridge_lag': float(np.mean(lags)) if lags else None,
+            'max_bridge_agreement_time': None if None in agreement or not agreement else max(agreement),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    sim_name = "30node-clusters"
+    num_agents = 30
+    for partition in (None, 'type'):
+        analysis = ClusterAnalysis(simulation_dir=f"../data/{sim_name}", num_agents=num_agents, partition=partition,
+                                   n_clusters=3)
+        analysis.load_data()
+        results = analysis.cluster_results(save=False)
+        print(f"\nPartition {partition or 'detected'}: bridges {sorted(analysis.bridges)}")
+        for label, cluster in results['clusters'].items():
+            print(f"  cluster {label}: nodes {cluster['nodes']}, consensus at {cluster['consensus_time']} s, "
+                  f"mean spread {cluster['mean_spread']:.4f}")
+        inter = results['inter']
+        print(f"  inter-cluster: consensus at {inter['consensus_time']} s, "
+              f"mean disagreement {inter['mean_disagreement']:.4f}")
+        for node, bridge in results['bridges'].items():
+            print(f"  bridge {node}: lag {bridge['lag']:+.1f} s on cluster {bridge['cluster']}, agreement with "
+                  + ", ".join(f"{label} at {ref['agreement_time']} s" for label, ref in bridge['references'].items()))
+
+    for row in compare_runs([f"../data/{name}" for name in ("30node-clusters", "30node-dring")], n_clusters=3):
+        print(row)
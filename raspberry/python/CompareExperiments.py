@@ -0,0 +1,230 @@
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from Experiment import Experiment, CACHE_ROOT
+from ClusterAnalysis import resample
+
+class CompareExperiments:
+    """
+    Comparison of N experiments (e.g. 30node-clusters against 30node-dring, or several seeds of
+    the same setup) on a common time grid.
+
+    Experiments are opened lazily (Experiment) and processed in chunks of the grid: for every
+    chunk, only the samples of each node around the chunk are read and resampled onto the
+    grid with a vectorized interpolation (ClusterAnalysis.resample). With a column cache
+    (cache, see Experiment) the columns are memory-mapped, so memory is O(runs x nodes x chunk)
+    whatever the length of the experiments. Per time sample:
+    - per run: median sigma = x - z and median vartheta over the nodes, and z-spread
+      (max - min of the virtual states),
+    - across runs: quantile bands of sigma and vartheta (over the nodes of all runs) and of the
+      z-spread (over runs).
+    By default the grid covers the window logged by every node of every run, with the
+    period Ts of the first run.
+    """
+    QUANTITIES = ('sigma', 'z_spread', 'vartheta')
+
+    def __init__(self, simulation_dirs, Ts=None, t_range=None, offsets=None, chunk_samples=2048,
+                 quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), cache=None):
+        """
+        Args:
+            simulation_dirs (list or dict): experiment directories, or {name: directory}. Runs
+                                            of a list are named by their directory name, or by
+                                            their path relative to the common parent when two
+                                            names collide (e.g. seed1/30node-clusters).
+            offsets (dict): {name: seconds} subtracted from the timestamps of a run, to align
+                            runs triggered at different times.
+            cache: column cache of the experiments (Experiment), none by default.
+        """
+        if not isinstance(simulation_dirs, dict):
+            simulation_dirs = self.run_names(simulation_dirs)
+        self.experiments = {name: Experiment(directory, cache=cache) for name, directory in simulation_dirs.items()}
+        unknown = sorted(set(offsets or {}) - set(self.experiments))
+        if unknown:
+            raise ValueError(f"offsets for unknown runs {unknown}, runs are {list(self.experiments)}")
+        self.offsets = {name: 0.0 for name in self.experiments}
+        self.offsets.update(offsets or {})
+        self.chunk_samples = chunk_samples
+        self.quantiles = np.asarray(quantiles, dtype=np.float64)
+
+        first = next(iter(self.experiments.values()))
+        self.Ts = Ts if Ts is not None else (first.settings()['Ts'] or 0.2)
+        self.nodes = {name: [node for node in experiment.node_ids if experiment.length(node) >= 2]
+                      for name, experiment in self.experiments.items()}
+        empty = [name for name, nodes in self.nodes.items() if not nodes]
+        if empty:
+            raise ValueError(f"no node with at least 2 samples in runs {empty}")
+        if t_range is None:
+            t_range = self.common_window()
+        if not t_range[1] > t_range[0]:
+            raise ValueError(f"empty time window {tuple(t_range)}: the runs do not overlap"
+                             f" (check offsets or pass t_range)")
+        self.grid = np.round(np.arange(t_range[0], t_range[1], self.Ts), 6)
+        if self.grid.size == 0:
+            raise ValueError(f"no grid sample in {tuple(t_range)} with Ts = {self.Ts}")
+        self.results = None
+
+    @staticmethod
+    def run_names(directories):
+        """
+        {name: directory} of a list of experiment directories.
+        """
+        paths = [os.path.normpath(d) for d in directories]
+        if len(set(paths)) < len(paths):
+            raise ValueError(f"duplicate experiment directories in {directories}")
+        names = [os.path.basename(path) for path in paths]
+        if len(set(names)) < len(names):
+            parent = os.path.commonpath([os.path.abspath(path) for path in paths])
+            names = [os.path.relpath(os.path.abspath(path), parent) for path in paths]
+        return dict(zip(names, directories))
+
+    def _bounds(self, name):
+        experiment, offset = self.experiments[name], self.offsets[name]
+        starts, ends = [], []
+        for node in self.nodes[name]:
+            timestamp = experiment.raw(node, 'timestamp')
+            starts.append(timestamp[0] * experiment.time_factor - offset)
+            ends.append(timestamp[experiment.length(node) - 1] * experiment.time_factor - offset)
+        return max(starts), min(ends)
+
+    def common_window(self):
+        """
+        (t0, t1) [s] logged by every node of every run.
+        """
+        bounds = [self._bounds(name) for name in self.experiments]
+        return max(b[0] for b in bounds), min(b[1] for b in bounds)
+
+    def resampled(self, name, grid):
+        """
+        (nodes x samples) x, z and vartheta of a run on a grid chunk, read from the samples
+        around the chunk only.
+        """
+        experiment, offset = self.experiments[name], self.offsets[name]
+        nodes = self.nodes[name]
+        slices = []
+        for node in nodes:
+            n = experiment.length(node)
+            lo, hi = experiment.index_range(node, (grid[0] + offset, grid[-1] + offset))
+            # One sample on each side of the chunk for the interpolation
+            slices.append((node, max(lo - 1, 0), min(hi + 1, n)))
+
+        width = max(hi - lo for _, lo, hi in slices)
+        t = np.full((len(nodes), width), np.nan)
+        columns = {key: np.full((len(nodes), width), np.nan) for key in ('state', 'vstate', 'vartheta')}
+        for row, (node, lo, hi) in enumerate(slices):
+            t[row, :hi - lo] = np.asarray(experiment.raw(node, 'timestamp')[lo:hi]) * experiment.time_factor - offset
+            for key, values in columns.items():
+                values[row, :hi - lo] = np.asarray(experiment.raw(node, key)[lo:hi]) / experiment.conversion_factor
+        return {key: resample(t, values, grid) for key, values in columns.items()}
+
+    def aggregate(self):
+        """
+        Per-time statistics, chunk by chunk over the grid.
+        Returns:
+            dict: 't' (T,), 'runs' {name: {'sigma', 'z_spread', 'vartheta'} (T,) per-run
+                  series}, 'bands' {quantity: (quantiles, T)}, 'quantiles'.
+        """
+        T, Q = self.grid.size, self.quantiles.size
+        runs = {name: {quantity: np.full(T, np.nan) for quantity in self.QUANTITIES} for name in self.experiments}
+        bands = {quantity: np.full((Q, T), np.nan) for quantity in self.QUANTITIES}
+
+        for start in range(0, T, self.chunk_samples):
+            chunk = slice(start, min(start + self.chunk_samples, T))
+            grid = self.grid[chunk]
+            pooled = {'sigma': [], 'vartheta': []}
+            spreads = []
+            for name in self.experiments:
+                columns = self.resampled(name, grid)
+                sigma = columns['state'] - columns['vstate']
+                with np.errstate(invalid='ignore'):
+                    spread = np.nanmax(columns['vstate'], axis=0) - np.nanmin(columns['vstate'], axis=0)
+                runs[name]['sigma'][chunk] = np.nanmedian(sigma, axis=0)
+                runs[name]['vartheta'][chunk] = np.nanmedian(columns['vartheta'], axis=0)
+                runs[name]['z_spread'][chunk] = spread
+                pooled['sigma'].append(sigma)
+                pooled['vartheta'].append(columns['vartheta'])
+                spreads.append(spread)
+
+            for quantity, values in pooled.items():
+                bands[quantity][:, chunk] = np.nanquantile(np.concatenate(values), self.quantiles, axis=0)
+            bands['z_spread'][:, chunk] = np.nanquantile(np.stack(spreads), self.quantiles, axis=0)
+
+        self.results = {'t': self.grid, 'runs': runs, 'bands': bands, 'quantiles': self.quantiles}
+        return self.results
+
+    def summary(self, tol=0.01):
+        """
+        Per run: final z-spread, time after which the z-spread stays below tol (None if it
+        does not), and mean |median sigma| and final median vartheta.
+        """
+        results = self.results if self.results is not None else self.aggregate()
+        rows = {}
+        for name, series in results['runs'].items():
+            spread = series['z_spread']
+            above = np.flatnonzero(~(spread <= tol))
+            settled = above.size == 0 or above[-1] < spread.size - 1
+            rows[name] = {
+                'nodes': len(self.nodes[name]),
+                'final_z_spread': float(spread[-1]),
+                'consensus_time': (float(self.grid[above[-1] + 1]) if above.size else float(self.grid[0]))
+                                  if settled else None,
+                'mean_abs_sigma': float(np.nanmean(np.abs(series['sigma']))),
+                'final_vartheta': float(series['vartheta'][-1]),
+            }
+        return rows
+
+    def plot_overlay(self, quantity='z_spread', ax=None, log_scale=None):
+        """
+        Per-run series of a quantity, overlaid.
+        """
+        results = self.results if self.results is not None else self.aggregate()
+        if ax is None:
+            _, ax = plt.subplots(figsize=(12, 5))
+        for name, series in results['runs'].items():
+            ax.plot(results['t'], series[quantity], linewidth=1.2, label=name)
+        if log_scale if log_scale is not None else quantity == 'z_spread':
+            ax.set_yscale('log')
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel(quantity)
+        ax.legend()
+        ax.grid(True, linestyle='--', alpha=0.6)
+        return ax
+
+    def plot_bands(self, quantity='sigma', ax=None):
+        """
+        Median and symmetric quantile bands of a quantity across runs.
+        """
+        results = self.results if self.results is not None else self.aggregate()
+        if ax is None:
+            _, ax = plt.subplots(figsize=(12, 5))
+        t, band, q = results['t'], results['bands'][quantity], results['quantiles']
+        for k in range(q.size // 2):
+            lo, hi = k, q.size - 1 - k
+            ax.fill_between(t, band[lo], band[hi], color='tab:blue', alpha=0.15 + 0.15 * k, linewidth=0,
+                            label=f'{q[lo]:.0%}-{q[hi]:.0%}')
+        median = int(np.argmin(np.abs(q - 0.5)))
+        ax.plot(t, band[median], color='tab:blue', linewidth=1.2, label='median')
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel(quantity)
+        ax.legend()
+        ax.grid(True, linestyle='--', alpha=0.6)
+        return ax
+
+
+if __name__ == "__main__":
+    import time
+
+    compare = CompareExperiments([f"../data/{sim_name}" for sim_name in ("30node-clusters", "30node-dring")],
+                                 chunk_samples=256, cache=CACHE_ROOT)
+    t0 = time.perf_counter()
+    compare.aggregate()
+    print(f"{len(compare.experiments)} runs on {compare.grid.size} samples "
+          f"({compare.grid[0]:.1f} - {compare.grid[-1]:.1f} s) in {time.perf_counter() - t0:.2f} s")
+    for name, row in compare.summary().items():
+        print(f"{name}: {row}")
+
+    fig, axs = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
+    compare.plot_overlay('z_spread', ax=axs[0])
+    compare.plot_bands('sigma', ax=axs[1])
+    compare.plot_bands('vartheta', ax=axs[2])
+    plt.tight_layout()
+    plt.show()
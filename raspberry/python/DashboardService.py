@@ -0,0 +1,270 @@
+import os
+import json
+import hashlib
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from aiohttp import web
+
+from Experiment import Experiment, CACHE_ROOT
+from TrajectoryPyramid import TrajectoryPyramid
+
+DASHBOARD_PORT = 3100
+
+def convergence_metrics(experiment):
+    """
+    Convergence metrics of an experiment: per node, those of PostSimulation.numerical_results
+    (None when a threshold is never reached), and for the network the final spread of the
+    virtual states.
+    """
+    settings = experiment.settings()
+    epsilon_on, epsilon_off = settings['epsilon_on'], settings['epsilon_off']
+    nodes, final_z = {}, []
+    for node in experiment.node_ids:
+        if experiment.length(node) == 0:
+            continue
+        t = experiment.column(node, 'timestamp')
+        z = experiment.column(node, 'vstate')
+        sigma = experiment.column(node, 'state') - z
+        vartheta = experiment.column(node, 'vartheta')
+        abs_sigma = np.abs(sigma)
+        inside_on = np.flatnonzero(abs_sigma <= epsilon_on)
+        inside_off = np.flatnonzero(abs_sigma <= epsilon_off)
+        metrics = {
+            'convergence_time_epsilon_on': float(t[inside_on[0]]) if inside_on.size else None,
+            'convergence_time_epsilon_off': float(t[inside_off[0]]) if inside_off.size else None,
+            'max_adaptive_gain': float(vartheta.max()),
+            'max_bounding_error': None,
+            'min_bounding_error': None,
+            'steady_state_error': None,
+            'rmse_error_above_epsilon_off': None,
+        }
+        if inside_off.size:
+            tail = sigma[inside_off[0]:]
+            outside = tail[np.abs(tail) > epsilon_off]
+            metrics.update({
+                'max_bounding_error': float(tail.max()),
+                'min_bounding_error': float(tail.min()),
+                'steady_state_error': float(tail.mean()),
+                'rmse_error_above_epsilon_off': float(np.sqrt(np.mean(outside**2))) if outside.size else 0.0,
+            })
+        nodes[str(node)] = metrics
+        final_z.append(z[-1])
+    return {
+        'settings': settings,
+        'nodes': nodes,
+        'network': {
+            'final_z_mean': float(np.mean(final_z)) if final_z else None,
+            'final_z_spread': float(np.ptp(final_z)) if final_z else None,
+        },
+    }
+
+
+class DashboardService:
+    """
+    HTTP service for the data history views of the dashboard (data.html / update-data.js).
+
+    Instead of the raw per-node logs, it serves per experiment:
+    - GET /experiments: experiment names, nodes, samples and duration,
+    - GET /experiments/{name}/params: params headers of the nodes,
+    - GET /experiments/{name}/series?column=&width=&t0=&t1=&nodes=: min/max/mean series
+      from the trajectory pyramids (TrajectoryPyramid.query), at most ~2 * width buckets per
+      node whatever the length of the run (width capped by max_width),
+    - GET /experiments/{name}/metrics: convergence metrics, computed once per log version.
+    Every response carries an ETag derived from the log versions (mtime and size of the node
+    files) and the query, so unchanged views are answered 304 from If-None-Match without
+    touching the data, and response bodies are kept in an LRU cache. A new log version gets a
+    new Experiment and TrajectoryPyramid, whose outdated node pyramids are rebuilt on their
+    first query. Log parsing, pyramid builds and metrics run on one worker thread, off the
+    event loop.
+    """
+
+    def __init__(self, data_root="../data", max_width=2000, cache_entries=256, cache=CACHE_ROOT):
+        """
+        Args:
+            cache: cache root of the log columns, pyramids and metrics (outside the data tree
+                   by default, True for <experiment>/.cache, see Experiment.cache_directory).
+        """
+        self.data_root = data_root
+        self.cache = cache
+        self.max_width = max_width
+        self.cache_entries = cache_entries
+        self.bodies = OrderedDict()     # etag -> gzip-able JSON body
+        self.experiments = {}           # name -> (version, Experiment, TrajectoryPyramid)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.runner = None
+
+    # --- Experiments ----------------------------------------------------------------------
+    def _names(self):
+        return sorted(name for name in os.listdir(self.data_root)
+                      if os.path.isdir(os.path.join(self.data_root, name)) and not name.startswith('.'))
+
+    def _version(self, name):
+        directory = os.path.join(self.data_root, name)
+        h = hashlib.sha1()
+        for f in sorted(os.listdir(directory)):
+            if f.endswith('.json') and f[:-5].isdigit():
+                stat = os.stat(os.path.join(directory, f))
+                h.update(f"{f}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        return h.hexdigest()
+
+    def _experiment(self, name):
+        if name not in self._names():
+            raise web.HTTPNotFound(text=f"no experiment '{name}'")
+        version = self._version(name)
+        cached = self.experiments.get(name)
+        if cached is None or cached[0] != version:
+            experiment = Experiment(os.path.join(self.data_root, name), cache=self.cache)
+            cached = (version, experiment, TrajectoryPyramid(experiment.simulation_dir, experiment=experiment,
+                                                             cache=self.cache))
+            self.experiments[name] = cached
+        return cached
+
+    def metrics(self, name):
+        """
+        Convergence metrics of an experiment, stored in metrics.json in the cache directory of
+        the experiment for the current log version.
+        """
+        version, experiment, _ = self._experiment(name)
+        path = os.path.join(experiment.cache_dir, 'metrics.json')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                cached = json.load(f)
+            if cached['version'] == version:
+                return cached['metrics']
+        metrics = convergence_metrics(experiment)
+        os.makedirs(experiment.cache_dir, exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'version': version, 'metrics': metrics}, f)
+        os.replace(path + '.tmp', path)
+        return metrics
+
+    def precompute(self, names=None):
+        """
+        Builds the pyramids and metrics of the given experiments (all by default), so that the
+        first dashboard loads do not parse logs.
+        """
+        for name in (self._names() if names is None else names):
+            _, _, pyramid = self._experiment(name)
+            pyramid.build()
+            self.metrics(name)
+
+    # --- Conditional responses ------------------------------------------------------------
+    async def _respond(self, request, version, compute):
+        etag = '"' + hashlib.sha1(f"{version}:{request.path_qs}".encode()).hexdigest() + '"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers=headers)
+        body = self.bodies.get(etag)
+        if body is None:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, compute)
+            body = json.dumps(result, separators=(',', ':')).encode()
+            self.bodies[etag] = body
+            while len(self.bodies) > self.cache_entries:
+                self.bodies.popitem(last=False)
+        else:
+            self.bodies.move_to_end(etag)
+        response = web.Response(body=body, content_type='application/json', headers=headers)
+        response.enable_compression()
+        return response
+
+    @staticmethod
+    def _rounded(values, decimals=6):
+        # Device values are integers scaled by 1e6: 6 decimals are lossless
+        return np.round(values, decimals).tolist()
+
+    # --- HTTP routes ----------------------------------------------------------------------
+    async def list_experiments(self, request):
+        names = self._names()
+        version = hashlib.sha1("".join(self._version(name) for name in names).encode()).hexdigest()
+
+        def compute():
+            summary = {}
+            for name in names:
+                _, experiment, _ = self._experiment(name)
+                lengths = {node: experiment.length(node) for node in experiment.node_ids}
+                ends = [experiment.raw(node, 'timestamp')[n - 1] * experiment.time_factor
+                        for node, n in lengths.items() if n]
+                summary[name] = {
+                    'nodes': [node for node, n in lengths.items() if n],
+                    'samples': int(sum(lengths.values())),
+                    'duration': float(max(ends)) if ends else 0.0,
+                }
+            return summary
+        return await self._respond(request, version, compute)
+
+    async def get_params(self, request):
+        version, experiment, _ = self._experiment(request.match_info['name'])
+        return await self._respond(request, version, lambda: {
+            str(node): experiment.params(node) for node in experiment.node_ids})
+
+    async def get_series(self, request):
+        version, experiment, pyramid = self._experiment(request.match_info['name'])
+        query = request.query
+        column = query.get('column', 'vstate')
+        if column not in TrajectoryPyramid.COLUMNS:
+            raise web.HTTPBadRequest(text=f"column must be one of {TrajectoryPyramid.COLUMNS}")
+        try:
+            width = min(int(query.get('width', 1000)), self.max_width)
+            t_range = None
+            if 't0' in query or 't1' in query:
+                t_range = (float(query.get('t0', 0.0)), float(query.get('t1', np.inf)))
+            nodes = [int(n) for n in query['nodes'].split(',')] if 'nodes' in query else experiment.node_ids
+        except ValueError:
+            raise web.HTTPBadRequest(text="width, t0, t1 and nodes must be numbers")
+
+        def compute():
+            series = {}
+            for node in nodes:
+                if node not in experiment.node_ids or experiment.length(node) == 0:
+                    continue
+                view = pyramid.query(node, column, t_range, width)
+                series[str(node)] = {
+                    'level': view['level'],
+                    't': self._rounded(view['t'], 3),
+                    'mean': self._rounded(view['mean']),
+                    **({'min': self._rounded(view['min']), 'max': self._rounded(view['max'])}
+                       if view['level'] > 0 else {}),
+                }
+            return {'column': column, 'width': width, 'series': series}
+        return await self._respond(request, version, compute)
+
+    async def get_metrics(self, request):
+        name = request.match_info['name']
+        version, _, _ = self._experiment(name)
+        return await self._respond(request, version, lambda: self.metrics(name))
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/experiments', self.list_experiments)
+        app.router.add_get('/experiments/{name}/params', self.get_params)
+        app.router.add_get('/experiments/{name}/series', self.get_series)
+        app.router.add_get('/experiments/{name}/metrics', self.get_metrics)
+        return app
+
+    async def start(self, host='0.0.0.0', port=DASHBOARD_PORT):
+        self.runner = web.AppRunner(self.app(), access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        print(f"Dashboard-Service running at http://{host}:{port}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+if __name__ == "__main__":
+
+    async def main():
+        service = DashboardService(data_root="../data")
+        service.precompute()
+        await service.start()
+        try:
+            while True:
+                await asyncio.sleep(3600)
+        finally:
+            await service.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import asyncio
+import aiohttp
+
+from net import BACKEND_TYPE_PORT
+
+class DataCollector:
+    """
+    Asynchronous bulk collector of the experiment logs of every backend.
+
+    Same retrieval as the hub after a test (GET <backend>/<filename>-<type>.json per node,
+    stored as <output_dir>/<filename>/<id>.json), but all nodes are pulled in parallel over
+    one pooled aiohttp session with bounded concurrency. Bodies are streamed to a `.part`
+    file; a retry resumes it with an HTTP Range request (express.static supports it) and
+    restarts from scratch if the server answers with the full body instead.
+    """
+
+    def __init__(self, output_dir="../data", max_concurrency=32, retries=4, backoff=0.5,
+                 timeout=60.0, chunk_size=1 << 16):
+        self.output_dir = output_dir
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def backend_url(node):
+        return f"http://{node['ip']}:{BACKEND_TYPE_PORT[node['type']]}"
+
+    async def _download(self, session, url, path):
+        """
+        Streams url into path + '.part', resuming a previous partial download.
+        Returns:
+            int: number of bytes written in this call.
+        """
+        part = path + '.part'
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+
+        async with session.get(url, headers=headers) as response:
+            if response.status == 416:
+                # Range not satisfiable: the partial file is already complete
+                return 0
+            response.raise_for_status()
+            mode = 'ab' if response.status == 206 else 'wb'
+            written = 0
+            with open(part, mode) as f:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+            return written
+
+    @staticmethod
+    def verify(path, expected_rows=None):
+        """
+        Checks that a downloaded log is valid JSON and that all its data columns have the
+        same number of rows (and at least expected_rows, if given).
+        Returns:
+            int: number of rows.
+        """
+        with open(path, 'r') as f:
+            content = json.load(f)
+        content = json.loads(content) if isinstance(content, str) else content
+        data = content.get('data', {})
+        if not isinstance(data, dict) or 'timestamp' not in data:
+            raise ValueError(f"no data columns in {path}")
+        lengths = {len(column) for column in data.values()}
+        if len(lengths) != 1:
+            raise ValueError(f"columns of different length in {path}: {sorted(lengths)}")
+        rows = lengths.pop()
+        if expected_rows is not None and rows < expected_rows:
+            raise ValueError(f"{rows} rows in {path}, expected at least {expected_rows}")
+        return rows
+
+    async def _collect_node(self, session, semaphore, filename, node_id, node, expected_rows):
+        url = f"{self.backend_url(node)}/{filename}-{node['type']}.json"
+        path = os.path.join(self.output_dir, filename, f"{node_id}.json")
+        result = {'url': url, 'path': path, 'bytes': 0, 'attempts': 0, 'rows': None, 'ok': False, 'error': None}
+
+        async with semaphore:
+            t0 = time.monotonic()
+            for attempt in range(1, self.retries + 1):
+                result['attempts'] = attempt
+                try:
+                    result['bytes'] += await self._download(session, url, path)
+                    result['rows'] = self.verify(path + '.part', expected_rows)
+                    os.replace(path + '.part', path)
+                    result['ok'] = True
+                    result['error'] = None
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # Network error: keep the partial body and resume it
+                    result['error'] = f"{type(e).__name__}: {e}"
+                except (ValueError, OSError) as e:
+                    # Corrupted body: start over
+                    result['error'] = f"{type(e).__name__}: {e}"
+                    if os.path.exists(path + '.part'):
+                        os.remove(path + '.part')
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            result['seconds'] = time.monotonic() - t0
+
+        if not result['ok']:
+            print(f"[Error] Node {node_id}: {result['error']}")
+        return node_id, result
+
+    async def collect(self, filename, nodes, expected_rows=None):
+        """
+        Collects the logs of all nodes in parallel.
+        Args:
+            filename (str): test name, as posted by the hub.
+            nodes (dict): {node_id: {'ip', 'type', ...}}, e.g. the hub params 'nodes'.
+            expected_rows (int): optional minimum number of rows per node.
+        Returns:
+            dict: {node_id: {'url', 'path', 'bytes', 'attempts', 'rows', 'ok', 'error', 'seconds'}}
+        """
+        os.makedirs(os.path.join(self.output_dir, filename), exist_ok=True)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.timeout, sock_connect=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            results = await asyncio.gather(*[
+                self._collect_node(session, semaphore, filename, node_id, node, expected_rows)
+                for node_id, node in nodes.items()
+            ])
+        return dict(results)
+
+    async def collect_from_hub(self, hub_url, filename=None, expected_rows=None):
+        """
+        Reads the node list (and test name) from the hub /getParams route, then collects.
+        """
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{hub_url}/getParams") as response:
+                params = await response.json()
+        return await self.collect(filename or params['filename'], params['nodes'], expected_rows)
+
+
+if __name__ == "__main__":
+    hub_url = "http://localhost:3000"
+    collector = DataCollector(output_dir="../data")
+
+    t0 = time.monotonic()
+    results = asyncio.run(collector.collect_from_hub(hub_url))
+    elapsed = time.monotonic() - t0
+
+    ok = [r for r in results.values() if r['ok']]
+    slowest = max((r['seconds'] for r in results.values()), default=0.0)
+    print(f"Collected {len(ok)}/{len(results)} nodes, {sum(r['bytes'] for r in ok) / 1e6:.2f} MB "
+          f"in {elapsed:.2f} s (slowest node {slowest:.2f} s)")
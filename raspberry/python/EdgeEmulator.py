@@ -0,0 +1,348 @@
+import os
+import time
+import json
+import asyncio
+import numpy as np
+from aiohttp import web
+
+from Algorithm import Algorithm
+from net import TYPE_BLE, TYPE_WIFI, TYPE_BRIDGE, BACKEND_TYPE_PORT, NODE_TYPE_PORT
+
+
+class VirtualDevice:
+    """
+    One emulated edge-device (backend-server + edge-process of raspberry/back.js, edge.js).
+    """
+    def __init__(self, node_id, ip, node_type):
+        self.node_id = node_id
+        self.ip = ip
+        self.type = node_type
+        self.params = None
+        self.running = False
+
+        # Logger (raspberry/log.js): params header, data lines and finished files
+        self.header = None
+        self.rows = []
+        self.files = {}
+
+    def logger_start(self, params):
+        self.header = params
+        self.rows = []
+
+    def logger_end(self, data_dir=None):
+        """
+        Transposes the logged lines into the columnar layout written by log.js loggerEnd().
+        """
+        content = {'params': self.header, 'data': self.rows}
+        if self.rows:
+            columns = list(zip(*self.rows))
+            data = {
+                'timestamp': list(columns[0]),
+                'state': list(columns[1]),
+                'vstate': list(columns[2]),
+                'vartheta': list(columns[3]),
+            }
+            for i, neighbor in enumerate(self.header['neighbors']):
+                data[str(neighbor)] = list(columns[4 + i])
+            content['data'] = data
+
+        filename = f"{self.header['filename']}-{self.type}.json"
+        body = json.dumps(content, indent=2).encode('utf8')
+        self.files[filename] = body
+        if data_dir is not None:
+            path = os.path.join(data_dir, self.ip)
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, filename), 'wb') as f:
+                f.write(body)
+        self.header = None
+        self.rows = []
+
+
+class EdgeEmulator:
+    """
+    Local multi-node emulator serving the edge-device HTTP API on localhost.
+
+    Every virtual device binds its own loopback address (127.0.1.<id> by default, Linux routes
+    all of 127.0.0.0/8 to lo) on the usual backend/node ports, so pointing the `ip` of each
+    entry of TOPOLOGY in net.js to those addresses is enough for the hub to drive hundreds of
+    nodes on one machine. Served routes per device:
+        POST /updateParams           (backend port) start/stop the logger and the consensus loop
+        GET  /<filename>-<type>.json (backend port) logged data after the run
+        GET  /getVState              (node port)    current virtual state
+    The consensus update of all running devices is stepped as one vectorized `Algorithm` batch,
+    every `dt` ms, with the neighbor snapshot refreshed and a log line written every `clock` ms.
+    The socket.io state relay to the hub is not emulated.
+    """
+
+    # Per-node parameter columns of Algorithm.set_params()
+    PARAM_COLUMNS = ('dt', 'clock', 'enabled', 'state0', 'vstate0', 'vartheta0', 'eta', 'dist_on',
+                     'dist_offset', 'dist_amplitude', 'dist_beta', 'dist_A', 'dist_frequency',
+                     'dist_phase_shift', 'samples')
+
+    def __init__(self, num_nodes, types=(TYPE_BLE, TYPE_WIFI, TYPE_BRIDGE), ip_template='127.0.1.{}',
+                 data_dir=None, seed=None, tick=1e-3):
+        self.devices = {
+            i: VirtualDevice(i, ip_template.format(i), types[(i - 1) % len(types)])
+            for i in range(1, num_nodes + 1)
+        }
+        self.data_dir = data_dir
+        self.tick = tick
+        self.rng = np.random.default_rng(seed)
+
+        self.algo = None
+        self.batch_ids = []
+        self.runners = []
+        self.loop_task = None
+
+        # Request log for load-testing: (route, node_id, t_arrival, t_done, bytes)
+        self.requests = []
+
+    # --- Consensus batch ------------------------------------------------------------------
+    def _update_device(self, node_id):
+        """
+        New params of a device, applied to its own row of the batch: algo.js setParams() of
+        that device only (parameters and hysteresis flag), the state is kept. Falls back to a
+        full rebuild when the device is not in the batch yet or its neighbors changed.
+        """
+        params = self.devices[node_id].params
+        if self.algo is None or node_id not in self.batch_ids:
+            return self._rebuild(node_id)
+        i = self.batch_ids.index(node_id)
+        if [int(n) for n in params['neighbors']] != [int(n) for n in self.algo.params[i]['neighbors']]:
+            return self._rebuild(node_id)
+        single = Algorithm()
+        single.set_params(params)
+        for key in self.PARAM_COLUMNS:
+            getattr(self.algo, key)[i] = getattr(single, key)[0]
+        self.algo.params[i] = params
+        self.algo.active[i] = False
+        self.running[i] = self.devices[node_id].running
+
+    def _rebuild(self, changed=None):
+        """
+        Rebuilds the Algorithm batch over all configured devices, keeping the state of the
+        devices that are already running (algo.js setParams() does not reset the state). The
+        hysteresis flag is kept too, except for the device whose params changed.
+        """
+        old_algo, old_index = self.algo, {node_id: i for i, node_id in enumerate(self.batch_ids)}
+        old_time = getattr(self, 'time0', None), getattr(self, 'done', None), getattr(self, 'next_fetch', None)
+
+        self.batch_ids = [i for i, d in self.devices.items() if d.params is not None]
+        n = len(self.batch_ids)
+        self.algo = Algorithm()
+        self.algo.rng = self.rng
+        self.algo.set_params([self.devices[i].params for i in self.batch_ids])
+        self.algo.reset_initial_conditions()
+
+        self.running = np.array([self.devices[i].running for i in self.batch_ids], dtype=bool)
+        self.time0 = np.zeros(n)
+        self.done = np.zeros(n, dtype=np.int64)
+        self.next_fetch = np.zeros(n)
+
+        if old_algo is None:
+            return
+        for new_i, node_id in enumerate(self.batch_ids):
+            old_i = old_index.get(node_id)
+            if old_i is None or not self.devices[node_id].running:
+                continue
+            for key in ('state', 'vstate', 'vartheta', 'cnt', 'gi', 'sigma', 'grad'):
+                getattr(self.algo, key)[new_i] = getattr(old_algo, key)[old_i]
+            if node_id != changed:
+                self.algo.active[new_i] = old_algo.active[old_i]
+            deg = min(self.algo.neighbor_vstates.shape[1], old_algo.neighbor_vstates.shape[1])
+            self.algo.neighbor_vstates[new_i, :deg] = old_algo.neighbor_vstates[old_i, :deg]
+            self.algo.neighbor_enabled[new_i, :deg] = old_algo.neighbor_enabled[old_i, :deg]
+            self.time0[new_i] = old_time[0][old_i]
+            self.done[new_i] = old_time[1][old_i]
+            self.next_fetch[new_i] = old_time[2][old_i]
+
+    def _start_device(self, node_id, now):
+        i = self.batch_ids.index(node_id)
+        for key, key0 in (('state', 'state0'), ('vstate', 'vstate0'), ('vartheta', 'vartheta0')):
+            getattr(self.algo, key)[i] = getattr(self.algo, key0)[i]
+        self.algo.cnt[i] = 0
+        self.algo.neighbor_vstates[i] = 0
+        self.algo.neighbor_enabled[i] = False
+        self.time0[i] = now
+        self.done[i] = 0
+        self.next_fetch[i] = now + self.algo.clock[i] * 1e-3
+        self.running[i] = True
+
+    def _advance(self, now):
+        """
+        Catches up every running device with the wall clock: dynamics steps every dt,
+        network fetch and log line every clock.
+        """
+        if self.algo is None or not np.any(self.running):
+            return
+        algo = self.algo
+        dt_ms = algo.dt * 1e3
+        elapsed_ms = (now - self.time0) * 1e3
+        due = np.where(self.running, np.floor(elapsed_ms / dt_ms).astype(np.int64) - self.done, 0)
+        due = np.maximum(due, 0)
+        for s in range(int(due.max(initial=0))):
+            algo.update(algo.neighbor_vstates, algo.neighbor_enabled,
+                        mask=self.running & algo.enabled & (due > s))
+        self.done += due
+
+        fetch = self.running & (now >= self.next_fetch)
+        if not np.any(fetch):
+            return
+        algo.refresh_neighbors(fetch)
+        scaled = algo.scaled()
+        for i in np.flatnonzero(fetch):
+            device = self.devices[self.batch_ids[i]]
+            if device.header is None:
+                continue
+            deg = len(device.params['neighbors'])
+            device.rows.append([
+                int(elapsed_ms[i]),
+                int(scaled['state'][i]),
+                int(scaled['vstate'][i]),
+                int(scaled['vartheta'][i]),
+                *algo.neighbor_vstates[i, :deg].tolist(),
+            ])
+        self.next_fetch[fetch] += algo.clock[fetch] * 1e-3
+
+    async def _dynamics_loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self._advance(time.monotonic())
+
+    # --- HTTP routes ----------------------------------------------------------------------
+    async def update_params(self, device, request):
+        t_arrival = time.monotonic()
+        updated_params = await request.json()
+
+        if updated_params.get('trigger') and not device.running:
+            device.logger_start(updated_params)
+            device.params = updated_params
+            self._update_device(device.node_id)
+            self._start_device(device.node_id, time.monotonic())
+            device.running = True
+        elif not updated_params.get('trigger') and device.running:
+            self._advance(time.monotonic())
+            device.running = False
+            device.params = updated_params
+            device.logger_end(self.data_dir)
+            self._update_device(device.node_id)
+        else:
+            device.params = updated_params
+            self._update_device(device.node_id)
+
+        self.requests.append(('updateParams', device.node_id, t_arrival, time.monotonic(), 0))
+        return web.json_response({'message': 'Backend-Server params updated successfully',
+                                  'params': updated_params})
+
+    async def get_file(self, device, request):
+        t_arrival = time.monotonic()
+        body = device.files.get(request.match_info['filename'])
+        if body is None:
+            raise web.HTTPNotFound()
+        self.requests.append(('data', device.node_id, t_arrival, time.monotonic(), len(body)))
+        return web.Response(body=body, content_type='application/json')
+
+    async def get_vstate(self, device, request):
+        vstate, enabled = None, bool(device.params and device.params.get('enabled'))
+        if self.algo is not None and device.node_id in self.batch_ids:
+            vstate = int(self.algo.scaled()['vstate'][self.batch_ids.index(device.node_id)])
+        return web.json_response({'vstate': vstate, 'enabled': enabled})
+
+    def _backend_app(self, device):
+        app = web.Application(client_max_size=1 << 24)
+        app.router.add_post('/updateParams', lambda r: self.update_params(device, r))
+        app.router.add_get('/getVState', lambda r: self.get_vstate(device, r))
+        app.router.add_get('/{filename}', lambda r: self.get_file(device, r))
+        return app
+
+    def _node_app(self, device):
+        app = web.Application()
+        app.router.add_get('/getVState', lambda r: self.get_vstate(device, r))
+        return app
+
+    async def start(self):
+        for device in self.devices.values():
+            sites = [(self._backend_app(device), BACKEND_TYPE_PORT[device.type])]
+            if NODE_TYPE_PORT[device.type] != BACKEND_TYPE_PORT[device.type]:
+                sites.append((self._node_app(device), NODE_TYPE_PORT[device.type]))
+            for app, port in sites:
+                runner = web.AppRunner(app, access_log=None)
+                await runner.setup()
+                await web.TCPSite(runner, device.ip, port).start()
+                self.runners.append(runner)
+        self.loop_task = asyncio.create_task(self._dynamics_loop())
+        print(f"Edge-Emulator running {len(self.devices)} virtual devices")
+
+    async def stop(self):
+        if self.loop_task is not None:
+            self.loop_task.cancel()
+        for runner in self.runners:
+            await runner.cleanup()
+        self.runners = []
+
+    # --- Reports --------------------------------------------------------------------------
+    def load_report(self, burst_gap=0.5):
+        """
+        Groups the logged requests of each route into bursts (hub fan-out rounds).
+        Returns:
+            dict: {route: [{'requests', 'nodes', 'span_ms', 'mean_service_ms', 'bytes', 'throughput_MBps'}, ...]}
+        """
+        report = {}
+        for route in ('updateParams', 'data'):
+            entries = sorted((r for r in self.requests if r[0] == route), key=lambda r: r[2])
+            if not entries:
+                continue
+            arrivals = np.array([r[2] for r in entries])
+            done = np.array([r[3] for r in entries])
+            nbytes = np.array([r[4] for r in entries])
+            starts = np.flatnonzero(np.concatenate([[True], np.diff(arrivals) > burst_gap]))
+            ends = np.concatenate([starts[1:], [len(entries)]])
+            bursts = []
+            for s, e in zip(starts, ends):
+                span = done[s:e].max() - arrivals[s]
+                bursts.append({
+                    'requests': int(e - s),
+                    'nodes': len({r[1] for r in entries[s:e]}),
+                    'span_ms': float(span * 1e3),
+                    'mean_service_ms': float(np.mean(done[s:e] - arrivals[s:e]) * 1e3),
+                    'bytes': int(nbytes[s:e].sum()),
+                    'throughput_MBps': float(nbytes[s:e].sum() / max(span, 1e-9) / 1e6),
+                })
+            report[route] = bursts
+        return report
+
+    def topology_js(self, neighbors, clock=200):
+        """
+        TOPOLOGY entries for raspberry/net.js pointing at the virtual devices.
+        Args:
+            neighbors (dict): {node_id: [neighbor ids]}
+        """
+        type_names = {TYPE_BLE: 'TYPE_BLE', TYPE_WIFI: 'TYPE_WIFI', TYPE_BRIDGE: 'TYPE_BRIDGE'}
+        lines = [
+            f"  {{id: {i}, ip: '{d.ip}', type: {type_names[d.type]}, enabled: true, "
+            f"neighbors: [{', '.join(str(n) for n in neighbors[i])}], clock: {clock}}},"
+            for i, d in self.devices.items()
+        ]
+        return "TOPOLOGY = [\n" + "\n".join(lines) + "\n];"
+
+
+if __name__ == "__main__":
+    num_nodes = 30
+
+    async def main():
+        emulator = EdgeEmulator(num_nodes=num_nodes, data_dir="../data/emulator", seed=42)
+        ring = {i: [i % num_nodes + 1, (i - 2) % num_nodes + 1] for i in range(1, num_nodes + 1)}
+        print(emulator.topology_js(ring))
+        await emulator.start()
+        try:
+            while True:
+                await asyncio.sleep(10.0)
+                report = emulator.load_report()
+                for route, bursts in report.items():
+                    last = bursts[-1]
+                    print(f"[{route}] {last['requests']} requests, span = {last['span_ms']:.1f} ms, "
+                          f"{last['throughput_MBps']:.2f} MB/s")
+        finally:
+            await emulator.stop()
+
+    asyncio.run(main())
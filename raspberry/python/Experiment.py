@@ -0,0 +1,251 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# Device constants of algo.js, used when the params header does not carry them
+DEVICE_EPSILON_ON = 0.050
+DEVICE_EPSILON_OFF = 0.010
+MAIN_COLUMNS = ('timestamp', 'state', 'vstate', 'vartheta')
+# Cache root outside the data tree, for the tools that keep derived files (pyramids, metrics)
+CACHE_ROOT = os.environ.get('EXPERIMENT_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'experiments'))
+
+def cache_directory(simulation_dir, cache):
+    """
+    Cache directory of an experiment: None if cache is None/False, <simulation_dir>/.cache if
+    cache is True, else a subdirectory of the cache root `cache`, keyed by the absolute path of
+    the experiment so that experiments with the same name do not collide.
+    """
+    if not cache:
+        return None
+    if cache is True:
+        return os.path.join(simulation_dir, '.cache')
+    name = os.path.basename(os.path.normpath(simulation_dir))
+    key = hashlib.sha1(os.path.abspath(simulation_dir).encode()).hexdigest()[:12]
+    return os.path.join(cache, f"{name}-{key}")
+
+class Experiment:
+    """
+    Lazy view of an experiment directory of device logs (<node>.json).
+
+    The params header of every node and its data columns (timestamp, state, vstate, vartheta
+    and the received neighbor vstates, keyed by neighbor id) are exposed on demand. By default
+    nothing is written: the first access to a node parses its JSON once and keeps it in memory.
+    With a disk cache, the header and every column are stored as separate files instead (a
+    .meta.json and one .npy per column, invalidated when the log changes); later accesses, also
+    from other processes, only read the header or memory-map the requested column, so only
+    the requested columns and sample ranges are decoded.
+    """
+
+    def __init__(self, simulation_dir, num_agents=None, conversion_factor=1e6, cache=None):
+        """
+        Args:
+            cache: None/False for no disk cache, a cache root outside the data tree (e.g.
+                   CACHE_ROOT), or True to write <simulation_dir>/.cache into the data
+                   directory (see cache_directory).
+        """
+        self.simulation_dir = simulation_dir
+        self.conversion_factor = conversion_factor
+        self.time_factor = 1 / 1000
+        self.cache = bool(cache)
+        self.cache_dir = cache_directory(simulation_dir, cache)
+        if num_agents is not None:
+            self.node_ids = [i for i in range(1, num_agents + 1) if os.path.exists(self._source(i))]
+        else:
+            self.node_ids = sorted(int(f[:-5]) for f in os.listdir(simulation_dir)
+                                   if f.endswith('.json') and f[:-5].isdigit())
+
+        self._meta = {}
+        self._arrays = {}
+        self._content = {}
+
+    @property
+    def name(self):
+        return os.path.basename(os.path.normpath(self.simulation_dir))
+
+    def _source(self, node):
+        return os.path.join(self.simulation_dir, f"{node}.json")
+
+    def _cached(self, node, suffix):
+        return os.path.join(self.cache_dir, f"{node}.{suffix}")
+
+    def _parse(self, node):
+        filename = self._source(node)
+        with open(filename, 'r') as f:
+            raw_content = json.load(f)
+
+        # Handle string-wrapped JSON (double encoded)
+        if isinstance(raw_content, str):
+            try:
+                return json.loads(raw_content)
+            except json.JSONDecodeError:
+                print(f"[Error] Failed to decode JSON string in {filename}")
+                return None
+        return raw_content
+
+    @staticmethod
+    def _to_array(name, values):
+        if name in MAIN_COLUMNS:
+            return np.asarray(values, dtype=np.int64)
+        # Neighbor columns: failed fetches leave missing entries
+        return np.array([np.nan if v is None else float(v) for v in values])
+
+    @staticmethod
+    def _write(path, write):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def meta(self, node):
+        """
+        Header of a node log: {'params', 'columns', 'length'} (length: common length of the
+        main columns, as the loaders truncate them).
+        """
+        if node in self._meta:
+            return self._meta[node]
+
+        stat = os.stat(self._source(node))
+        signature = [stat.st_mtime_ns, stat.st_size]
+        meta_path = self._cached(node, 'meta.json') if self.cache else None
+        if self.cache and os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta['signature'] == signature:
+                self._meta[node] = meta
+                return meta
+
+        content = self._parse(node)
+        if content is None:
+            return None
+        data_dict = content.get('data', {})
+        lengths = [len(data_dict.get(key, [])) for key in MAIN_COLUMNS]
+        meta = {
+            'signature': signature,
+            'params': content.get('params', {}),
+            'columns': list(data_dict.keys()),
+            'length': min(lengths),
+        }
+        if self.cache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for name, values in data_dict.items():
+                array = self._to_array(name, values)
+                self._write(self._cached(node, f"{name}.npy"), lambda f: np.save(f, array))
+            self._write(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+        else:
+            self._content[node] = data_dict
+        self._meta[node] = meta
+        return meta
+
+    def params(self, node=None):
+        """
+        params header of a node (of the first node with a header if node is None).
+        """
+        if node is not None:
+            meta = self.meta(node)
+            return meta['params'] if meta else {}
+        for node_id in self.node_ids:
+            params = self.params(node_id)
+            if params:
+                return params
+        return {}
+
+    def settings(self, node=None):
+        """
+        Controller and timing settings from the params header: network period Ts [s],
+        integration step dt [s], eta and the hysteresis thresholds (device constants of algo.js
+        unless the header overrides them).
+        """
+        params = self.params(node)
+        scale = 1.0 / self.conversion_factor
+        return {
+            'Ts': params['clock'] * self.time_factor if 'clock' in params else None,
+            'dt': params['dt'] * self.time_factor if 'dt' in params else None,
+            'eta': params['eta'] * scale if 'eta' in params else None,
+            'epsilon_on': params.get('epsilon_on', DEVICE_EPSILON_ON),
+            'epsilon_off': params.get('epsilon_off', DEVICE_EPSILON_OFF),
+        }
+
+    def columns(self, node):
+        meta = self.meta(node)
+        return meta['columns'] if meta else []
+
+    def length(self, node):
+        meta = self.meta(node)
+        return meta['length'] if meta else 0
+
+    def raw(self, node, name):
+        """
+        Unscaled column as logged (memory-mapped from the cache), without truncation.
+        """
+        key = (node, str(name))
+        if key in self._arrays:
+            return self._arrays[key]
+        meta = self.meta(node)
+        if meta is None or key[1] not in meta['columns']:
+            raise KeyError(f"no column '{name}' in {self._source(node)}")
+        if self.cache:
+            array = np.load(self._cached(node, f"{key[1]}.npy"), mmap_mode='r')
+        else:
+            array = self._to_array(key[1], self._content[node][key[1]])
+        self._arrays[key] = array
+        return array
+
+    def index_range(self, node, t_range=None):
+        """
+        Sample index range [lo, hi) of the timestamps within t_range = (t0, t1) [s].
+        """
+        n = self.length(node)
+        if t_range is None:
+            return 0, n
+        timestamp = self.raw(node, 'timestamp')[:n]
+        lo, hi = np.searchsorted(timestamp, [t_range[0] / self.time_factor, t_range[1] / self.time_factor],
+                                 side='left')
+        return int(lo), int(hi)
+
+    def column(self, node, name, t_range=None, samples=None, scaled=True):
+        """
+        Column of a node, truncated to the common length and restricted to t_range [s].
+        Args:
+            samples (int): at most this many samples from the start of the range.
+            scaled (bool): timestamps in seconds, states divided by the conversion factor.
+        """
+        lo, hi = self.index_range(node, t_range)
+        if samples is not None:
+            hi = min(hi, lo + samples)
+        values = np.asarray(self.raw(node, name)[lo:hi])
+        if not scaled:
+            return values
+        if name == 'timestamp':
+            return values * self.time_factor
+        return values / self.conversion_factor
+
+    def node_data(self, node, t_range=None):
+        """
+        (samples, 4) unscaled [timestamp, state, vstate, vartheta], as PostSimulation.data.
+        """
+        return np.stack([self.column(node, name, t_range, scaled=False) for name in MAIN_COLUMNS], axis=1)
+
+    def stack(self, name, nodes=None, t_range=None, scaled=True):
+        """
+        (nodes, samples) array of one column, NaN-padded past the end of the shorter logs.
+        """
+        nodes = self.node_ids if nodes is None else nodes
+        columns = [self.column(node, name, t_range, scaled=scaled) for node in nodes]
+        out = np.full((len(columns), max((len(c) for c in columns), default=0)), np.nan)
+        for row, values in enumerate(columns):
+            out[row, :len(values)] = values
+        return out
+
+
+if __name__ == "__main__":
+    import time
+
+    sim_name = "30node-clusters"
+    for attempt in ("cold", "cached"):
+        t0 = time.perf_counter()
+        experiment = Experiment(f"../data/{sim_name}", cache=CACHE_ROOT)
+        vstate = experiment.stack('vstate', t_range=(10.0, 20.0))
+        print(f"{attempt}: {vstate.shape} vstate samples of {len(experiment.node_ids)} nodes "
+              f"in {time.perf_counter() - t0:.3f} s")
+    print(experiment.settings())
@@ -2,17 +2,22 @@ import os
 import json 
 import numpy as np
 import matplotlib.pyplot as plt
+from Experiment import Experiment
 
 class PostSimulation: 
-    def __init__(self, simulation_dir, num_agents, Ts=0.25, dt=1e-3):
+    def __init__(self, simulation_dir, num_agents, Ts=None, dt=None):
         self.simulation_dir = simulation_dir
         self.num_agents = num_agents
         self.conversion_factor = 1e6
-        self.Ts = Ts
-        self.dt = dt
+        self.experiment = Experiment(simulation_dir, num_agents, self.conversion_factor)
+
+        # Timing and hysteresis thresholds from the params header of the logs (as run on the devices)
+        settings = self.experiment.settings()
+        self.Ts = Ts if Ts is not None else settings['Ts']
+        self.dt = dt if dt is not None else settings['dt']
         self.time_factor = 1 / 1000#self.dt / (self.Ts * 1000.0)
-        self.epsilon_on = 0.02
-        self.epsilon_off = 0.01
+        self.epsilon_on = settings['epsilon_on']
+        self.epsilon_off = settings['epsilon_off']
 
         self.data = {}  
 
@@ -24,42 +29,15 @@ class PostSimulation:
                 print(f"[Warning] File not found: {filename}")
                 continue
 
-            with open(filename, 'r') as f:
-                raw_content = json.load(f)
-
-            # Handle string-wrapped JSON (double encoded)
-            if isinstance(raw_content, str):
-                try:
-                    content = json.loads(raw_content)
-                except json.JSONDecodeError:
-                    print(f"[Error] Failed to decode JSON string in {filename}")
-                    continue
-            else:
-                content = raw_content
-            data_dict = content.get('data', {})
-
-            # Parse the lists as floats (or ints if appropriate)
-            timestamp = [int(x) for x in data_dict.get('timestamp', [])]
-            state = [int(x) for x in data_dict.get('state', [])]
-            vstate = [int(x) for x in data_dict.get('vstate', [])]
-            vartheta = [int(x) for x in data_dict.get('vartheta', [])]
-
-            # Sanity check: ensure all lists are the same length
-            min_len = min(len(timestamp), len(state), len(vstate), len(vartheta))
-            if min_len == 0:
+            # Columns decoded once and cached by the experiment (see Experiment.py)
+            if self.experiment.meta(i) is None:
+                continue
+            if self.experiment.length(i) == 0:
                 print(f"[Warning] Empty data in file: {filename}")
                 continue
 
-            # Truncate all to same length if needed
-            timestamp = timestamp[:min_len]
-            state     = state[:min_len]
-            vstate    = vstate[:min_len]
-            vartheta  = vartheta[:min_len]
-
             # Stack into [timestamp, state, vstate, vartheta]
-            node_data = np.stack([timestamp, state, vstate, vartheta], axis=1)
-
-            self.data[i] = node_data
+            self.data[i] = self.experiment.node_data(i)
 
     def hysteresis_analysis(self, agent=1):
         """
@@ -149,9 +127,9 @@ class PostSimulation:
 
             ax.plot(t, sigma, label=f'$\\sigma_{{{node_id}}}$')
 
-        ax.axhline(self.epsilon_off, color='k', linestyle='--', label='$\\pm \\epsilon = 0.01$')
+        ax.axhline(self.epsilon_off, color='k', linestyle='--', label=f'$\\pm \\epsilon = {self.epsilon_off:g}$')
         ax.axhline(-self.epsilon_off, color='k', linestyle='--')
-        ax.axhline(self.epsilon_on, color='r', linestyle='--', label='$\\pm \\bar{\\epsilon} = 0.02$')
+        ax.axhline(self.epsilon_on, color='r', linestyle='--', label=f'$\\pm \\bar{{\\epsilon}} = {self.epsilon_on:g}$')
         ax.axhline(-self.epsilon_on, color='r', linestyle='--')
         ax.set_ylim([-(self.epsilon_on * 1.5), (self.epsilon_on * 1.5)])
         ax.set_title('Error term $\\sigma_i$')
@@ -164,7 +142,10 @@ class PostSimulation:
         plt.show()
 
     def plot_timestamps_and_samples(self, num_points):
-        if not self.data:
+        # Only the timestamp and state columns (first num_points samples) are read, load_data is not needed
+        experiment = self.experiment
+        node_ids = [n for n in experiment.node_ids if experiment.length(n) > 0]
+        if not node_ids:
             return
 
         # Create a 3-row figure: timestamps, state evolution, and number of samples
@@ -172,12 +153,11 @@ class PostSimulation:
         markers = ['o', 'x', '*', 's', 'd', '^', 'v', '<', '>', 'p', 'h']
 
         # ---------------------- (1) TIMESTAMPS ----------------------
-        for i, node_id in enumerate(sorted(self.data.keys())):
-            node_data = self.data[node_id]
-            t = node_data[:num_points, 0] * self.time_factor
+        for i, node_id in enumerate(node_ids):
+            t = experiment.column(node_id, 'timestamp', samples=num_points)
 
             axs[0].plot(
-                range(num_points), t,
+                range(len(t)), t,
                 label=f'Node {node_id}',
                 linewidth=1.4,
                 marker=markers[i % len(markers)],
@@ -190,10 +170,9 @@ class PostSimulation:
         axs[0].grid(True, linestyle='--', alpha=0.6)
 
         # ---------------------- (2) STATE EVOLUTION ----------------------
-        for i, node_id in enumerate(sorted(self.data.keys())):
-            node_data = self.data[node_id]
-            t = node_data[:num_points, 0] * self.time_factor
-            x = node_data[:num_points, 1] / self.conversion_factor
+        for i, node_id in enumerate(node_ids):
+            t = experiment.column(node_id, 'timestamp', samples=num_points)
+            x = experiment.column(node_id, 'state', samples=num_points)
 
             axs[1].plot(
                 t, x,
@@ -208,13 +187,13 @@ class PostSimulation:
         axs[1].grid(True, linestyle='--', alpha=0.6)
 
         # Adjust y-limits dynamically to avoid "flat" appearance
-        all_x = np.concatenate([self.data[n][:num_points, 1] / self.conversion_factor for n in self.data])
+        all_x = np.concatenate([experiment.column(n, 'state', samples=num_points) for n in node_ids])
         y_mean, y_std = np.mean(all_x), np.std(all_x)
         axs[1].set_ylim(y_mean - 2*y_std, y_mean + 2*y_std)
 
         # ---------------------- (3) NUMBER OF SAMPLES PER AGENT ----------------------
-        agent_ids = sorted(self.data.keys())
-        num_samples = [self.data[n].shape[0] for n in agent_ids]
+        agent_ids = node_ids
+        num_samples = [experiment.length(n) for n in agent_ids]
         axs[2].set_xlabel('Agent ID')
         axs[2].bar(agent_ids, num_samples, color='skyblue', edgecolor='k', alpha=0.9)
         axs[2].set_ylabel('Number of Samples')
@@ -0,0 +1,313 @@
+import os
+import json
+import numpy as np
+from Algorithm import Algorithm
+
+class _ExpectedAlgorithm(Algorithm):
+    """
+    Algorithm with the random part of the disturbance replaced by its expectation
+    (Math.random() -> 0.5): the replay of x is the mean of the device trajectory.
+    """
+    def compute_disturbance(self):
+        t = self.cnt * self.dt
+        m = self.dist_amplitude * (0.5 - self.dist_offset)
+        sinusoidal = self.dist_A * np.sin(
+            2.0 * np.pi * self.dist_frequency * (t - self.dist_phase_shift)
+        )
+        return np.where(self.dist_on, m + self.dist_beta + sinusoidal, 0.0)
+
+
+class ReplayVerifier:
+    """
+    Offline replay of the device updates (Algorithm.update, i.e. algo.js) from the logged inputs.
+
+    Between two log lines k and k+1 a device runs n fast steps of algo.js with a constant
+    neighbor snapshot: the one logged at line k + 1 - snapshot_lag. On the archived runs
+    snapshot_lag = 1 (the snapshot logged with line k) reproduces z far better than the
+    snapshot logged with line k+1 (median residual 1 LSB vs 52 LSB). Every interval of every
+    node is a row of one Algorithm batch, started from the logged (x, z, vartheta) of line k,
+    and all rows are stepped together:
+    - z is deterministic given the snapshot: a first pass tracks, for every row, the step
+      count n whose floor(z * 1e6) best matches line k+1 (closest to the nominal
+      interval / dt on ties). n measures the effective update rate (missed updates), and a
+      residual larger than z_tol LSB plus half the z increment of one step means no number
+      of updates explains the log.
+    - x and vartheta are then replayed for exactly n steps with the expected disturbance
+      (cnt from the cumulative n). x residuals are scaled by the standard deviation of the
+      random disturbance over n steps, vartheta residuals by the per-step gain increment
+      eta * dt, and vartheta increments that are not a multiple of eta * dt (+/- the floor
+      of the two samples) are flagged as quantization errors.
+    """
+
+    def __init__(self, simulation_dir, num_agents, snapshot_lag=1, z_tol=2, x_sigmas=4.0, vartheta_steps=5,
+                 max_factor=2.0):
+        if snapshot_lag not in (0, 1):
+            raise ValueError(f"snapshot_lag must be 0 or 1, got {snapshot_lag}")
+        self.simulation_dir = simulation_dir
+        self.num_agents = num_agents
+        self.snapshot_lag = snapshot_lag        # 1: the snapshot logged with line k drives (k, k+1], 0: line k+1
+        self.z_tol = z_tol                      # z residual tolerance [LSB]
+        self.x_sigmas = x_sigmas                # x residual tolerance [disturbance std]
+        self.vartheta_steps = vartheta_steps    # vartheta residual tolerance [eta * dt]
+        self.max_factor = max_factor            # longest replayed interval, in median intervals
+
+        self.params = {}
+        self.logs = {}
+
+    def load_data(self):
+        for i in range(1, self.num_agents + 1):
+            filename = f"{self.simulation_dir}/{i}.json"
+
+            if not os.path.exists(filename):
+                print(f"[Warning] File not found: {filename}")
+                continue
+
+            with open(filename, 'r') as f:
+                raw_content = json.load(f)
+
+            # Handle string-wrapped JSON (double encoded)
+            if isinstance(raw_content, str):
+                try:
+                    content = json.loads(raw_content)
+                except json.JSONDecodeError:
+                    print(f"[Error] Failed to decode JSON string in {filename}")
+                    continue
+            else:
+                content = raw_content
+            params = content.get('params', {})
+            data_dict = content.get('data', {})
+            if not all(key in params for key in ('neighbors', 'dt', 'eta', 'disturbance')):
+                print(f"[Warning] Cannot replay {filename}: incomplete params header")
+                continue
+
+            columns = ['timestamp', 'state', 'vstate', 'vartheta'] + [str(j) for j in params.get('neighbors', [])]
+            absent = [key for key in columns if key not in data_dict]
+            if absent:
+                print(f"[Warning] Cannot replay {filename}: no columns {absent}")
+                continue
+            min_len = min(len(data_dict[key]) for key in columns)
+            if min_len < 2:
+                print(f"[Warning] Not enough samples in file: {filename}")
+                continue
+
+            # Failed fetches are logged as short rows: missing neighbor values become NaN
+            log = {key: np.array([np.nan if v is None else float(v) for v in data_dict[key][:min_len]])
+                   for key in columns}
+            self.params[i] = params
+            self.logs[i] = log
+
+    def _rows(self):
+        """
+        One row per logged interval (k, k+1) of every replayable node.
+        """
+        node_ids = sorted(self.logs)
+        max_deg = max(len(self.params[i]['neighbors']) for i in node_ids)
+        rows = {'node': [], 'k': [], 'start': [], 'target': [], 'interval': [], 'neighbors': [], 'enabled': []}
+        for idx, i in enumerate(node_ids):
+            log, params = self.logs[i], self.params[i]
+            n = len(log['timestamp'])
+            neighbors = np.full((n, max_deg), 0.0)
+            enabled = np.zeros((n, max_deg), dtype=bool)
+            for c, j in enumerate(params['neighbors']):
+                column = log[str(j)]
+                neighbors[:, c] = np.nan_to_num(column)
+                enabled[:, c] = np.isfinite(column)
+            rows['node'].append(np.full(n - 1, idx))
+            rows['k'].append(np.arange(n - 1))
+            rows['start'].append(np.stack([log['state'][:-1], log['vstate'][:-1], log['vartheta'][:-1]], axis=1))
+            rows['target'].append(np.stack([log['state'][1:], log['vstate'][1:], log['vartheta'][1:]], axis=1))
+            rows['interval'].append(np.diff(log['timestamp']))
+            lag = self.snapshot_lag
+            rows['neighbors'].append(neighbors[1 - lag:n - lag])
+            rows['enabled'].append(enabled[1 - lag:n - lag])
+        return node_ids, {key: np.concatenate(value) for key, value in rows.items()}
+
+    def _batch(self, node_ids, rows):
+        """
+        _ExpectedAlgorithm with one virtual node per row (per-node parameters repeated).
+        """
+        algo = _ExpectedAlgorithm()
+        algo.set_params([self.params[i] for i in node_ids])
+        for key in ('dt', 'clock', 'enabled', 'state0', 'vstate0', 'vartheta0', 'eta', 'dist_on', 'dist_offset',
+                    'dist_amplitude', 'dist_beta', 'dist_A', 'dist_frequency', 'dist_phase_shift', 'samples'):
+            setattr(algo, key, getattr(algo, key)[rows['node']])
+        algo.n_nodes = len(rows['node'])
+        algo.active = np.zeros(algo.n_nodes, dtype=bool)
+        algo.reset_initial_conditions()
+        return algo
+
+    def _start(self, algo, rows):
+        algo.state, algo.vstate, algo.vartheta = (rows['start'] * algo.inv_scale_factor).T.copy()
+
+    def replay(self):
+        """
+        Replays every logged interval of every node.
+        Returns:
+            tuple: (node_ids, rows) where rows holds per-interval arrays: 'node' (index into
+                   node_ids), 'k', 'steps' (inferred n), 'nominal', 'replayed' (False for
+                   intervals longer than max_factor median intervals), residuals
+                   'z_residual', 'x_residual', 'vartheta_residual' [LSB], 'x_score', and the
+                   flags 'z_mismatch', 'x_outlier', 'vartheta_mismatch', 'vartheta_quantization'.
+        """
+        node_ids, rows = self._rows()
+        algo = self._batch(node_ids, rows)
+        scale = algo.scale_factor
+        dt_ms = algo.dt * 1e3
+        nominal = np.maximum(np.rint(rows['interval'] / dt_ms), 1).astype(np.int64)
+        max_steps = int(np.ceil(self.max_factor * np.median(nominal)))
+        replayed = nominal <= max_steps
+        target = rows['target']
+
+        # Pass 1: z only, step count with the best match of the logged z
+        self._start(algo, rows)
+        best_score = np.full(algo.n_nodes, np.inf)
+        steps = nominal.copy()
+        z_residual = np.full(algo.n_nodes, np.nan)
+        z_increment = np.zeros(algo.n_nodes)
+        for s in range(1, max_steps + 1):
+            gi = algo.v_i(rows['neighbors'], rows['enabled'])
+            algo.vstate = np.maximum(0.0, algo.vstate + algo.dt * gi)
+            residual = np.floor(algo.vstate * scale) - target[:, 1]
+            score = np.abs(residual) * (max_steps + 1) + np.abs(s - nominal)
+            better = score < best_score
+            best_score = np.where(better, score, best_score)
+            steps = np.where(better, s, steps)
+            z_residual = np.where(better, residual, z_residual)
+            z_increment = np.where(better, np.abs(algo.dt * gi) * scale, z_increment)
+
+        # Pass 2: x and vartheta for the inferred step counts, disturbance counter from their sum
+        self._start(algo, rows)
+        abs_sigma = np.abs(rows['start'][:, 0] - rows['start'][:, 1]) / scale
+        previous_increase = np.zeros(algo.n_nodes, dtype=bool)
+        same_node = np.zeros(algo.n_nodes, dtype=bool)
+        same_node[1:] = rows['node'][1:] == rows['node'][:-1]
+        previous_increase[1:] = same_node[1:] & (rows['target'][:-1, 2] > rows['start'][:-1, 2])
+        algo.active = (abs_sigma > algo.epsilonON) | (previous_increase & (abs_sigma > algo.epsilonOFF))
+        counted = np.where(replayed, steps, nominal)
+        offsets = np.cumsum(counted) - counted
+        first = np.flatnonzero(~same_node)
+        node_offset = np.repeat(offsets[first], np.diff(np.append(first, algo.n_nodes)))
+        algo.cnt = (offsets - node_offset) % algo.samples
+        for s in range(1, max_steps + 1):
+            algo.update(rows['neighbors'], rows['enabled'], mask=s <= steps)
+        scaled = algo.scaled()
+
+        x_residual = scaled['state'] - target[:, 0]
+        x_std = algo.dt * algo.dist_amplitude * np.sqrt(steps / 12.0) * scale * algo.dist_on
+        x_score = np.abs(x_residual) / np.maximum(x_std, 1.0)
+        vartheta_residual = scaled['vartheta'] - target[:, 2]
+        increment = algo.eta * algo.dt * scale
+        delta = target[:, 2] - rows['start'][:, 2]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            remainder = delta - np.rint(delta / increment) * increment
+        quantization = (increment > 0) & (np.abs(np.nan_to_num(remainder)) > 2.0)
+
+        rows.update({
+            'steps': steps,
+            'nominal': nominal,
+            'replayed': replayed,
+            'z_residual': z_residual,
+            'x_residual': x_residual,
+            'x_score': x_score,
+            'vartheta_residual': vartheta_residual,
+            'z_mismatch': replayed & (np.abs(z_residual) > self.z_tol + z_increment / 2.0),
+            'x_outlier': replayed & (x_score > self.x_sigmas),
+            'vartheta_mismatch': replayed & (np.abs(vartheta_residual) > self.vartheta_steps * np.maximum(increment, 1.0)),
+            'vartheta_quantization': replayed & quantization,
+        })
+        return node_ids, rows
+
+    def replay_results(self, save=True):
+        """
+        Replays all intervals and summarizes the divergences per node.
+        Returns:
+            dict: {'nodes': {node_id: {...}}, 'network': {...}}; rates are fractions of the
+                  replayed intervals, 'missed_updates' is 1 - replayed steps / nominal steps and
+                  'effective_dt' the mean wall time per update [ms].
+        """
+        if not self.logs:
+            return {'nodes': {}, 'network': {}}
+        node_ids, rows = self.replay()
+        n = len(node_ids)
+        node = rows['node']
+        replayed = rows['replayed']
+        count = np.bincount(node, weights=replayed, minlength=n)
+        safe = np.maximum(count, 1)
+        per_node = lambda values: np.bincount(node, weights=values & replayed, minlength=n) / safe
+        steps = np.bincount(node, weights=np.where(replayed, rows['steps'], 0), minlength=n)
+        nominal = np.bincount(node, weights=np.where(replayed, rows['nominal'], 0), minlength=n)
+        time = np.bincount(node, weights=np.where(replayed, rows['interval'], 0), minlength=n)
+        abs_z = np.where(replayed, np.abs(rows['z_residual']), 0)
+        z_max = np.zeros(n)
+        np.maximum.at(z_max, node, abs_z)
+
+        flags = ('z_mismatch', 'x_outlier', 'vartheta_mismatch', 'vartheta_quantization')
+        rates = {flag: per_node(rows[flag]) for flag in flags}
+        nodes = {}
+        for idx, node_id in enumerate(node_ids):
+            nodes[node_id] = {
+                'intervals': int(np.count_nonzero(node == idx)),
+                'replayed': int(count[idx]),
+                'missed_updates': float(1.0 - steps[idx] / nominal[idx]) if nominal[idx] else None,
+                'effective_dt': float(time[idx] / steps[idx]) if steps[idx] else None,
+                'max_z_residual': float(z_max[idx]),
+                **{f"{flag}_rate": float(rates[flag][idx]) for flag in flags},
+                'first_divergence': next((int(k) for k, *f in zip(rows['k'][node == idx],
+                                                                 *(rows[flag][node == idx] for flag in flags))
+                                          if any(f)), None),
+            }
+        network = {
+            'experiment': os.path.basename(os.path.normpath(self.simulation_dir)),
+            'nodes': n,
+            'intervals': int(replayed.sum()),
+            'missed_updates': float(1.0 - steps.sum() / nominal.sum()),
+            **{f"{flag}_rate": float(np.mean(rows[flag][replayed])) for flag in flags},
+        }
+        results = {'nodes': nodes, 'network': network}
+
+        if save:
+            with open(f"{self.simulation_dir}/replay_results.json", 'w') as f:
+                json.dump(results, f, indent=4)
+            print(f"Replay results saved to {self.simulation_dir}/replay_results.json")
+        return results
+
+
+def verify_archive(data_root, **kwargs):
+    """
+    Network replay summary of every experiment directory under data_root.
+    Returns:
+        list: one network summary dict per experiment.
+    """
+    summaries = []
+    for name in sorted(os.listdir(data_root)):
+        directory = os.path.join(data_root, name)
+        if not os.path.isdir(directory):
+            continue
+        node_files = [int(f[:-5]) for f in os.listdir(directory) if f.endswith('.json') and f[:-5].isdigit()]
+        if not node_files:
+            continue
+        verifier = ReplayVerifier(directory, max(node_files), **kwargs)
+        verifier.load_data()
+        if verifier.logs:
+            summaries.append(verifier.replay_results(save=False)['network'])
+    return summaries
+
+
+if __name__ == "__main__":
+    import time
+
+    sim_name = "30node-clusters"
+    num_agents = 30
+    verifier = ReplayVerifier(simulation_dir=f"../data/{sim_name}", num_agents=num_agents)
+    verifier.load_data()
+    t0 = time.perf_counter()
+    results = verifier.replay_results(save=False)
+    print(f"Replayed {results['network']['intervals']} intervals in {time.perf_counter() - t0:.2f} s")
+    for node_id, node in results['nodes'].items():
+        print(f"Node {node_id}: effective dt = {node['effective_dt']:.2f} ms, "
+              f"missed = {100 * node['missed_updates']:.1f} %, z mismatch = {100 * node['z_mismatch_rate']:.1f} %, "
+              f"x outliers = {100 * node['x_outlier_rate']:.1f} %, "
+              f"vartheta mismatch = {100 * node['vartheta_mismatch_rate']:.1f} %")
+
+    for summary in verify_archive("../data"):
+        print(summary)
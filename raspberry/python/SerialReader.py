@@ -0,0 +1,378 @@
+import os
+import tty
+import json
+import time
+import asyncio
+import termios
+import selectors
+import warnings
+import numpy as np
+
+SERIAL_PATH = '/dev/ttyACM0'
+SERIAL_BAUD = 115200
+MAIN_COLUMNS = ('timestamp', 'state', 'vstate', 'vartheta')
+MISSING = np.iinfo(np.int64).min     # neighbor value not sent in a line
+
+def open_port(path, baud=SERIAL_BAUD):
+    """
+    Opens a serial device (or pty) non-blocking in raw mode, as serialport does for serial.js.
+    Returns:
+        int: file descriptor.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    tty.setraw(fd)
+    attrs = termios.tcgetattr(fd)
+    speed = getattr(termios, f"B{baud}")
+    attrs[4] = attrs[5] = speed
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+def parse_lines(lines, width):
+    """
+    Parses data lines of the nRF52 line protocol into an int64 matrix.
+    "d<timestamp>,<state>,<vstate>,<vartheta>,<neighbor_vstate1>,...,<neighbor_vstateN>"
+    (leading 'd' and line terminators already removed). All the lines of a read are parsed
+    by a single np.fromstring call; lines with fewer fields are padded with MISSING, fields
+    beyond width are dropped, and malformed lines are discarded.
+    Returns:
+        tuple: ((n_lines, width) int64 array, number of malformed lines)
+    """
+    if not lines:
+        return np.empty((0, width), dtype=np.int64), 0
+    counts = np.fromiter((line.count(b',') + 1 for line in lines), dtype=np.int64, count=len(lines))
+    # Unparsable text stops np.fromstring early (a warning or a ValueError depending on NumPy)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            values = np.fromstring(b','.join(lines).decode('ascii', 'replace'), dtype=np.int64, sep=',')
+        except ValueError:
+            values = np.empty(0, dtype=np.int64)
+    if values.size != counts.sum():
+        # Some line is malformed: parse line by line and drop the bad ones
+        good, parsed = [], []
+        for line in lines:
+            try:
+                parsed.append([int(v) for v in line.split(b',')])
+                good.append(len(parsed[-1]))
+            except ValueError:
+                continue
+        counts = np.asarray(good, dtype=np.int64)
+        values = np.fromiter((v for row in parsed for v in row), dtype=np.int64, count=int(counts.sum()))
+    n_bad = len(lines) - counts.size
+
+    keep = counts >= len(MAIN_COLUMNS)
+    rows = np.full((counts.size, width), MISSING, dtype=np.int64)
+    if np.all(counts == width):
+        rows[:] = values.reshape(-1, width)
+    else:
+        row_index = np.repeat(np.arange(counts.size), counts)
+        position = np.arange(values.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        inside = position < width
+        rows[row_index[inside], position[inside]] = values[inside]
+    return rows[keep], n_bad + int(np.count_nonzero(~keep))
+
+
+class RingBuffer:
+    """
+    Preallocated (capacity, width) int64 ring of parsed samples; the oldest samples are
+    overwritten when full.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.width = width
+        self.data = np.full((capacity, width), MISSING, dtype=np.int64)
+        self.head = 0           # next row to write
+        self.count = 0          # valid rows
+        self.total = 0          # rows ever written
+        self.overwritten = 0
+
+    def extend(self, rows):
+        n = len(rows)
+        if n == 0:
+            return
+        if n > self.capacity:
+            self.overwritten += n - self.capacity
+            rows = rows[-self.capacity:]
+            n = self.capacity
+        first = min(n, self.capacity - self.head)
+        self.data[self.head:self.head + first] = rows[:first]
+        self.data[:n - first] = rows[first:]
+        self.head = (self.head + n) % self.capacity
+        self.overwritten += max(0, self.count + n - self.capacity)
+        self.count = min(self.count + n, self.capacity)
+        self.total += n
+
+    def latest(self, n=None):
+        """
+        Copy of the last n samples (all if None), oldest first.
+        """
+        n = self.count if n is None else min(n, self.count)
+        index = (self.head - n + np.arange(n)) % self.capacity
+        return self.data[index]
+
+
+class _Port:
+    __slots__ = ("node", "path", "fd", "buffer", "remainder", "neighbors", "params", "bytes", "lines", "bad")
+
+    def __init__(self, node, path, fd, buffer, neighbors, params):
+        self.node = node
+        self.path = path
+        self.fd = fd
+        self.buffer = buffer
+        self.remainder = b''
+        self.neighbors = neighbors
+        self.params = params
+        self.bytes = 0
+        self.lines = 0
+        self.bad = 0
+
+
+class SerialReader:
+    """
+    Multiplexed reader of nRF52 serial streams (serial.js / edge.js BLE edge-process in Python).
+
+    Every port is opened non-blocking and registered in one selector (or, with run_async,
+    in the asyncio loop as a reader). Each read drains up to read_size bytes, splits the
+    complete lines, parses all the data lines of the read at once (parse_lines) and appends
+    them to the preallocated ring buffer of the node. Other message types (console output of
+    the firmware) are counted and skipped. The buffers are exposed as log-format columns
+    (columns, to_log, save), so the analysis tools (Experiment, PostSimulation, ...) and live
+    plots can use the samples directly.
+    """
+
+    def __init__(self, capacity=1 << 16, max_neighbors=8, read_size=1 << 16):
+        self.capacity = capacity
+        self.width = len(MAIN_COLUMNS) + max_neighbors
+        self.read_size = read_size
+        self.ports = {}
+        self.selector = selectors.DefaultSelector()
+
+    def add_port(self, node, path=SERIAL_PATH, baud=SERIAL_BAUD, neighbors=None, params=None):
+        """
+        Args:
+            node (int): node id of the device on this port.
+            neighbors (list): neighbor ids, in the order of the neighbor fields of the lines.
+            params (dict): params header written with the samples (to_log / save).
+        """
+        fd = open_port(path, baud)
+        port = _Port(node, path, fd, RingBuffer(self.capacity, self.width), neighbors or [], params or {})
+        self.ports[node] = port
+        self.selector.register(fd, selectors.EVENT_READ, port)
+        return port
+
+    def close(self):
+        for port in self.ports.values():
+            self.selector.unregister(port.fd)
+            os.close(port.fd)
+        self.ports = {}
+
+    def _read(self, port):
+        try:
+            chunk = os.read(port.fd, self.read_size)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        except OSError:
+            # pty closed by the device side
+            return 0
+        if not chunk:
+            return 0
+        port.bytes += len(chunk)
+        lines = (port.remainder + chunk).split(b'\n')
+        port.remainder = lines.pop()
+        # Lines end with "\n\r": strip the '\r' left at either end
+        data = []
+        for line in lines:
+            line = line.strip(b'\r')
+            if line[:1] == b'd':
+                data.append(line[1:])
+        rows, bad = parse_lines(data, self.width)
+        port.buffer.extend(rows)
+        port.lines += len(rows)
+        port.bad += bad
+        return len(rows)
+
+    def poll(self, timeout=None):
+        """
+        Reads every port with pending data once.
+        Returns:
+            int: number of samples parsed.
+        """
+        return sum(self._read(key.data) for key, _ in self.selector.select(timeout))
+
+    def run(self, duration, timeout=0.05):
+        """
+        Selector loop for duration seconds.
+        """
+        t_end = time.monotonic() + duration
+        while time.monotonic() < t_end:
+            self.poll(timeout)
+
+    async def run_async(self, stop):
+        """
+        Reads the ports from the running asyncio loop until the asyncio.Event stop is set.
+        """
+        loop = asyncio.get_running_loop()
+        for port in self.ports.values():
+            self.selector.unregister(port.fd)
+            loop.add_reader(port.fd, self._read, port)
+        try:
+            await stop.wait()
+        finally:
+            for port in self.ports.values():
+                loop.remove_reader(port.fd)
+                self.selector.register(port.fd, selectors.EVENT_READ, port)
+
+    def send(self, node, message):
+        """
+        Writes a command line to a device (messages of edge.js: 'n', 'a', 'p', 't').
+        """
+        os.write(self.ports[node].fd, message.encode())
+
+    def columns(self, node, n=None, scaled=False):
+        """
+        Last n samples of a node as log columns {'timestamp', 'state', 'vstate', 'vartheta',
+        <neighbor id>: ...}; missing neighbor values are NaN.
+        """
+        port = self.ports[node]
+        rows = port.buffer.latest(n)
+        columns = {name: rows[:, c] for c, name in enumerate(MAIN_COLUMNS)}
+        for c, neighbor in enumerate(port.neighbors[:self.width - len(MAIN_COLUMNS)]):
+            values = rows[:, len(MAIN_COLUMNS) + c].astype(np.float64)
+            values[rows[:, len(MAIN_COLUMNS) + c] == MISSING] = np.nan
+            columns[str(neighbor)] = values
+        if scaled:
+            columns = {name: values / (1000.0 if name == 'timestamp' else 1e6) for name, values in columns.items()}
+        return columns
+
+    def to_log(self, node):
+        """
+        Buffered samples of a node in the device log format ({'params', 'data'}, see log.js).
+        """
+        data = {name: [None if np.isnan(v) else int(v) for v in values] if values.dtype.kind == 'f'
+                else values.tolist() for name, values in self.columns(node).items()}
+        return {'params': self.ports[node].params, 'data': data}
+
+    def save(self, output_dir):
+        """
+        Writes <node>.json logs of all ports, readable by the analysis tools.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        for node in self.ports:
+            with open(os.path.join(output_dir, f"{node}.json"), 'w') as f:
+                json.dump(self.to_log(node), f)
+
+    def stats(self):
+        return {
+            node: {'bytes': port.bytes, 'samples': port.lines, 'malformed': port.bad,
+                   'buffered': port.buffer.count, 'overwritten': port.buffer.overwritten}
+            for node, port in self.ports.items()
+        }
+
+
+class FakeDevice:
+    """
+    Pseudo-terminal stand-in of an nRF52 board: a child process writes data lines
+    (timestamps counting samples) to the pty master, at a given rate or as fast as the
+    reader drains them; the reader opens the slave path like /dev/ttyACM0.
+    """
+
+    def __init__(self, node=1, n_neighbors=3, rate=None, block_lines=256):
+        self.node = node
+        self.n_neighbors = n_neighbors
+        self.rate = rate                # lines per second, None: maximal
+        self.block_lines = block_lines
+        self.master, slave = os.openpty()
+        self.path = os.ttyname(slave)
+        tty.setraw(slave)
+        self._slave = slave
+        self.pid = None
+
+    def _lines(self, k0):
+        k = np.arange(k0, k0 + self.block_lines)
+        fields = [k, 2_000_000 + k % 1000, 3_000_000 + k % 977, 500_000 + k % 13]
+        fields += [4_000_000 + (k * (j + 3)) % 1009 for j in range(self.n_neighbors)]
+        rows = np.stack(fields, axis=1)
+        return b''.join(b'd' + b','.join(b'%d' % v for v in row) + b'\n\r' for row in rows.tolist())
+
+    def start(self):
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                os.close(self._slave)
+                k, t0 = 0, time.monotonic()
+                block = self._lines(0)
+                while True:
+                    if k > 0:
+                        block = self._lines(k)
+                    view = memoryview(block)
+                    while view:
+                        view = view[os.write(self.master, view):]
+                    k += self.block_lines
+                    if self.rate is not None:
+                        time.sleep(max(0.0, t0 + k / self.rate - time.monotonic()))
+            except OSError:
+                pass
+            finally:
+                os._exit(0)
+        return self
+
+    def stop(self):
+        if self.pid:
+            try:
+                os.kill(self.pid, 9)
+                os.waitpid(self.pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.pid = None
+        for fd in (self.master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def benchmark(port_counts=(1, 4, 16), duration=2.0, n_neighbors=3):
+    """
+    Reader throughput against pty fake devices emitting at maximal rate.
+    Returns:
+        list: [{'ports', 'samples_per_s', 'mb_per_s', 'gaps', 'malformed'}] (gaps: timestamps
+              not following the previous one, i.e. lost or corrupted lines).
+    """
+    results = []
+    for n_ports in port_counts:
+        devices = [FakeDevice(node=i + 1, n_neighbors=n_neighbors) for i in range(n_ports)]
+        reader = SerialReader(capacity=1 << 20)
+        for device in devices:
+            reader.add_port(device.node, device.path, neighbors=list(range(n_neighbors)))
+        for device in devices:
+            device.start()
+        try:
+            reader.run(0.2)
+            base = {node: port.buffer.total for node, port in reader.ports.items()}
+            bytes0 = sum(port.bytes for port in reader.ports.values())
+            t0 = time.perf_counter()
+            reader.run(duration)
+            elapsed = time.perf_counter() - t0
+        finally:
+            for device in devices:
+                device.stop()
+        samples = sum(port.buffer.total - base[node] for node, port in reader.ports.items())
+        gaps = sum(int(np.count_nonzero(np.diff(port.buffer.latest()[:, 0]) != 1)) for port in reader.ports.values())
+        results.append({
+            'ports': n_ports,
+            'samples_per_s': samples / elapsed,
+            'mb_per_s': (sum(port.bytes for port in reader.ports.values()) - bytes0) / elapsed / 1e6,
+            'gaps': gaps,
+            'malformed': sum(port.bad for port in reader.ports.values()),
+        })
+        reader.close()
+    return results
+
+
+if __name__ == "__main__":
+    # 115200 baud carries ~11.5 kB/s, i.e. ~250 lines/s of a 4-neighbor node
+    print(f"{'ports':>6s} {'samples/s':>12s} {'MB/s':>8s} {'gaps':>6s} {'malformed':>10s}")
+    for result in benchmark():
+        print(f"{result['ports']:6d} {result['samples_per_s']:12.0f} {result['mb_per_s']:8.2f} "
+              f"{result['gaps']:6d} {result['malformed']:10d}")
@@ -0,0 +1,260 @@
+import os
+import json
+import numpy as np
+
+class StalenessAnalysis:
+    """
+    Per-edge information delay, staleness and loss from the neighbor columns of the device logs.
+
+    Every log line also holds the vstate received from each neighbor (column keyed by the
+    neighbor id in `data`), fetched by the slow network loop every `clock` ms from the
+    neighbor's live vstate. A received value r at time t is located on the neighbor's own
+    logged z timeline: searchsorted over the neighbor timestamps gives the last sample before
+    t (+ max_offset), and the latest of the preceding `window` segments whose values bracket r
+    gives, by linear interpolation, the time t' at which the neighbor held r. t - t' is the age
+    of the information; on the samples where the received value changes it is the delay of
+    the link.
+
+    Timestamps are relative to each node's own trigger (Date.now() - time0 in edge.js), so
+    delays include the trigger offset between the two nodes. For edges read in both directions
+    the offset is estimated as half the difference of the two median delays and removed.
+    Edges read in one direction only keep the raw (offset-biased) delays: they are reported
+    per edge with 'offset' None but left out of the per-link-type pooled quantiles.
+    """
+    QUANTILES = (0.05, 0.25, 0.50, 0.75, 0.95)
+
+    def __init__(self, simulation_dir, num_agents, window=8, max_offset=None, conversion_factor=1e6):
+        self.simulation_dir = simulation_dir
+        self.num_agents = num_agents
+        self.window = window                # candidate neighbor segments per received sample
+        self.max_offset = max_offset        # tolerated trigger offset [ms], defaults to one clock
+        self.conversion_factor = conversion_factor
+
+        self.nodes = {}
+
+    def load_data(self):
+        for i in range(1, self.num_agents + 1):
+            filename = f"{self.simulation_dir}/{i}.json"
+
+            if not os.path.exists(filename):
+                print(f"[Warning] File not found: {filename}")
+                continue
+
+            with open(filename, 'r') as f:
+                raw_content = json.load(f)
+
+            # Handle string-wrapped JSON (double encoded)
+            if isinstance(raw_content, str):
+                try:
+                    content = json.loads(raw_content)
+                except json.JSONDecodeError:
+                    print(f"[Error] Failed to decode JSON string in {filename}")
+                    continue
+            else:
+                content = raw_content
+            params = content.get('params', {})
+            data_dict = content.get('data', {})
+
+            timestamp = np.asarray(data_dict.get('timestamp', []), dtype=np.float64)
+            vstate = np.asarray(data_dict.get('vstate', []), dtype=np.float64)
+            min_len = min(len(timestamp), len(vstate))
+            if min_len < 2:
+                print(f"[Warning] Not enough samples in file: {filename}")
+                continue
+
+            # Failed fetches are logged as short rows: missing entries become NaN
+            neighbors = {}
+            absent = [j for j in params.get('neighbors', []) if str(j) not in data_dict]
+            if absent:
+                print(f"[Warning] No columns for neighbors {absent} in {filename}")
+            for j in params.get('neighbors', []):
+                column = data_dict.get(str(j))
+                if column is None:
+                    continue
+                column = np.array([np.nan if v is None else float(v) for v in column[:min_len]])
+                neighbors[int(j)] = np.pad(column, (0, min_len - len(column)), constant_values=np.nan)
+
+            self.nodes[i] = {
+                't': timestamp[:min_len],
+                'z': vstate[:min_len],
+                'clock': float(params.get('clock', np.nan)),
+                'neighbors': neighbors,
+                'types': {int(j): kind for j, kind in params.get('neighborTypes', {}).items()},
+            }
+
+    def source_times(self, i, j):
+        """
+        Time t' (on the clock of node j) at which node j held each value received by node i.
+        Returns:
+            np.ndarray: (samples,) source times [ms], NaN where the value was missing or could
+                        not be located in the window.
+        """
+        node, neighbor = self.nodes[i], self.nodes[j]
+        t, received = node['t'], node['neighbors'][j]
+        tj, zj = neighbor['t'], neighbor['z']
+        max_offset = self.max_offset if self.max_offset is not None else node['clock']
+
+        # Candidate segments (end index e, from e - 1 to e), latest first
+        hi = np.searchsorted(tj, t + max_offset, side='right') - 1
+        ends = hi[:, None] - np.arange(self.window)[None, :]
+        valid = ends >= 1
+        ends = np.clip(ends, 1, len(tj) - 1)
+        a, b = zj[ends - 1], zj[ends]
+        r = received[:, None]
+        inside = valid & ((r - a) * (r - b) <= 0)
+
+        found = inside.any(axis=1)
+        w = np.argmax(inside, axis=1)
+        rows = np.arange(len(t))
+        a, b, e = a[rows, w], b[rows, w], ends[rows, w]
+        # Plateaus (a == b == r) resolve to the later end: the smallest consistent age
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(b != a, (received - a) / (b - a), 1.0)
+        source = tj[e - 1] + frac * (tj[e] - tj[e - 1])
+        return np.where(found, source, np.nan)
+
+    def edge_metrics(self, i, j, offset=0.0):
+        """
+        Args:
+            offset (float): trigger offset of node i with respect to node j [ms], removed from the delays.
+        Returns:
+            dict: 'delay' and 'age' quantiles [ms] (delay: samples where the received value
+                  changed; age: all located samples), fractions of missing, located and repeated
+                  samples, and 'loss': missing samples plus repeats while the neighbor's own z
+                  changed over the sampling interval (an update was available but not received).
+                  Negative ages (the max_offset look-ahead located the value after t) are
+                  clamped to 0 and their fraction of the located samples reported as 'negative'.
+        """
+        node, neighbor = self.nodes[i], self.nodes[j]
+        t, received = node['t'], node['neighbors'][j]
+        n = len(t)
+
+        age = t - self.source_times(i, j) - offset
+        located = np.isfinite(age)
+        negative = located & (age < 0)
+        age[negative] = 0.0
+        fresh = np.zeros(n, dtype=bool)
+        fresh[1:] = received[1:] != received[:-1]
+        fresh[0] = True
+        missing = ~np.isfinite(received)
+        repeated = np.zeros(n, dtype=bool)
+        repeated[1:] = received[1:] == received[:-1]
+
+        # Neighbor z at the receive times (shifted by the delay-free offset) changed?
+        z_at = np.interp(t - offset, neighbor['t'], neighbor['z'])
+        changed = np.zeros(n, dtype=bool)
+        changed[1:] = z_at[1:] != z_at[:-1]
+        lost = missing | (repeated & changed)
+
+        delays = age[fresh & located]
+        ages = age[located]
+        quantiles = lambda x: dict(zip((f"p{int(q * 100)}" for q in self.QUANTILES),
+                                       np.quantile(x, self.QUANTILES).tolist())) if x.size else None
+        return {
+            'type': node['types'].get(j),
+            'samples': n,
+            'missing': float(np.mean(missing)),
+            'located': float(np.mean(located)),
+            'repeated': float(np.mean(repeated)),
+            'negative': float(np.sum(negative) / np.sum(located)) if np.any(located) else 0.0,
+            'loss': float(np.mean(lost)),
+            'delay': quantiles(delays),
+            'age': quantiles(ages),
+            'age_in_clocks': float(np.median(ages) / node['clock']) if ages.size else None,
+            '_delays': delays,
+            '_ages': ages,
+        }
+
+    def clock_offsets(self):
+        """
+        Trigger offset of node i with respect to node j [ms], for the node pairs reading each
+        other, assuming symmetric link delays: (median delay i<-j - median delay j<-i) / 2.
+        Returns:
+            dict: {(i, j): offset}, antisymmetric.
+        """
+        medians = {}
+        for i, node in self.nodes.items():
+            for j in node['neighbors']:
+                if j in self.nodes:
+                    age = node['t'] - self.source_times(i, j)
+                    if np.any(np.isfinite(age)):
+                        medians[(i, j)] = float(np.nanmedian(age))
+        offsets = {}
+        for (i, j), d_ij in medians.items():
+            if (j, i) in medians:
+                offsets[(i, j)] = (d_ij - medians[(j, i)]) / 2.0
+        return offsets
+
+    def staleness_results(self, save=True):
+        """
+        Computes the metrics of every edge i -> j (node i reads node j) and pools them by link type.
+        Only the edges with an estimated trigger offset enter the pooled delay and age quantiles;
+        the others are counted as 'uncalibrated'.
+        Returns:
+            dict: {'edges': {"i->j": {...}}, 'by_type': {type: {...}}}
+        """
+        offsets = self.clock_offsets()
+        edges, pooled = {}, {}
+        for i in sorted(self.nodes):
+            for j in sorted(self.nodes[i]['neighbors']):
+                if j not in self.nodes:
+                    print(f"[Warning] No log for neighbor {j} of node {i}")
+                    continue
+                offset = offsets.get((i, j), 0.0)
+                metrics = self.edge_metrics(i, j, offset)
+                metrics['offset'] = offset if (i, j) in offsets else None
+                kind = pooled.setdefault(metrics['type'], {'delays': [], 'ages': [], 'loss': [],
+                                                           'edges': 0, 'uncalibrated': 0})
+                delays, ages = metrics.pop('_delays'), metrics.pop('_ages')
+                if metrics['offset'] is None:
+                    kind['uncalibrated'] += 1
+                else:
+                    kind['delays'].append(delays)
+                    kind['ages'].append(ages)
+                kind['loss'].append(metrics['loss'])
+                kind['edges'] += 1
+                edges[f"{i}->{j}"] = metrics
+
+        by_type = {}
+        for kind, values in pooled.items():
+            delays = np.concatenate(values['delays']) if values['delays'] else np.empty(0)
+            ages = np.concatenate(values['ages']) if values['ages'] else np.empty(0)
+            by_type[str(kind)] = {
+                'edges': values['edges'],
+                'uncalibrated': values['uncalibrated'],
+                'loss': float(np.mean(values['loss'])),
+                'delay_p50': float(np.median(delays)) if delays.size else None,
+                'delay_p95': float(np.quantile(delays, 0.95)) if delays.size else None,
+                'age_p50': float(np.median(ages)) if ages.size else None,
+                'age_p95': float(np.quantile(ages, 0.95)) if ages.size else None,
+            }
+        results = {'edges': edges, 'by_type': by_type}
+
+        if save:
+            with open(f"{self.simulation_dir}/staleness_results.json", 'w') as f:
+                json.dump(results, f, indent=4)
+            print(f"Staleness results saved to {self.simulation_dir}/staleness_results.json")
+        return results
+
+
+if __name__ == "__main__":
+    sim_name = "30node-clusters"
+    num_agents = 30
+    staleness = StalenessAnalysis(simulation_dir=f"../data/{sim_name}", num_agents=num_agents)
+    staleness.load_data()
+    results = staleness.staleness_results(save=False)
+    worst = sorted(results['edges'], key=lambda e: results['edges'][e]['loss'], reverse=True)
+    for edge in worst[:5]:
+        metrics = results['edges'][edge]
+        print(f"Edge {edge} ({metrics['type']}): loss = {metrics['loss']:.3f}, "
+              f"delay p50 = {metrics['delay']['p50']:.0f} ms, age p95 = {metrics['age']['p95']:.0f} ms")
+    uncalibrated = [edge for edge, metrics in results['edges'].items() if metrics['offset'] is None]
+    if uncalibrated:
+        print(f"[Warning] No trigger offset for one-way edges {uncalibrated}: left out of the pooled delays")
+    for kind, metrics in results['by_type'].items():
+        if metrics['delay_p50'] is None:
+            print(f"{kind:>8s}: {metrics['edges']} edges, loss = {metrics['loss']:.3f}, no calibrated edges")
+            continue
+        print(f"{kind:>8s}: {metrics['edges']} edges, loss = {metrics['loss']:.3f}, "
+              f"delay p50/p95 = {metrics['delay_p50']:.0f}/{metrics['delay_p95']:.0f} ms, "
+              f"age p50/p95 = {metrics['age_p50']:.0f}/{metrics['age_p95']:.0f} ms")
@@ -0,0 +1,203 @@
+import os
+import json
+import numpy as np
+
+class TimingAnalysis:
+    """
+    Timestamp jitter and clock-drift analytics over the device logs.
+
+    Every node logs one sample per network period (`clock` in ms), so the
+    timestamp column alone tells us how well each node keeps its schedule.
+    All metrics are computed with vectorized NumPy reductions over the full
+    timestamp arrays and summarized as quantiles and fixed-edge histograms.
+    """
+    QUANTILES = (0.0, 0.01, 0.05, 0.25, 0.50, 0.75, 0.95, 0.99, 1.0)
+
+    def __init__(self, simulation_dir, num_agents, clock=None, drop_factor=1.5, hist_max=4.0, hist_bins=32):
+        self.simulation_dir = simulation_dir
+        self.num_agents = num_agents
+        self.clock = clock                  # nominal period [ms], overrides the params header if given
+        self.drop_factor = drop_factor      # interval > drop_factor * clock --> dropped sample(s)
+        self.hist_max = hist_max            # histogram upper edge in units of clock
+        self.hist_bins = hist_bins
+
+        self.timestamps = {}
+        self.clocks = {}
+
+    def load_data(self):
+        for i in range(1, self.num_agents + 1):
+            filename = f"{self.simulation_dir}/{i}.json"
+
+            if not os.path.exists(filename):
+                print(f"[Warning] File not found: {filename}")
+                continue
+
+            with open(filename, 'r') as f:
+                raw_content = json.load(f)
+
+            # Handle string-wrapped JSON (double encoded)
+            if isinstance(raw_content, str):
+                try:
+                    content = json.loads(raw_content)
+                except json.JSONDecodeError:
+                    print(f"[Error] Failed to decode JSON string in {filename}")
+                    continue
+            else:
+                content = raw_content
+
+            timestamp = np.asarray(content.get('data', {}).get('timestamp', []), dtype=np.int64)
+            if timestamp.size < 2:
+                print(f"[Warning] Not enough samples in file: {filename}")
+                continue
+
+            clock = self.clock if self.clock is not None else content.get('params', {}).get('clock')
+            if clock is None:
+                print(f"[Warning] No clock in params of {filename}, skipping")
+                continue
+
+            self.timestamps[i] = timestamp
+            self.clocks[i] = float(clock)
+
+    def interval_statistics(self):
+        """
+        Inter-sample interval distribution per node.
+        Returns:
+            dict: {node_id: {'count', 'mean', 'std', 'quantiles', 'histogram'}}, intervals in ms.
+                  Histogram edges are in units of the nominal clock, shared by all nodes.
+        """
+        edges = np.linspace(0.0, self.hist_max, self.hist_bins + 1)
+        results = {}
+        for node_id, ts in self.timestamps.items():
+            dts = np.diff(ts)
+            counts, _ = np.histogram(np.minimum(dts / self.clocks[node_id], self.hist_max), bins=edges)
+            results[node_id] = {
+                'count': int(dts.size),
+                'mean': float(dts.mean()),
+                'std': float(dts.std()),
+                'quantiles': dict(zip((f"p{int(q * 100)}" for q in self.QUANTILES),
+                                      np.quantile(dts, self.QUANTILES).tolist())),
+                'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+            }
+        return results
+
+    def drift(self):
+        """
+        Drift of the effective sampling period with respect to the nominal clock.
+        The effective period is the least-squares slope of timestamp vs. sample index.
+        Returns:
+            dict: {node_id: {'nominal_period', 'effective_period', 'drift_ppm', 'duration'}}
+        """
+        results = {}
+        for node_id, ts in self.timestamps.items():
+            k = np.arange(ts.size, dtype=np.float64)
+            t = ts.astype(np.float64)
+            k_c = k - k.mean()
+            slope = np.dot(k_c, t - t.mean()) / np.dot(k_c, k_c)
+            clock = self.clocks[node_id]
+            results[node_id] = {
+                'nominal_period': clock,
+                'effective_period': float(slope),
+                'drift_ppm': float((slope - clock) / clock * 1e6),
+                'duration': float(ts[-1] - ts[0]),
+            }
+        return results
+
+    def dropped_samples(self):
+        """
+        Dropped-sample detection: every interval longer than drop_factor * clock
+        is counted as round(interval / clock) - 1 missing samples.
+        Returns:
+            dict: {node_id: {'gaps', 'dropped', 'drop_rate', 'longest_gap'}}
+        """
+        results = {}
+        for node_id, ts in self.timestamps.items():
+            dts = np.diff(ts)
+            clock = self.clocks[node_id]
+            gaps = dts > self.drop_factor * clock
+            dropped = int(np.sum(np.rint(dts[gaps] / clock) - 1))
+            results[node_id] = {
+                'gaps': int(np.count_nonzero(gaps)),
+                'dropped': dropped,
+                'drop_rate': dropped / (ts.size + dropped),
+                'longest_gap': float(dts.max()),
+            }
+        return results
+
+    def cross_node_skew(self):
+        """
+        Cross-node skew of the sampling schedules.
+        'start_offset' is the first timestamp relative to the earliest node. 'phase' is the
+        circular mean of (timestamp mod clock) relative to the network mean phase, which is
+        insensitive to dropped samples; 'phase_jitter' is its circular standard deviation.
+        Returns:
+            dict: {node_id: {'start_offset', 'phase', 'phase_jitter'}}, all in ms.
+        """
+        if not self.timestamps:
+            return {}
+
+        node_ids = sorted(self.timestamps.keys())
+        t_start = min(self.timestamps[n][0] for n in node_ids)
+        ref_clock = np.median([self.clocks[n] for n in node_ids])
+
+        phasors = np.empty(len(node_ids), dtype=np.complex128)
+        jitter = np.empty(len(node_ids))
+        for idx, node_id in enumerate(node_ids):
+            angles = 2.0 * np.pi * (self.timestamps[node_id] % self.clocks[node_id]) / self.clocks[node_id]
+            phasors[idx] = np.mean(np.exp(1j * angles))
+            R = np.clip(np.abs(phasors[idx]), 1e-12, 1.0)
+            jitter[idx] = np.sqrt(-2.0 * np.log(R)) * self.clocks[node_id] / (2.0 * np.pi)
+
+        mean_angle = np.angle(np.sum(phasors))
+        rel = np.angle(phasors * np.exp(-1j * mean_angle)) * ref_clock / (2.0 * np.pi)
+
+        return {
+            node_id: {
+                'start_offset': float(self.timestamps[node_id][0] - t_start),
+                'phase': float(rel[idx]),
+                'phase_jitter': float(jitter[idx]),
+            }
+            for idx, node_id in enumerate(node_ids)
+        }
+
+    def timing_results(self, save=True):
+        """
+        Computes all timing metrics and ranks nodes by the 95th percentile of their sampling
+        intervals (longest first): the nodes whose late updates limit the consensus speed.
+        Returns:
+            dict: {'nodes': {node_id: {...}}, 'ranking': [node_id, ...]}
+        """
+        intervals = self.interval_statistics()
+        drift = self.drift()
+        dropped = self.dropped_samples()
+        skew = self.cross_node_skew()
+
+        nodes = {
+            node_id: {
+                'intervals': intervals[node_id],
+                'drift': drift[node_id],
+                'dropped': dropped[node_id],
+                'skew': skew[node_id],
+            }
+            for node_id in sorted(self.timestamps.keys())
+        }
+        ranking = sorted(nodes, key=lambda n: nodes[n]['intervals']['quantiles']['p95'], reverse=True)
+        results = {'nodes': nodes, 'ranking': ranking}
+
+        if save:
+            with open(f"{self.simulation_dir}/timing_results.json", 'w') as f:
+                json.dump(results, f, indent=4)
+            print(f"Timing results saved to {self.simulation_dir}/timing_results.json")
+        return results
+
+
+if __name__ == "__main__":
+    sim_name = "30node-clusters"
+    num_agents = 30
+    timing = TimingAnalysis(simulation_dir=f"../data/{sim_name}", num_agents=num_agents)
+    timing.load_data()
+    results = timing.timing_results(save=False)
+    for node_id in results['ranking'][:5]:
+        node = results['nodes'][node_id]
+        print(f"Node {node_id}: p50 = {node['intervals']['quantiles']['p50']:.0f} ms, "
+              f"p95 = {node['intervals']['quantiles']['p95']:.0f} ms, "
+              f"drift = {node['drift']['drift_ppm']:.0f} ppm, dropped = {node['dropped']['dropped']}")
@@ -0,0 +1,210 @@
+import os
+import json
+import numpy as np
+import matplotlib.pyplot as plt
+from Experiment import Experiment, CACHE_ROOT, cache_directory
+
+def level_sizes(n):
+    """
+    Number of buckets of every level of a pyramid over n samples (level k: buckets of 2^k samples).
+    """
+    sizes = [n]
+    while sizes[-1] > 1:
+        sizes.append((sizes[-1] + 1) // 2)
+    return sizes
+
+def build_levels(values):
+    """
+    min/max/mean pyramid of a 1D series: level 0 is the series itself, every next level merges
+    pairs of buckets of the previous one (the last bucket of a level may be partial).
+    Returns:
+        np.ndarray: (sum(level_sizes(n)), 3) [min, max, mean], levels concatenated.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = values.size
+    sizes = level_sizes(n)
+    out = np.empty((sum(sizes), 3))
+    counts = np.ones(n)
+    mn, mx, mean = values, values, values
+    offset = 0
+    for size in sizes:
+        out[offset:offset + size, 0] = mn
+        out[offset:offset + size, 1] = mx
+        out[offset:offset + size, 2] = mean
+        offset += size
+        if size == 1:
+            break
+        if size % 2:
+            # Odd level: the last bucket is carried alone (zero-weight pad)
+            mn, mx = np.append(mn, mn[-1]), np.append(mx, mx[-1])
+            mean, counts = np.append(mean, 0.0), np.append(counts, 0.0)
+        total = counts[0::2] + counts[1::2]
+        mean = (mean[0::2] * counts[0::2] + mean[1::2] * counts[1::2]) / total
+        mn = np.minimum(mn[0::2], mn[1::2])
+        mx = np.maximum(mx[0::2], mx[1::2])
+        counts = total
+    return out
+
+
+class TrajectoryPyramid:
+    """
+    Precomputed multi-resolution views of the node trajectories of an experiment.
+
+    For every node and column (state, vstate, vartheta and sigma = state - vstate) a pyramid
+    of min/max/mean levels with 2^k decimation is stored in the cache directory of the
+    experiment (Experiment.cache_directory, under CACHE_ROOT by default, outside the data
+    tree): one .npy per node and column plus the bucket times, memory-mapped when queried and
+    rebuilt when the log changes. A query for a time window and a pixel width locates the
+    window on the sample timestamps and returns the coarsest level with at least `width`
+    buckets in it: at most 2 * width buckets are read, whatever the length of the experiment.
+    """
+    COLUMNS = ('state', 'vstate', 'vartheta', 'sigma')
+
+    def __init__(self, simulation_dir, num_agents=None, experiment=None, cache=CACHE_ROOT):
+        """
+        Args:
+            cache: cache root of the pyramids (and of the columns of the experiment if it is
+                   not given), True for <simulation_dir>/.cache in the data directory.
+        """
+        if not cache:
+            raise ValueError("TrajectoryPyramid needs a disk cache (a cache root or True)")
+        self.simulation_dir = simulation_dir
+        self.experiment = experiment if experiment is not None else Experiment(simulation_dir, num_agents, cache=cache)
+        self.pyramid_dir = os.path.join(cache_directory(simulation_dir, cache), 'pyramid')
+        self._meta = {}
+        self._arrays = {}
+
+    def _path(self, node, name):
+        return os.path.join(self.pyramid_dir, f"{node}.{name}")
+
+    def _write(self, path, array):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+
+    def build(self, nodes=None, force=False):
+        """
+        Builds the pyramids of the given nodes (all by default) that are missing or outdated.
+        """
+        os.makedirs(self.pyramid_dir, exist_ok=True)
+        for node in (self.experiment.node_ids if nodes is None else nodes):
+            meta = self.experiment.meta(node)
+            if meta is None or meta['length'] == 0:
+                continue
+            meta_path = self._path(node, 'meta.json')
+            if not force and os.path.exists(meta_path):
+                with open(meta_path, 'r') as f:
+                    if json.load(f)['signature'] == meta['signature']:
+                        continue
+
+            columns = {name: self.experiment.column(node, name) for name in ('timestamp', 'state', 'vstate', 'vartheta')}
+            columns['sigma'] = columns['state'] - columns['vstate']
+            self._write(self._path(node, 't.npy'), build_levels(columns.pop('timestamp'))[:, 2])
+            for name in self.COLUMNS:
+                self._write(self._path(node, f"{name}.npy"), build_levels(columns[name]))
+            with open(meta_path + '.tmp', 'w') as f:
+                json.dump({'signature': meta['signature'], 'length': meta['length']}, f)
+            os.replace(meta_path + '.tmp', meta_path)
+            self._meta.pop(node, None)
+            self._arrays = {key: value for key, value in self._arrays.items() if key[0] != node}
+
+    def _load(self, node, name):
+        key = (node, name)
+        if key not in self._arrays:
+            if node not in self._meta:
+                # Missing, or stored for another signature of the log: (re)built first
+                self.build([node])
+                with open(self._path(node, 'meta.json'), 'r') as f:
+                    meta = json.load(f)
+                sizes = level_sizes(meta['length'])
+                self._meta[node] = {'length': meta['length'], 'sizes': sizes,
+                                    'offsets': np.concatenate([[0], np.cumsum(sizes)[:-1]])}
+            self._arrays[key] = np.load(self._path(node, f"{name}.npy"), mmap_mode='r')
+        return self._arrays[key]
+
+    def query(self, node, column, t_range=None, width=1000):
+        """
+        Args:
+            t_range (tuple): (t0, t1) [s], the whole experiment if None.
+            width (int): pixel width of the plot.
+        Returns:
+            dict: 'level' (buckets of 2^level samples), bucket mean times 't' [s] and
+                  'min', 'max', 'mean' of the column (scaled as Experiment.column), empty if
+                  no sample falls in the window.
+        """
+        times = self._load(node, 't')
+        levels = self._load(node, column)
+        meta = self._meta[node]
+        n = meta['length']
+
+        # Window on the level-0 timestamps, then bucket indices by shifts
+        if t_range is None:
+            lo, hi = 0, n
+        else:
+            lo, hi = (int(i) for i in np.searchsorted(times[:n], t_range, side='left'))
+        if lo >= n or hi <= lo:
+            # No sample in the window
+            empty = np.empty(0)
+            return {'level': 0, 't': empty, 'min': empty, 'max': empty, 'mean': empty}
+        level = max(0, int(np.floor(np.log2((hi - lo) / max(width, 1)))))
+        level = min(level, len(meta['sizes']) - 1)
+        b_lo, b_hi = lo >> level, min(((hi - 1) >> level) + 1, meta['sizes'][level])
+        offset = int(meta['offsets'][level])
+        rows = np.asarray(levels[offset + b_lo:offset + b_hi])
+        return {
+            'level': level,
+            't': np.asarray(times[offset + b_lo:offset + b_hi]),
+            'min': rows[:, 0],
+            'max': rows[:, 1],
+            'mean': rows[:, 2],
+        }
+
+    def plot(self, column='vstate', nodes=None, t_range=None, width=1000, ax=None):
+        """
+        Min/max envelope and mean of a column for several nodes, at the resolution of the plot.
+        """
+        if ax is None:
+            _, ax = plt.subplots(figsize=(12, 5))
+        for node in (self.experiment.node_ids if nodes is None else nodes):
+            if self.experiment.length(node) == 0:
+                continue
+            view = self.query(node, column, t_range, width)
+            line, = ax.plot(view['t'], view['mean'], linewidth=1.0, label=f'Node {node}')
+            if view['level'] > 0:
+                ax.fill_between(view['t'], view['min'], view['max'], color=line.get_color(), alpha=0.2, linewidth=0)
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel(column)
+        ax.grid(True, linestyle='--', alpha=0.6)
+        return ax
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+
+    sim_name = "30node-clusters"
+    pyramid = TrajectoryPyramid(f"../data/{sim_name}")
+    t0 = time.perf_counter()
+    pyramid.build()
+    print(f"Built pyramids of {len(pyramid.experiment.node_ids)} nodes in {time.perf_counter() - t0:.2f} s")
+    for t_range in (None, (25.0, 35.0), (29.0, 31.0)):
+        view = pyramid.query(1, 'sigma', t_range, width=50)
+        print(f"window {t_range}: level {view['level']}, {len(view['t'])} buckets")
+
+    # Query time against the length of the experiment (synthetic logs of one node)
+    for n in (10_000, 1_000_000, 10_000_000):
+        with tempfile.TemporaryDirectory() as directory:
+            k = np.arange(n)
+            data = {'timestamp': (200 * k).tolist(), 'state': (1e6 * np.sin(k / 1e3)).astype(int).tolist(),
+                    'vstate': np.zeros(n, dtype=int).tolist(), 'vartheta': (k % 1000).tolist()}
+            with open(os.path.join(directory, "1.json"), 'w') as f:
+                json.dump({'params': {'clock': 200, 'dt': 1}, 'data': data}, f)
+            synthetic = TrajectoryPyramid(directory, cache=True)
+            synthetic.build()
+            synthetic.query(1, 'state', width=1000)
+            t0 = time.perf_counter()
+            for _ in range(100):
+                synthetic.query(1, 'state', width=1000)
+                synthetic.query(1, 'state', (n * 0.02, n * 0.02 + 60.0), width=1000)
+            print(f"{n:>10d} samples: {(time.perf_counter() - t0) / 200 * 1e3:.3f} ms per query")
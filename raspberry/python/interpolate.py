@@ -3,7 +3,16 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import os
+import sys
+sys.path.append("../..")
+from disturbance import Disturbance
+from store import STORE_DIR, ResultStore, file_digest, simulation_manifest, simulate_cached
+
 SCALE_FACTOR = 1e6
+INITIAL_CONDITIONS_FILE = "../data/initial_conditions.csv"
+# Sources the generated data depends on (repo-relative, see store.source_digests)
+SIMULATION_CODE = ("raspberry/python/interpolate.py", "disturbance.py")
 
 neighbors = {
     0: [2, 3, 21],       
@@ -40,7 +49,7 @@ neighbors = {
 
 # Load graph-agent data from csv: {x0, z0, id, neighbors, enabled}
 NODES = {}
-_nodes = pd.read_csv("../data/initial_conditions.csv")
+_nodes = pd.read_csv(INITIAL_CONDITIONS_FILE)
 
 num_nodes = 30
 for i in range(num_nodes):
@@ -91,8 +100,8 @@ params = {
 alpha   = 0.0
 beta    = 0.0
 kappa   = 0.0
-phi     = np.random.uniform(0, 1, (n_agents, n_points)) 
-nu = np.random.uniform(-alpha, alpha, (n_agents, n_points)) + beta + kappa * np.sin(2*np.pi*10*(time - phi))  
+nu = Disturbance(n_agents, dt, amplitude=2*alpha, offset=0.5, beta=beta, A=kappa, frequency=10)
+params["disturbance"] = nu
 
 ## Initial conditions:
 init_conditions = {
@@ -275,29 +284,31 @@ def simulate_sampled_dynamics_euler(params, init_conditions, sample_time=0.2):
                 vthetas[:, sample_idx] = vtheta[:, k]
 
         # Euler integration step
-        dydt = dyn2sample(t, y, v, nu[:, k], n_agents, dvthetas, params, sample_points)
+        dydt = dyn2sample(t, y, v, params["disturbance"](k), n_agents, dvthetas, params, sample_points)
         y = y + dt * dydt
         t += dt
 
     return xs, zs, vthetas, dvthetas, sample_points
 
-x, z, vtheta, dvtheta, sample_points = simulate_sampled_dynamics_euler(params, init_conditions)
-t = np.linspace(0, T, sample_points)
-plot_states(t, x, z, vtheta, params, ref_state_num=1)
+# Simulation through the result store: addressed by its manifest (params, initial conditions
+# and the CSV they were read from, disturbance seed, sources), exported to its own directory
+store = ResultStore()
+run = {"code": SIMULATION_CODE, "inputs": {"initial_conditions.csv": file_digest(INITIAL_CONDITIONS_FILE)},
+       "sample_time": 0.2}
+manifest = simulation_manifest(simulate_sampled_dynamics_euler, params, init_conditions, **run)
+results = simulate_cached(store, simulate_sampled_dynamics_euler, params, init_conditions, **run)
+run_dir = store.export_csv(manifest, os.path.join(STORE_DIR, "csv"))
+print(f"Generated data in {run_dir}")
 
-states_file = "../data/30node-clusters/x.csv"
-vstates_file = "../data/30node-clusters/z.csv"
-vartheta_file = "../data/30node-clusters/vartheta.csv"
-np.savetxt(states_file, x.T, delimiter=",", fmt='%f')
-np.savetxt(vstates_file, z.T, delimiter=",", fmt='%f')
-np.savetxt(vartheta_file, vtheta.T, delimiter=",", fmt='%f')
+t = np.linspace(0, T, results["sample_points"])
+plot_states(t, results["x"], results["z"], results["vtheta"], params, ref_state_num=1)
 
 #%% Do the actual interpolation
 NUM_NODE = 21
 
-states_file = "../data/30node-clusters/x.csv"
-vstates_file = "../data/30node-clusters/z.csv"
-vartheta_file = "../data/30node-clusters/vartheta.csv"
+states_file = os.path.join(run_dir, "x.csv")
+vstates_file = os.path.join(run_dir, "z.csv")
+vartheta_file = os.path.join(run_dir, "vtheta.csv")
 
 x = pd.read_csv(states_file, header=None).to_numpy()
 x_gen1 = x[:,NUM_NODE-1]
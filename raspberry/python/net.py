@@ -0,0 +1,6 @@
+# Same constants as raspberry/net.js
+TYPE_BLE = 'ble'
+TYPE_WIFI = 'wifi'
+TYPE_BRIDGE = 'bridge'
+BACKEND_TYPE_PORT = {TYPE_BLE: 3001, TYPE_WIFI: 3002, TYPE_BRIDGE: 3003}
+NODE_TYPE_PORT = {TYPE_BLE: 3001, TYPE_WIFI: 3004, TYPE_BRIDGE: 3005}
@@ -0,0 +1,292 @@
+#%% Batched parameter-sensitivity analysis of eta and the hysteresis thresholds
+import numpy as np
+
+from FTRAC import ConvergenceMonitor, simulate_ensemble
+
+PARAMETERS = ("eta", "epsilon_on", "epsilon_off")
+OUTPUTS = ("convergence_time_epsilon_off", "max_adaptive_gain", "rmse_error_above_epsilon_off",
+           "band_violation")
+
+class NodeMetricsMonitor(ConvergenceMonitor):
+    """
+    Monitor of simulate_ensemble that accumulates, every `every` steps (the sampling of the
+    device logs), the per-node metrics of PostSimulation.numerical_results for every
+    realization:
+    - convergence_time_epsilon_off: first sample with |sigma_i| <= epsilon_off,
+    - rmse_error_above_epsilon_off: RMS of sigma_i over the later samples outside the band,
+    - band_violation: fraction of the later samples outside the band.
+    The peak adaptive gain comes from the 'vtheta_max' result of simulate_ensemble.
+    With early_stop, realizations are retired once ConvergenceMonitor reports convergence
+    (band metrics then cover the samples up to convergence + dwell); otherwise all of them
+    run to the horizon.
+    """
+    def __init__(self, epsilon_off, n_agents, every=200, early_stop=False, **kwargs):
+        epsilon_off = np.asarray(epsilon_off, dtype=np.float64)
+        super().__init__(sigma_band=epsilon_off, every=every, **kwargs)
+        R = epsilon_off.size
+        self.epsilon_off = epsilon_off
+        self.early_stop = early_stop
+        self.alive = np.arange(R)
+        self.entry = np.full((R, n_agents), np.nan)
+        self.samples = np.zeros((R, n_agents))
+        self.violations = np.zeros((R, n_agents))
+        self.squares = np.zeros((R, n_agents))
+
+    def check(self, t, x, z, vtheta):
+        rows = self.alive
+        sigma = np.abs(x - z)
+        inside = sigma <= self.epsilon_off[rows, None]
+        entry = self.entry[rows]
+        entry[inside & np.isnan(entry)] = t
+        self.entry[rows] = entry
+        outside = ~np.isnan(entry) & ~inside
+        self.samples[rows] += ~np.isnan(entry)
+        self.violations[rows] += outside
+        self.squares[rows] += np.where(outside, sigma**2, 0.0)
+        if self.early_stop:
+            return super().check(t, x, z, vtheta)
+        return np.zeros(rows.size, dtype=bool)
+
+    def retire(self, keep):
+        super().retire(keep)
+        self.alive = self.alive[keep]
+        self.sigma_band = self.sigma_band[keep]
+
+    def metrics(self, horizon):
+        """
+        (R, n_agents) arrays of the metrics. Nodes that never enter the band are censored at
+        the horizon (convergence time) and count as always outside it.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rmse = np.where(self.violations > 0, np.sqrt(self.squares / self.violations), 0.0)
+            fraction = np.where(self.samples > 0, self.violations / self.samples, 1.0)
+        return {
+            "convergence_time_epsilon_off": np.where(np.isnan(self.entry), horizon, self.entry),
+            "rmse_error_above_epsilon_off": rmse,
+            "band_violation": fraction,
+        }
+
+def _clip(points):
+    """
+    Design points as simulated: epsilon_off clipped to epsilon_on.
+    """
+    points = np.array(points, dtype=np.float64, ndmin=2)
+    points[:, 2] = np.minimum(points[:, 2], points[:, 1])
+    return points
+
+def evaluate(params, init_conditions, points, sample_time=0.2, early_stop=False, dwell=1.0):
+    """
+    Per-node metrics of every design point, in one batched simulate_ensemble call.
+    Args:
+        params (dict): FTRAC params of the topology (eta/epsilon entries are overridden);
+                       a Disturbance over n_agents is shared by all points (common random
+                       numbers, so differences between points are not disturbance noise).
+        init_conditions (dict): {"x", "z", "vtheta"} of shape (n_agents,), used for every point.
+        points (ndarray): (P, 3) design points, columns PARAMETERS. epsilon_off is clipped to
+                          epsilon_on (the hysteresis collapses to a single threshold).
+    Returns:
+        dict: {output: (P, n_agents)}
+    """
+    points = _clip(points)
+    P = points.shape[0]
+    n_agents = params["n_agents"]
+    eta, epsilon_on, epsilon_off = points.T
+
+    batch = dict(params, eta=eta, epsilon_on=epsilon_on, epsilon_off=epsilon_off, use_laplacian=False)
+    init = {key: np.tile(np.asarray(init_conditions[key], dtype=np.float64), (P, 1)) for key in ("x", "z", "vtheta")}
+    every = max(1, int(round(sample_time / params["dt"])))
+    monitor = NodeMetricsMonitor(epsilon_off, n_agents, every=every, early_stop=early_stop, dwell=dwell)
+
+    results = simulate_ensemble(batch, init, sample_time=sample_time, monitor=monitor)
+    outputs = monitor.metrics(horizon=params["n_points"] * params["dt"])
+    outputs["max_adaptive_gain"] = results["vtheta_max"]
+    return {name: outputs[name] for name in OUTPUTS}
+
+def network_outputs(outputs):
+    """
+    Network-level outputs: slowest node, largest gain, mean band metrics.
+    """
+    return {
+        "convergence_time_epsilon_off": outputs["convergence_time_epsilon_off"].max(axis=1),
+        "max_adaptive_gain": outputs["max_adaptive_gain"].max(axis=1),
+        "rmse_error_above_epsilon_off": outputs["rmse_error_above_epsilon_off"].mean(axis=1),
+        "band_violation": outputs["band_violation"].mean(axis=1),
+    }
+
+def _scale(unit, bounds):
+    bounds = np.asarray(bounds, dtype=np.float64)
+    return bounds[:, 0] + unit * (bounds[:, 1] - bounds[:, 0])
+
+def _indices(estimator, outputs):
+    """
+    {output: {parameter: {index: per-node list, 'network': {index: value}}}} of an estimator
+    mapping (P, ...) outputs to {index: (d, ...)} arrays.
+    """
+    nodes = {name: estimator(values) for name, values in outputs.items()}
+    network = {name: estimator(values) for name, values in network_outputs(outputs).items()}
+    return {
+        name: {
+            parameter: {
+                **{index: np.asarray(value[j]).tolist() for index, value in nodes[name].items()},
+                "network": {index: float(value[j]) for index, value in network[name].items()},
+            }
+            for j, parameter in enumerate(PARAMETERS)
+        }
+        for name in OUTPUTS
+    }
+
+## Finite differences
+def finite_differences(params, init_conditions, base=None, rel_step=0.05, **kwargs):
+    """
+    Central finite-difference derivatives and elasticities (p / y) dy/dp at a base point
+    (default: the params values), from 1 + 2 * d points. Steps are rel_step * |p|, and
+    rel_step itself for a parameter at 0. The stepped points are kept nonnegative and
+    clipped as in evaluate (epsilon_off <= epsilon_on), so the differences become one-sided
+    at these bounds; derivatives divide by the parameter difference actually simulated
+    (NaN where both steps collapse onto the base point).
+    """
+    if base is None:
+        base = [params[name] for name in PARAMETERS]
+    base = np.asarray(base, dtype=np.float64)
+    d = base.size
+    h = np.where(base != 0, rel_step * np.abs(base), rel_step)
+    points = np.tile(base, (1 + 2 * d, 1))
+    points[1 + np.arange(d), np.arange(d)] += h
+    points[1 + d + np.arange(d), np.arange(d)] -= h
+    points = _clip(np.maximum(points, 0.0))
+    step = points[1 + np.arange(d), np.arange(d)] - points[1 + d + np.arange(d), np.arange(d)]
+    outputs = evaluate(params, init_conditions, points, **kwargs)
+
+    def estimator(values):
+        y0 = values[0]
+        shape = (d,) + (1,) * (values.ndim - 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            derivative = np.where(step.reshape(shape) > 0,
+                                  (values[1:1 + d] - values[1 + d:]) / step.reshape(shape), np.nan)
+            elasticity = np.where(y0 != 0, derivative * base.reshape(shape) / y0, 0.0)
+        return {"derivative": derivative, "elasticity": elasticity}
+    return {"method": "finite_differences", "points": points.tolist(), "indices": _indices(estimator, outputs)}
+
+## Morris elementary effects
+def morris_design(bounds, trajectories=10, levels=4, seed=0):
+    """
+    Morris one-at-a-time trajectories on a `levels`-grid of the unit cube, scaled to bounds.
+    Returns:
+        tuple: (points (r * (d + 1), d), unit steps (r, d) signed, parameter order (r, d))
+    """
+    rng = np.random.default_rng(seed)
+    d = len(bounds)
+    delta = levels / (2.0 * (levels - 1))
+    grid = np.arange(levels // 2) / (levels - 1)
+    start = rng.choice(grid, size=(trajectories, d))
+    order = np.argsort(rng.random((trajectories, d)), axis=1)
+    sign = rng.choice([-1.0, 1.0], size=(trajectories, d))
+    # Start from the far end where a step of -delta would leave the cube
+    start = np.where(sign < 0, start + delta, start)
+
+    unit = np.repeat(start[:, None, :], d + 1, axis=1)
+    steps = np.zeros((trajectories, d))
+    for m in range(d):
+        j = order[:, m]
+        steps[np.arange(trajectories), j] = sign[np.arange(trajectories), j] * delta
+        unit[np.arange(trajectories), m + 1:, j] += steps[np.arange(trajectories), j][:, None]
+    return _scale(unit.reshape(-1, d), bounds), steps, order
+
+def morris(params, init_conditions, bounds, trajectories=10, levels=4, seed=0, **kwargs):
+    """
+    Morris screening: mu* (mean |elementary effect|), mu and sigma of the elementary effects,
+    in output units per unit of the normalized parameter range.
+    Args:
+        bounds (list): [(low, high)] of eta, epsilon_on, epsilon_off.
+    """
+    points, steps, order = morris_design(bounds, trajectories, levels, seed)
+    outputs = evaluate(params, init_conditions, points, **kwargs)
+    r, d = steps.shape
+
+    def estimator(values):
+        values = values.reshape((r, d + 1) + values.shape[1:])
+        diffs = np.diff(values, axis=1)                         # (r, d, ...) in trajectory order
+        effects = np.empty_like(diffs)
+        rows = np.arange(r)[:, None]
+        expand = (slice(None), slice(None)) + (None,) * (values.ndim - 2)
+        effects[rows, order] = diffs / steps[rows, order][expand]
+        effects = np.moveaxis(effects, 1, 0)                    # (d, r, ...) by parameter
+        return {"mu_star": np.abs(effects).mean(axis=1), "mu": effects.mean(axis=1),
+                "sigma": effects.std(axis=1, ddof=1) if r > 1 else np.zeros_like(effects[:, 0])}
+    return {"method": "morris", "points": points.tolist(), "indices": _indices(estimator, outputs)}
+
+## Sobol indices (Saltelli design, Jansen estimators)
+def saltelli_design(bounds, n=64, seed=0):
+    """
+    A, B and the d matrices A_B^j (column j of B in A), from a scrambled Sobol sequence.
+    Returns:
+        ndarray: (n * (d + 2), d) points, blocks [A, B, A_B^1, ..., A_B^d].
+    """
+    from scipy.stats import qmc
+    d = len(bounds)
+    base = qmc.Sobol(2 * d, scramble=True, seed=seed).random(n)
+    A, B = base[:, :d], base[:, d:]
+    AB = np.repeat(A[None], d, axis=0)
+    AB[np.arange(d), :, np.arange(d)] = B.T
+    return _scale(np.concatenate([A, B, AB.reshape(-1, d)]), bounds)
+
+def sobol(params, init_conditions, bounds, n=64, seed=0, **kwargs):
+    """
+    First-order (S1) and total (ST) Sobol indices, from n * (d + 2) points.
+    Args:
+        n (int): base samples (a power of 2).
+    """
+    points = saltelli_design(bounds, n, seed)
+    outputs = evaluate(params, init_conditions, points, **kwargs)
+    d = len(bounds)
+
+    def estimator(values):
+        values = values.reshape((d + 2, n) + values.shape[1:])
+        yA, yB, yAB = values[0], values[1], values[2:]
+        variance = np.concatenate([yA, yB]).var(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            S1 = np.where(variance > 0, (yB * (yAB - yA)).mean(axis=1) / variance, 0.0)
+            ST = np.where(variance > 0, 0.5 * ((yA - yAB) ** 2).mean(axis=1) / variance, 0.0)
+        return {"S1": S1, "ST": ST}
+    return {"method": "sobol", "points": points.tolist(), "indices": _indices(estimator, outputs)}
+
+METHODS = {
+    "finite_differences": finite_differences,
+    "morris": morris,
+    "sobol": sobol,
+}
+
+def topology_sensitivity(problems, method="morris", **kwargs):
+    """
+    Sensitivity indices of every topology, one batched simulation per topology.
+    In the FTRAC model the tracking error sigma = x - z obeys dsigma/dt = -vartheta sign(sigma)
+    + nu whatever the graph (the consensus input cancels out), so the indices of different
+    topologies differ through their size, initial conditions and disturbances.
+    Args:
+        problems (dict): {name: (params, init_conditions)} (e.g. benchmark.make_problem).
+    Returns:
+        dict: {name: result of the method}
+    """
+    return {name: METHODS[method](params, init_conditions, **kwargs)
+            for name, (params, init_conditions) in problems.items()}
+
+
+if __name__ == "__main__":
+    import time
+    from benchmark import TOPOLOGIES, make_problem
+
+    bounds = [(0.1, 2.0), (0.02, 0.1), (0.005, 0.02)]
+    problems = {name: make_problem(TOPOLOGIES[name](30), n_points=20000, dt=1e-3, seed=seed)
+                for seed, name in enumerate(("ring", "clusters"))}
+    for method, options in (("finite_differences", {}), ("morris", {"bounds": bounds, "trajectories": 8}),
+                            ("sobol", {"bounds": bounds, "n": 16})):
+        t0 = time.perf_counter()
+        results = topology_sensitivity(problems, method, **options)
+        print(f"\n{method} ({len(results['ring']['points'])} points per topology, "
+              f"{time.perf_counter() - t0:.1f} s)")
+        for name, result in results.items():
+            for output in OUTPUTS:
+                network = {p: result["indices"][output][p]["network"] for p in PARAMETERS}
+                index = next(iter(network["eta"]))
+                print(f"  {name:<9s} {output:<30s} {index}: "
+                      + "  ".join(f"{p} {network[p][index]:+9.3f}" for p in PARAMETERS))
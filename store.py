@@ -0,0 +1,369 @@
+#%% Experiment manifests and content-addressed result store
+import os
+import json
+import hashlib
+import subprocess
+import numpy as np
+
+from topology import to_digraph, graph_hash
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(ROOT, ".results")
+SIMULATION_CODE = ("FTRAC.py", "laws.py", "disturbance.py")
+MANIFEST_DECIMALS = 10  # float arrays of manifests are hashed rounded (e.g. eigensolver noise in params["laplacian"])
+
+def array_digest(array):
+    """
+    sha256 of the dtype, shape and bytes of an array (the address of an array blob).
+    """
+    array = np.ascontiguousarray(array)
+    h = hashlib.sha256(f"{array.dtype.str}:{array.shape};".encode())
+    h.update(array.tobytes())
+    return h.hexdigest()
+
+def canonical(value):
+    """
+    JSON-able canonical form of manifest entries: dict keys as sorted strings, arrays by
+    digest (float arrays rounded to MANIFEST_DECIMALS), objects (disturbances, laws,
+    controllers) by class and public attributes.
+    """
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    if isinstance(value, np.ndarray):
+        if np.issubdtype(value.dtype, np.floating):
+            value = np.round(value, MANIFEST_DECIMALS) + 0.0     # + 0.0: -0.0 --> 0.0
+        return {"ndarray": array_digest(value)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if callable(value) and hasattr(value, "__qualname__"):
+        return {"function": f"{value.__module__}.{value.__qualname__}"}
+    attributes = {k: v for k, v in vars(value).items() if not k.startswith("_")} if hasattr(value, "__dict__") else {}
+    return {"class": f"{type(value).__module__}.{type(value).__qualname__}", **canonical(attributes)}
+
+def manifest_hash(manifest):
+    return hashlib.sha256(json.dumps(canonical(manifest), sort_keys=True).encode()).hexdigest()
+
+def source_digests(paths=SIMULATION_CODE):
+    """
+    {path: sha256} of the source files a result depends on (relative paths from the repo root).
+    """
+    digests = {}
+    for path in paths:
+        with open(os.path.join(ROOT, path), 'rb') as f:
+            digests[path] = hashlib.sha256(f.read()).hexdigest()
+    return digests
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def topology_spec(graph):
+    """
+    Canonical topology: sorted node ids and edges i -> j (i listens to j), and graph_hash.
+    """
+    G = to_digraph(graph)
+    return {
+        "nodes": sorted(G.nodes, key=str),
+        "edges": sorted([u, v] for u, v in G.edges),
+        "hash": graph_hash(G),
+    }
+
+def experiment_digest(directory):
+    """
+    Content digest of the <node>.json logs of an experiment directory, to address analyses
+    of device logs.
+    """
+    h = hashlib.sha256()
+    for name in sorted(f for f in os.listdir(directory) if f.endswith('.json') and f[:-5].isdigit()):
+        h.update(f"{name};".encode())
+        with open(os.path.join(directory, name), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+def file_digest(path):
+    """
+    Content digest of an input file (e.g. a CSV of initial conditions).
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def make_manifest(kind, params=None, topology=None, inputs=None, seed=None, code=SIMULATION_CODE, **options):
+    """
+    Manifest of a simulation or analysis: everything its result depends on.
+    Args:
+        kind (str): simulator or analysis name (e.g. "FTRAC.simulate_sampled_dynamics").
+        params (dict): parameters (arrays and objects are canonicalized, see canonical()).
+        topology: NODES-style dict, {id: [ids]} dict or DiGraph (from params["nodes"] if None).
+        inputs (dict): input arrays (initial conditions) or digests (experiment_digest(),
+                       file_digest()).
+        seed (int): RNG seed (from params["disturbance"] if None).
+        code (tuple): source files the result depends on.
+        options: other arguments of the run (sample_time, thresholds...).
+    """
+    params = params or {}
+    if topology is None and "nodes" in params:
+        topology = params["nodes"]
+    if seed is None and hasattr(params.get("disturbance"), "seed"):
+        seed = params["disturbance"].seed
+    return {
+        "kind": kind,
+        "topology": topology_spec(topology) if topology is not None else None,
+        "params": canonical(params),
+        "inputs": canonical(inputs or {}),
+        "seed": seed,
+        "code": source_digests(code),
+        "options": canonical(options),
+    }
+
+
+class ResultStore:
+    """
+    Local content-addressed store of simulation and analysis results.
+
+    A run is addressed by the hash of its manifest (runs/<hash>.json) and lists its outputs:
+    arrays are stored once as objects/<aa>/<digest>.npy addressed by their content, so
+    identical outputs (and input arrays) of different runs are deduplicated; scalars and small
+    dicts are kept inline. Files are written to a temporary name and renamed, so concurrent
+    writers of the same run or object leave a complete file.
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.runs_dir = os.path.join(root, "runs")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(manifest):
+        return manifest if isinstance(manifest, str) else manifest_hash(manifest)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.npy")
+
+    def _run_path(self, key):
+        return os.path.join(self.runs_dir, f"{key}.json")
+
+    def put_array(self, array):
+        array = np.asarray(array)
+        digest = array_digest(array)
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, path)
+        return digest
+
+    def get_array(self, digest, mmap=True):
+        return np.load(self._object_path(digest), mmap_mode='r' if mmap else None)
+
+    def put(self, manifest, outputs, inputs=None):
+        """
+        Stores the outputs of a run ({name: array or JSON-able value}) and its input arrays.
+        Returns:
+            str: run key.
+        """
+        key = self.key(manifest)
+        record = {
+            "manifest": manifest,
+            "commit": git_commit(),
+            "arrays": {},
+            "values": {},
+            "inputs": {name: self.put_array(value) for name, value in (inputs or {}).items()
+                       if isinstance(value, np.ndarray)},
+        }
+        for name, value in outputs.items():
+            if isinstance(value, np.ndarray) and value.ndim > 0:
+                record["arrays"][name] = self.put_array(value)
+            else:
+                record["values"][name] = canonical(value)
+
+        path = self._run_path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp, path)
+        return key
+
+    def record(self, manifest):
+        path = self._run_path(self.key(manifest))
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def __contains__(self, manifest):
+        return os.path.exists(self._run_path(self.key(manifest)))
+
+    def get(self, manifest, mmap=True):
+        """
+        Outputs of a run (arrays memory-mapped), None if it is not in the store.
+        """
+        record = self.record(manifest)
+        if record is None:
+            return None
+        outputs = {name: self.get_array(digest, mmap) for name, digest in record["arrays"].items()}
+        outputs.update(record["values"])
+        return outputs
+
+    def inputs(self, manifest):
+        record = self.record(manifest)
+        return None if record is None else {name: self.get_array(d) for name, d in record["inputs"].items()}
+
+    def cached(self, manifest, compute, inputs=None):
+        """
+        Outputs of the run from the store, or compute() stored under the manifest.
+        """
+        outputs = self.get(manifest)
+        if outputs is not None:
+            self.hits += 1
+            return outputs
+        self.misses += 1
+        outputs = compute()
+        self.put(manifest, outputs, inputs)
+        return outputs
+
+    def runs(self, kind=None):
+        """
+        [(key, record)] of the stored runs, optionally of one kind.
+        """
+        runs = []
+        for name in sorted(os.listdir(self.runs_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.runs_dir, name), 'r') as f:
+                record = json.load(f)
+            if kind is None or record["manifest"]["kind"] == kind:
+                runs.append((name[:-5], record))
+        return runs
+
+    def export_csv(self, manifest, directory):
+        """
+        Writes the 1D/2D output arrays of a run as <directory>/<key[:12]>/<name>.csv, so runs
+        exported for CSV-based tools do not overwrite each other.
+        Returns:
+            str: the run directory.
+        """
+        key = self.key(manifest)
+        outputs = self.get(manifest)
+        run_dir = os.path.join(directory, key[:12])
+        os.makedirs(run_dir, exist_ok=True)
+        for name, value in outputs.items():
+            if isinstance(value, np.ndarray) and value.ndim in (1, 2):
+                np.savetxt(os.path.join(run_dir, f"{name}.csv"), value.T, delimiter=",", fmt='%f')
+        with open(os.path.join(run_dir, "manifest.json"), 'w') as f:
+            json.dump(self.record(manifest)["manifest"], f, indent=2)
+        return run_dir
+
+    def gc(self):
+        """
+        Removes the objects no run refers to.
+        Returns:
+            int: number of removed objects.
+        """
+        referenced = set()
+        for _, record in self.runs():
+            referenced.update(record["arrays"].values())
+            referenced.update(record["inputs"].values())
+        removed = 0
+        for sub in os.listdir(self.objects_dir):
+            for name in os.listdir(os.path.join(self.objects_dir, sub)):
+                if name.endswith(".npy") and name[:-4] not in referenced:
+                    os.remove(os.path.join(self.objects_dir, sub, name))
+                    removed += 1
+        return removed
+
+    def stats(self):
+        sizes = [os.path.getsize(os.path.join(dirpath, f))
+                 for dirpath, _, files in os.walk(self.objects_dir) for f in files]
+        return {"runs": len(os.listdir(self.runs_dir)), "objects": len(sizes), "bytes": int(sum(sizes))}
+
+
+def simulation_manifest(simulate, params, init_conditions, code=SIMULATION_CODE, inputs=None, **kwargs):
+    """
+    Manifest of simulate(params, init_conditions, **kwargs), as addressed by simulate_cached.
+    Args:
+        inputs (dict): digests of the files the initial conditions were read from.
+    """
+    return make_manifest(f"{simulate.__module__}.{simulate.__name__}", params=params,
+                         inputs={**init_conditions, **(inputs or {})}, code=code, **kwargs)
+
+def simulate_cached(store, simulate, params, init_conditions, outputs=("x", "z", "vtheta", "dvtheta", "sample_points"),
+                    code=SIMULATION_CODE, inputs=None, **kwargs):
+    """
+    Runs simulate(params, init_conditions, **kwargs) through the store: identical simulations
+    (same topology, params, initial conditions and input files, seed, options and simulator
+    sources) are loaded instead of recomputed.
+    Args:
+        outputs (tuple): names of the returned tuple entries (dict results keep their keys).
+        inputs (dict): digests of the files the initial conditions were read from.
+    """
+    # The manifest is taken before the run: simulators update params["active"] in place
+    manifest = simulation_manifest(simulate, params, init_conditions, code=code, inputs=inputs, **kwargs)
+
+    def compute():
+        result = simulate(params, init_conditions, **kwargs)
+        return result if isinstance(result, dict) else dict(zip(outputs, result))
+    return store.cached(manifest, compute, inputs=init_conditions)
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+    import time
+    import tempfile
+    import contextlib
+
+    import FTRAC
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(directory)
+        for attempt in ("first", "repeated"):
+            params = dict(FTRAC.params, active=FTRAC.params["active"].copy())
+            t0 = time.perf_counter()
+            results = simulate_cached(store, FTRAC.simulate_sampled_dynamics, params, FTRAC.init_conditions,
+                                      sample_time=FTRAC.dt)
+            print(f"{attempt} simulation: {time.perf_counter() - t0:.3f} s, {store.hits} hits, "
+                  f"final z spread {np.ptp(results['z'][:, -1]):.4f}")
+
+        # Same simulation under another option value: new run, deduplicated output arrays
+        params = dict(FTRAC.params, active=FTRAC.params["active"].copy())
+        simulate_cached(store, FTRAC.simulate_sampled_dynamics, params, FTRAC.init_conditions,
+                        sample_time=FTRAC.dt, monitor=None)
+        print(f"store: {store.stats()}")
+
+        # Analysis of device logs, addressed by the log contents
+        sys.path.append(os.path.join(ROOT, "raspberry", "python"))
+        from ChatteringAnalysis import ChatteringAnalysis
+        simulation_dir = os.path.join(ROOT, "raspberry", "data", "30node-clusters")
+        manifest = make_manifest("ChatteringAnalysis.network_summary", inputs={"logs": experiment_digest(simulation_dir)},
+                                 code=("raspberry/python/ChatteringAnalysis.py",), epsilon_on=0.050, epsilon_off=0.010)
+
+        def summary():
+            analysis = ChatteringAnalysis(simulation_dir, 30)
+            with contextlib.redirect_stdout(io.StringIO()):
+                analysis.load_data()
+            return analysis.network_summary()
+        for attempt in ("first", "repeated"):
+            t0 = time.perf_counter()
+            row = store.cached(manifest, summary)
+            print(f"{attempt} analysis: {time.perf_counter() - t0:.3f} s, switch rate {row['switch_rate']:.3f}")
+        print(f"exported to {store.export_csv(store.runs('FTRAC.simulate_sampled_dynamics')[0][0], directory)}")
@@ -0,0 +1,284 @@
+#%% Spectral topology analysis and convergence-time prediction
+import os
+import json
+import hashlib
+import warnings
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import scipy.sparse.csgraph as csgraph
+
+DENSE_LIMIT = 500       # eigenvalues by dense solvers up to this many nodes
+DIAMETER_LIMIT = 2000   # exact diameters up to this many nodes (double-sweep estimate above)
+EIGEN_TOL = 1e-4        # relative accuracy of the iterative eigenvalues (estimates beyond it)
+EIGEN_MAXITER = 200     # iteration cap of the iterative eigensolvers, bounds the time per graph
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topology_cache.json")
+
+def to_digraph(graph):
+    """
+    nx.DiGraph with an edge i -> j when node i listens to node j (as G in FTRAC.py), from a
+    NODES-style dict {id: {'neighbors': [ids]}}, a {id: [ids]} dict (interpolate.neighbors) or
+    a DiGraph.
+    """
+    if isinstance(graph, nx.DiGraph):
+        return graph
+    G = nx.DiGraph()
+    for node, props in graph.items():
+        G.add_node(node)
+        for neighbor in (props['neighbors'] if isinstance(props, dict) else props):
+            G.add_edge(node, neighbor)
+    return G
+
+def graph_hash(G):
+    """
+    Hash of the labelled edge set (independent of insertion order).
+    """
+    nodes = sorted(G.nodes, key=str)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = sorted((index[u], index[v]) for u, v in G.edges)
+    h = hashlib.sha1(f"{len(nodes)}:".encode())
+    h.update(np.asarray(edges, dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+def _laplacian(G, nodes):
+    A = nx.to_scipy_sparse_array(G, nodelist=nodes, weight=None, dtype=np.float64, format="csr")
+    # Mirror graph: weights (a_ij + a_ji) / 2, Laplacian (L + L^T) / 2 for balanced digraphs
+    A_sym = (A + A.T) / 2.0
+    A_sym.setdiag(0)
+    A_sym.eliminate_zeros()
+    degree = np.asarray(A_sym.sum(axis=1)).ravel()
+    return sp.diags(degree) - A_sym, A
+
+def _extreme_eigenvalues(L):
+    """
+    (lambda_2, lambda_max) of a symmetric Laplacian, and whether each is exact.
+
+    Above DENSE_LIMIT nodes both come from iterative solvers capped at EIGEN_MAXITER
+    iterations, so that no candidate stalls a sweep: lambda_max by Lanczos (the Gershgorin
+    bound 2 * max degree if it does not converge), lambda_2 (0 on disconnected graphs) by
+    LOBPCG orthogonally to the constant vector (no factorization), exact when its residual bounds the error within
+    EIGEN_TOL, else the current Rayleigh quotient, an upper bound of lambda_2.
+    Returns:
+        tuple: (lambda_2, lambda_max, lambda_2_exact, lambda_max_exact)
+    """
+    n = L.shape[0]
+    if n < 2:
+        return 0.0, 0.0, True, True
+    if n <= DENSE_LIMIT:
+        eigenvalues = np.linalg.eigvalsh(L.toarray())
+        return float(max(eigenvalues[1], 0.0)), float(eigenvalues[-1]), True, True
+
+    degree = L.diagonal()
+    try:
+        lambda_max = float(spla.eigsh(L, k=1, which="LA", tol=EIGEN_TOL, maxiter=EIGEN_MAXITER,
+                                      return_eigenvectors=False)[0])
+        max_exact = True
+    except spla.ArpackNoConvergence:
+        lambda_max, max_exact = float(2.0 * degree.max()), False
+
+    if csgraph.connected_components(L, directed=False)[0] > 1:
+        return 0.0, lambda_max, True, max_exact
+    X = np.random.default_rng(0).standard_normal((n, 4))
+    M = sp.diags(1.0 / np.where(degree > 0, degree, 1.0))
+    with warnings.catch_warnings():
+        # Non-convergence is detected from the residual below
+        warnings.simplefilter("ignore")
+        values, vectors = spla.lobpcg(L, X, M=M, Y=np.ones((n, 1)), tol=1e-10 * lambda_max,
+                                      maxiter=EIGEN_MAXITER, largest=False)
+    i = int(np.argmin(values))
+    v = vectors[:, i] / np.linalg.norm(vectors[:, i])
+    lambda_2 = float(max(values[i], 0.0))
+    residual = np.linalg.norm(L @ v - values[i] * v)    # bounds |values[i] - eigenvalue|
+    return lambda_2, lambda_max, bool(residual <= max(EIGEN_TOL * lambda_2, 1e-10 * lambda_max)), max_exact
+
+def _directed_gap(A):
+    """
+    Smallest real part of the nonzero eigenvalues of the directed Laplacian D_out - A
+    (dense, small graphs only).
+    """
+    n = A.shape[0]
+    if n < 2 or n > DENSE_LIMIT:
+        return None
+    A = A.toarray()
+    eigenvalues = np.linalg.eigvals(np.diag(A.sum(axis=1)) - A)
+    real = np.sort(eigenvalues.real)
+    return float(max(real[1], 0.0))
+
+def _diameter(A, directed):
+    """
+    Diameter (in hops) of a connected graph, from breadth-first searches. Above DIAMETER_LIMIT
+    nodes, a double-sweep estimate (a lower bound, tight on most sparse graphs).
+    Returns:
+        tuple: (diameter, exact)
+    """
+    n = A.shape[0]
+    if n <= DIAMETER_LIMIT:
+        return int(csgraph.shortest_path(A, directed=directed, unweighted=True).max()), True
+    far = int(np.argmax(csgraph.shortest_path(A, directed=directed, unweighted=True, indices=0)))
+    return int(csgraph.shortest_path(A, directed=directed, unweighted=True, indices=far).max()), False
+
+def analyze(graph):
+    """
+    Structural and spectral quantities of a consensus topology.
+    Returns:
+        dict: n_nodes, n_edges, degree stats, SCCs and root components, balance,
+              diameters, lambda_2 / lambda_max of the mirror (undirected) Laplacian (flagged
+              when only estimates, see _extreme_eigenvalues) and the directed spectral gap.
+    """
+    G = to_digraph(graph)
+    nodes = list(G.nodes)
+    L, A = _laplacian(G, nodes)
+    out_degree = np.asarray(A.sum(axis=1)).ravel()      # neighbors listened to
+    in_degree = np.asarray(A.sum(axis=0)).ravel()       # listeners
+
+    n_scc, labels = csgraph.connected_components(A, directed=True, connection="strong")
+    scc_sizes = np.bincount(labels, minlength=n_scc)
+    # Root components listen to nobody outside themselves: consensus needs exactly one
+    u, v = A.nonzero()
+    listens_out = np.zeros(n_scc, dtype=bool)
+    listens_out[labels[u][labels[u] != labels[v]]] = True
+    roots = np.flatnonzero(~listens_out)
+
+    connected = len(nodes) > 0 and csgraph.connected_components(A, directed=True, connection="weak")[0] == 1
+    diameter, diameter_exact = _diameter(A, directed=False) if connected else (None, False)
+    directed_diameter = _diameter(A, directed=True)[0] if n_scc == 1 and len(nodes) <= DIAMETER_LIMIT else None
+
+    lambda_2, lambda_max, lambda_2_exact, lambda_max_exact = _extreme_eigenvalues(L)
+    return {
+        "n_nodes": len(nodes),
+        "n_edges": G.number_of_edges(),
+        "in_degree": {"min": float(in_degree.min()), "max": float(in_degree.max()), "mean": float(in_degree.mean())},
+        "out_degree": {"min": float(out_degree.min()), "max": float(out_degree.max()), "mean": float(out_degree.mean())},
+        "n_scc": int(n_scc),
+        "largest_scc": int(scc_sizes.max()),
+        "strongly_connected": n_scc == 1,
+        "n_root_components": len(roots),
+        "root_size": int(scc_sizes[roots[0]]) if len(roots) == 1 else None,
+        "has_spanning_tree": len(roots) == 1,
+        "balanced": bool(np.array_equal(in_degree, out_degree)),
+        "connected": connected,
+        "diameter": diameter,
+        "diameter_exact": diameter_exact,
+        "directed_diameter": directed_diameter,
+        "lambda_2": lambda_2,
+        "lambda_max": lambda_max,
+        "lambda_2_exact": lambda_2_exact,
+        "lambda_max_exact": lambda_max_exact,
+        "directed_gap": _directed_gap(A),
+    }
+
+def predict_convergence(stats, initial_spread=10.0, tol=0.01):
+    """
+    Predicted convergence times of the virtual states z from the spectral quantities, for an
+    initial spread max z - min z <= initial_spread.
+
+    - sqrt_sign (finite-time law of FTRAC.vi, alpha = 1/2): T <= 2 V0^((1-alpha)/2) / (K (1-alpha)),
+      K = (4 lambda_2)^((1+alpha)/2), V0 = n spread^2 / 2 (Wang & Xiao, undirected/balanced graphs).
+    - laplacian: exponential rate lambda_2 (directed gap for unbalanced graphs),
+      T = ln(sqrt(n) spread / tol) / rate.
+    - averaging: as laplacian, with the rate lambda_2 / max degree.
+    Graphs without a single root component never reach consensus (inf).
+    Returns:
+        dict: {law: predicted time [s]}
+    """
+    if not stats["has_spanning_tree"]:
+        return {"sqrt_sign": np.inf, "laplacian": np.inf, "averaging": np.inf}
+
+    n = stats["n_nodes"]
+    rate = stats["lambda_2"] if stats["balanced"] or stats["directed_gap"] is None else stats["directed_gap"]
+    if rate <= 0:
+        return {"sqrt_sign": np.inf, "laplacian": np.inf, "averaging": np.inf}
+
+    alpha = 0.5
+    V0 = 0.5 * n * initial_spread**2
+    K = (4.0 * rate) ** ((1 + alpha) / 2)
+    settle = np.log(max(np.sqrt(n) * initial_spread / tol, 1.0))
+    return {
+        "sqrt_sign": float(2.0 * V0 ** ((1 - alpha) / 2) / (K * (1 - alpha))),
+        "laplacian": float(settle / rate),
+        "averaging": float(settle * max(stats["out_degree"]["max"], 1.0) / rate),
+    }
+
+
+class TopologyAnalyzer:
+    """
+    analyze() with a persistent JSON cache keyed by graph_hash, to rank or prune large sets
+    of candidate topologies before running any simulation.
+    """
+
+    def __init__(self, cache_file=CACHE_FILE):
+        self.cache_file = cache_file
+        self.cache = {}
+        if cache_file is not None and os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                self.cache = json.load(f)
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self, graph):
+        G = to_digraph(graph)
+        key = graph_hash(G)
+        if key in self.cache:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.cache[key] = analyze(G)
+        return self.cache[key]
+
+    def save(self):
+        if self.cache_file is None:
+            return
+        tmp = self.cache_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.cache, f)
+        os.replace(tmp, self.cache_file)
+
+    def rank(self, candidates, law="sqrt_sign", initial_spread=10.0, tol=0.01, prune=True):
+        """
+        Ranks candidate topologies by predicted convergence time.
+        Args:
+            candidates (dict): {name: graph}
+            prune (bool): drop candidates that cannot reach consensus.
+        Returns:
+            list: [(name, predicted time, stats)] sorted by predicted time.
+        """
+        ranking = []
+        for name, graph in candidates.items():
+            stats = self.stats(graph)
+            predicted = predict_convergence(stats, initial_spread, tol)[law]
+            if prune and not np.isfinite(predicted):
+                continue
+            ranking.append((name, predicted, stats))
+        self.save()
+        return sorted(ranking, key=lambda item: item[1])
+
+
+if __name__ == "__main__":
+    import time
+    import ast
+
+    # 30-node clusters graph of interpolate.py (read from the source: the script runs at import)
+    with open(os.path.join("raspberry", "python", "interpolate.py"), 'r') as f:
+        tree = ast.parse(f.read())
+    clusters = next(ast.literal_eval(stmt.value) for stmt in tree.body
+                    if isinstance(stmt, ast.Assign) and getattr(stmt.targets[0], 'id', None) == 'neighbors')
+
+    candidates = {
+        "clusters-30": clusters,
+        "directed-ring-30": {i: [(i - 2) % 30 + 1] for i in range(1, 31)},
+        "bidirectional-ring-30": {i: [(i - 2) % 30 + 1, i % 30 + 1] for i in range(1, 31)},
+    }
+    rng = np.random.default_rng(42)
+    for c in range(2000):
+        n = int(rng.integers(9, 40))
+        candidates[f"random-{c}"] = {i: [int(j) for j in rng.choice(n, size=2, replace=False)] for i in range(n)}
+
+    analyzer = TopologyAnalyzer()
+    t0 = time.perf_counter()
+    ranking = analyzer.rank(candidates)
+    print(f"Ranked {len(candidates)} candidates in {time.perf_counter() - t0:.2f} s "
+          f"({len(ranking)} kept, {analyzer.hits} cache hits)")
+    for name, predicted, stats in ranking[:5] + [r for r in ranking if not r[0].startswith("random")]:
+        print(f"{name:<24s} T <= {predicted:8.2f} s  lambda_2 = {stats['lambda_2']:.4f}  "
+              f"diameter = {stats['diameter']}  SCCs = {stats['n_scc']}")